@@ -524,7 +524,7 @@ class Backend(models.Model):
             'http_health_check_interval': self.http_health_check_interval,
             'enable_http_keep_alive': self.enable_http_keep_alive,
             'http_keep_alive_timeout': self.http_keep_alive_timeout,
-            'access_controls_list': set(access_controls_list),
+            'access_controls_list': list(dict.fromkeys(access_controls_list)),
             'http_backend_dir': self.http_backend_dir,
             'balancing': self.balancing,
             'workflows': workflow_list,
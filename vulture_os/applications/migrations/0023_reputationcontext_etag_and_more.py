@@ -0,0 +1,28 @@
+# Generated by Django 4.2.9 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('applications', '0022_alter_logomkafka_confparam_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reputationcontext',
+            name='content_hash',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='reputationcontext',
+            name='etag',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='reputationcontext',
+            name='last_modified',
+            field=models.TextField(default=''),
+        ),
+    ]
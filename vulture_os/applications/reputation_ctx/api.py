@@ -47,6 +47,7 @@ from system.exceptions import VultureSystemError
 # Extern modules imports
 from datetime import datetime
 from sys import exc_info
+from time import perf_counter
 from traceback import format_exception
 
 # Logger configuration imports
@@ -54,6 +55,9 @@ import logging
 logging.config.dictConfig(settings.LOG_SETTINGS)
 logger = logging.getLogger('api')
 
+# Maximum number of values accepted by a lookup request
+MAX_LOOKUP_BATCH = 10000
+
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -192,6 +196,74 @@ class ReputationContextAPIv1(View):
             }, status=500)
 
 
+@method_decorator(csrf_exempt, name="dispatch")
+class ReputationContextLookupAPIv1(View):
+    @api_need_key('cluster_api_key')
+    def post(self, request):
+        """ Lookup a batch of IPs into the databases of the selected reputation contexts, written on this node
+        Expected body: {"ips": ["1.2.3.4", ...], "reputation_ctxs": [<id or name>, ...]}
+        """
+        try:
+            ips = request.JSON.get('ips', [])
+            ctx_refs = request.JSON.get('reputation_ctxs', [])
+            if not isinstance(ips, list) or not all(isinstance(ip, str) for ip in ips):
+                return JsonResponse({'error': _("'ips' must be a list of strings")}, status=400)
+            if len(ips) > MAX_LOOKUP_BATCH:
+                return JsonResponse({'error': _("Too many values, maximum is {}").format(MAX_LOOKUP_BATCH)},
+                                    status=400)
+            if not isinstance(ctx_refs, list) or not ctx_refs:
+                return JsonResponse({'error': _("'reputation_ctxs' must be a non-empty list")}, status=400)
+
+            reputation_ctxs = []
+            for ref in ctx_refs:
+                try:
+                    if isinstance(ref, int):
+                        reputation_ctxs.append(ReputationContext.objects.get(pk=ref))
+                    else:
+                        reputation_ctxs.append(ReputationContext.objects.get(name=ref))
+                except ReputationContext.DoesNotExist:
+                    return JsonResponse({'error': _("Reputation context '{}' does not exist").format(ref)},
+                                        status=404)
+
+            data = {ip: {} for ip in ips}
+            metrics = {}
+            start = perf_counter()
+            for reputation_ctx in reputation_ctxs:
+                ctx_start = perf_counter()
+                try:
+                    results = reputation_ctx.lookup(ips)
+                except (FileNotFoundError, ValueError, VultureSystemError) as e:
+                    logger.error("Reputation context lookup: cannot lookup into '{}': {}".format(reputation_ctx.name, e))
+                    return JsonResponse({'error': _("Cannot lookup into reputation context '{}': {}")
+                                        .format(reputation_ctx.name, e)}, status=400)
+                for ip, result in zip(ips, results):
+                    data[ip][reputation_ctx.name] = result
+                metrics[reputation_ctx.name] = {'latency_ms': round((perf_counter() - ctx_start) * 1000, 3)}
+            duration = perf_counter() - start
+
+            nb_lookups = len(ips) * len(reputation_ctxs)
+            return JsonResponse({
+                'data': data,
+                'metrics': {
+                    'lookups': nb_lookups,
+                    'latency_ms': round(duration * 1000, 3),
+                    'lookups_per_second': round(nb_lookups / duration) if duration else nb_lookups,
+                    'reputation_ctxs': metrics
+                }
+            })
+
+        except Exception as e:
+            logger.critical(e, exc_info=1)
+            error = _("An error has occurred")
+
+            if settings.DEV_MODE:
+                error = str(e)
+
+            return JsonResponse({
+                'error': error
+            }, status=500)
+
+
 COMMAND_LIST = {
     'download': reputation_ctx_download,
 }
@@ -31,12 +31,17 @@ from djongo import models
 
 # Django project imports
 from toolkit.network.network import get_proxy
-from toolkit.log.maxminddb import test_mmdb_database, open_mmdb_database
+from toolkit.log.maxminddb import test_mmdb_database, open_mmdb_database, open_mmdb_file, mmdb_readers, ReaderCache
+from toolkit.network.netset import compile_index, load_index
 
 # Extern modules imports
 from gzip import decompress as gzip_decompress
+from hashlib import sha256
 from io import BytesIO
+from os.path import isfile
+from time import monotonic
 import requests
+import zlib
 from requests.auth import HTTPBasicAuth, HTTPDigestAuth
 from re import compile as re_compile
 
@@ -81,8 +86,21 @@ DATABASES_PATH = "/var/db/darwin"
 DATABASES_OWNER = "vlt-os:vlt-conf"
 DATABASES_PERMS = "644"
 
+# Database types compiled into a sorted lookup index, written next to the database
+INDEXED_DB_TYPES = ("ipv4_netset", "ipv6_netset", "domain")
+INDEX_SUFFIX = ".idx"
+MMDB_DB_TYPES = ("ipv4", "ipv6", "GeoIP")
+
+# Per process cache of compiled indexes, reloaded when their file changes on disk
+index_readers = ReaderCache(load_index)
+
 REGEX_GZ = re_compile("filename=\"?([^\";]+)\"?")
 
+# Size of the chunks read from network/disk while streaming databases
+CHUNK_SIZE = 1024 * 1024
+# (connect, read) timeouts of download requests
+DOWNLOAD_TIMEOUT = (2.0, 2.0)
+
 
 class ReputationContext(models.Model):
     """ Model used to enrich logs in Rsyslog with mmdb database"""
@@ -161,6 +179,10 @@ class ReputationContext(models.Model):
     nb_unique = models.IntegerField(default=0)
     internal = models.BooleanField(default=False)
     enable_hour_download = models.BooleanField(default=True)
+    """ HTTP validators & hash of the last downloaded content, used to skip unchanged databases """
+    etag = models.TextField(default="")
+    last_modified = models.TextField(default="")
+    content_hash = models.TextField(default="")
 
     """ Use DjongoManager to use mongo_find() & Co """
     objects = models.DjongoManager()
@@ -181,7 +203,11 @@ class ReputationContext(models.Model):
         """ Delete file on disk on all nodes """
         from system.cluster.models import Cluster
         if delete:
-            Cluster.api_request("system.config.models.delete_conf", self.absolute_filename)
+            if self.db_type in INDEXED_DB_TYPES:
+                Cluster.api_request("system.config.models.delete_conf", [self.absolute_filename,
+                                                                         self.index_filename])
+            else:
+                Cluster.api_request("system.config.models.delete_conf", self.absolute_filename)
         super().delete()
 
     @staticmethod
@@ -240,6 +266,45 @@ class ReputationContext(models.Model):
         """ And returns the attributes of the class """
         return result
 
+    def _send_request(self, headers=None, stream=False, timeout=DOWNLOAD_TIMEOUT, proxies=None):
+        """ Send the configured HTTP request to retrieve the database
+        :param headers: Additional headers to send with the custom ones
+        :param stream: Do not read the body while retrieving the response
+        :param timeout: (connect, read) timeouts of the request
+        :param proxies: Proxies to use, read from system configuration if None
+        :return     The requests Response object
+        """
+        auth = None
+        if self.auth_type:
+            auth_type = AUTH_TYPE_CLASSES.get(self.auth_type)
+            if auth_type:
+                auth = auth_type(self.user, self.password)
+        logger.debug("Try to get URL {}".format(self.url))
+        return requests.request(self.method, self.url,
+                                data=self.post_data if self.method == "POST" else None,
+                                headers={**self.custom_headers, **(headers or {})},
+                                auth=auth,
+                                allow_redirects=True,
+                                proxies=get_proxy() if proxies is None else proxies,
+                                stream=stream,
+                                timeout=timeout)
+
+    def _is_gzip(self, response):
+        """ Detect if the retrieved database is gzipped, and set the filename accordingly
+        :return     True if the content needs to be gunzipped
+        """
+        if self.url[-3:] == ".gz":
+            self.filename = self.url.split('/')[-1][:-3]
+            return True
+        if response.headers.get("Content-Disposition"):
+            match = REGEX_GZ.search(response.headers.get("Content-Disposition"))
+            if match and match[1][-3:] == ".gz":
+                self.filename = match[1][:-3]
+                return True
+        if not self.filename:
+            self.filename = self.url.split('/')[-1]
+        return False
+
     def download_file(self):
         """ """
         """ If we haven't already downloaded url """
@@ -247,41 +312,101 @@ class ReputationContext(models.Model):
             return self.content
 
         """ Retrieve url and content """
-        auth = None
-        if self.auth_type:
-            auth_type = AUTH_TYPE_CLASSES.get(self.auth_type)
-            if auth_type:
-                auth = auth_type(self.user, self.password)
-        logger.debug("Try to get URL {}".format(self.url))
         try:
-            response = requests.request(self.method, self.url,
-                                        data=self.post_data if self.method == "POST" else None,
-                                        headers=self.custom_headers,
-                                        auth=auth,
-                                        allow_redirects=True,
-                                        proxies=get_proxy(),
-                                        timeout=(2.0, 2.0))
+            response = self._send_request()
             # logger.info("URL '{}' retrieved, status code = {}".format(self.url, response.status_code))
             assert response.status_code == 200, "Response code is not 200 ({})".format(response.status_code)
             """ If its a .gz file, dezip-it """
-            if self.url[-3:] == ".gz":
-                self.filename = self.url.split('/')[-1][:-3]
+            if self._is_gzip(response):
                 return gzip_decompress(response.content)
-            if response.headers.get("Content-Disposition"):
-                match = REGEX_GZ.search(response.headers.get("Content-Disposition"))
-                if match and match[1][-3:] == ".gz":
-                    self.filename = match[1][:-3]
-                    return gzip_decompress(response.content)
-            if not self.filename:
-                self.filename = self.url.split('/')[-1]
         except Exception as e:
             raise VultureSystemError(str(e), "download '{}'".format(self.url))
         return response.content
 
+    def local_hash(self):
+        """ Compute the sha256 of the database currently written on disk
+        :return     The hexdigest, or "" if there is no file on disk
+        """
+        if not self.filename or not isfile(self.absolute_filename):
+            return ""
+        file_hash = sha256()
+        with open(self.absolute_filename, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def download_to_file(self, file_path, local_hash="", timeout=DOWNLOAD_TIMEOUT, deadline=None, proxies=None):
+        """ Stream the database into file_path, gunzipping it on the fly if needed
+            If the database on disk is the last one downloaded, a conditional request is sent
+             with the stored ETag/Last-Modified validators
+        :param file_path: Path of the (temporary) file to write the database into
+        :param local_hash: sha256 of the database currently on disk
+        :param timeout: (connect, read) timeouts of the request
+        :param deadline: time.monotonic() value after which the download is aborted
+        :param proxies: Proxies to use, read from system configuration if None
+        :return     True if a new content has been written into file_path, False if the database did not change
+        """
+        headers = {}
+        if local_hash and local_hash == self.content_hash:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+
+        content_hash = sha256()
+        nb_lines = 1
+        try:
+            with self._send_request(headers=headers, stream=True, timeout=timeout, proxies=proxies) as response:
+                if response.status_code == 304:
+                    logger.debug("Reputation context '{}' not modified since last download".format(self.name))
+                    return False
+                assert response.status_code == 200, "Response code is not 200 ({})".format(response.status_code)
+                """ If its a .gz file, dezip-it on the fly """
+                # 16 + MAX_WBITS tells zlib to expect a gzip header and trailer
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if self._is_gzip(response) else None
+                with open(file_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if deadline and monotonic() > deadline:
+                            raise TimeoutError("Download deadline exceeded")
+                        if decompressor:
+                            chunk = decompressor.decompress(chunk)
+                        content_hash.update(chunk)
+                        nb_lines += chunk.count(b"\n")
+                        f.write(chunk)
+                    if decompressor:
+                        chunk = decompressor.flush()
+                        content_hash.update(chunk)
+                        nb_lines += chunk.count(b"\n")
+                        f.write(chunk)
+                etag = response.headers.get("ETag", "")
+                last_modified = response.headers.get("Last-Modified", "")
+        except Exception as e:
+            raise VultureSystemError(str(e), "download '{}'".format(self.url))
+
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash.hexdigest()
+        if self.content_hash == local_hash:
+            logger.debug("Reputation context '{}' content did not change".format(self.name))
+            return False
+
+        if self.db_type in MMDB_DB_TYPES:
+            db_reader = open_mmdb_file(file_path)
+            if not db_reader:
+                raise VultureSystemError("Downloaded content is not a valid MMDB database",
+                                         "download '{}'".format(self.url))
+            # Do not erase nb_netset in internal db, its retrieved in index.json
+            if not self.internal:
+                self.nb_netset = db_reader.metadata().node_count
+            db_reader.close()
+        else:
+            self.nb_unique = nb_lines
+        return True
+
     def download_mmdb(self):
         """ Always call this method first, to be sure the MMDB is OK """
         content = self.download_file()
-        if self.db_type in ("ipv4", "ipv6", "GeoIP"):
+        if self.db_type in MMDB_DB_TYPES:
             try:
                 return open_mmdb_database(content)
             except Exception as e:
@@ -293,17 +418,57 @@ class ReputationContext(models.Model):
 
     def download(self):
         content = self.download_file()
-        if self.db_type in ("ipv4", "ipv6", "GeoIP"):
+        if self.db_type in MMDB_DB_TYPES:
             db_reader = open_mmdb_database(content)
             db_metadata = db_reader.metadata()
             db_reader.close()
             # Do not erase nb_netset in internal db, its retrieved in index.json
             if not self.internal:
                 self.nb_netset = db_metadata.node_count
+        elif self.db_type in INDEXED_DB_TYPES:
+            index = compile_index(self.db_type, BytesIO(content))
+            self.nb_netset = index.nb_entries
+            self.nb_unique = index.nb_unique
         else:
-            self.nb_unique = len(content.decode('utf8').split("\n"))
+            self.nb_unique = content.count(b"\n") + 1
         return content
 
+    def compile_index(self, file_path, index_path):
+        """ Normalise, deduplicate and merge the entries of a netset/domain database written on disk,
+             and write the resulting sorted lookup index
+        :param file_path: Path of the raw database
+        :param index_path: Path of the index file to write
+        :return     The compiled index
+        """
+        with open(file_path, "rb") as f:
+            index = compile_index(self.db_type, f)
+        index.dump(index_path)
+        self.nb_netset = index.nb_entries
+        self.nb_unique = index.nb_unique
+        return index
+
+    def lookup(self, values):
+        """ Lookup values into the database written on disk, using the per process cache of readers
+        :param values: List of IP addresses (or domain names for domain databases)
+        :return     A list of results : the MMDB record (or None) for MMDB databases,
+                     True/False for indexed databases
+        """
+        if self.db_type in MMDB_DB_TYPES:
+            reader = mmdb_readers.get(self.absolute_filename)
+            results = []
+            for value in values:
+                try:
+                    results.append(reader.get(value))
+                except ValueError:
+                    # Not a valid IP address
+                    results.append(None)
+            return results
+        if self.db_type in INDEXED_DB_TYPES:
+            index = index_readers.get(self.index_filename)
+            return [index.lookup(value) for value in values]
+        raise VultureSystemError("Database type '{}' does not support lookups".format(self.db_type),
+                                 "lookup into '{}'".format(self.name))
+
     @property
     def absolute_filename(self):
         """ Return filename depending on current frontend object
@@ -311,6 +476,11 @@ class ReputationContext(models.Model):
         # Escape quotes to prevent injections in config or in commands
         return "{}/{}".format(DATABASES_PATH, self.filename.replace('"', '\"'))
 
+    @property
+    def index_filename(self):
+        """ Return the filename of the compiled lookup index of the database """
+        return self.absolute_filename + INDEX_SUFFIX
+
     def save_conf(self):
         """ Write configuration on disk
         """
@@ -333,26 +503,22 @@ class ReputationContext(models.Model):
         :return     The list of concerned nodes  
         """
         from services.frontend.models import Listener
-        from system.cluster.models import Cluster, NetworkAddress, Node
+        from system.cluster.models import Node
         res = []
-        updated_nodes = set()
         # Loop on Nodes
         for node in Node.objects.all():
-            frontends = []
-            # Get listeners enabled on this node, using the current reputation context
-            for listener in Listener.objects.filter(frontend__enabled=True,
-                                                    frontend__reputation_ctxs=self.id,
-                                                    network_address__nic__node=node.id).distinct():
-                if listener.frontend.id not in frontends:
-                    updated_nodes.add(node)
-                    api_res = node.api_request("services.rsyslogd.rsyslog.build_conf", listener.frontend.id)
-                    if not api_res:
-                        raise ServiceConfigError("on node '{}' \n API request error.".format(node.name), "rsyslog",
-                                                 traceback=api_res.get('message'))
-                    frontends.append(listener.frontend.id)
-                    res.append(node)
-
-        for node in updated_nodes:
-            api_res = node.api_request("services.rsyslogd.rsyslog.restart_service")
+            # Get frontends listening on this node, using the current reputation context
+            frontend_ids = sorted(set(Listener.objects.filter(frontend__enabled=True,
+                                                              frontend__reputation_ctxs=self.id,
+                                                              network_address__nic__node=node.id)
+                                             .values_list('frontend_id', flat=True)))
+            if not frontend_ids:
+                continue
+            # One request per node, which restarts Rsyslog only if a conf changed
+            api_res = node.api_request("services.rsyslogd.rsyslog.build_confs", frontend_ids)
+            if not api_res.get('status'):
+                raise ServiceConfigError("on node '{}' \n API request error.".format(node.name), "rsyslog",
+                                         traceback=api_res.get('message'))
+            res.append(node)
 
         return res
@@ -53,6 +53,10 @@ urlpatterns = [
          api.ReputationContextAPIv1.as_view(),
          name="applications.reputation_ctx.api"),
 
+    path('api/v1/apps/reputation_ctx/lookup/',
+         api.ReputationContextLookupAPIv1.as_view(),
+         name="applications.reputation_ctx.api.lookup"),
+
     path('api/v1/apps/reputation_ctx/<int:object_id>/',
          api.ReputationContextAPIv1.as_view(),
          name="applications.reputation_ctx.api"),
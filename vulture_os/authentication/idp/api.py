@@ -40,6 +40,7 @@ from authentication.user_portal.models import UserAuthentication
 from authentication.totp_profiles.models import TOTPProfile
 from authentication.ldap.tools import NotUniqueError, UserDoesntExistError, GroupDoesntExistError
 from authentication.idp.attr_tools import MAPPING_ATTRIBUTES
+from portal.system.jwt_tokens import set_subject_denied
 from portal.system.redis_sessions import REDISOauth2Session, REDISBase
 from toolkit.portal.registration import perform_email_registration, perform_email_reset
 from toolkit.network.smtp import test_smtp_server
@@ -360,6 +361,12 @@ class IDPApiUserView(View):
                                 else:
                                     logger.warning(f"IDPApiUserView::POST::[{portal.name}/{ldap_repo}] could not enable token for user {user_dn} !")
 
+                    # Signed access tokens are not stored in Redis, deny them instead
+                    if portal.oauth_token_format == "jwt":
+                        nb_tokens = set_subject_denied(redis_handler, portal, user_dn, to_lock)
+                        logger.info(f"IDPApiUserView::POST::[{portal.name}/{ldap_repo}] {nb_tokens} signed token(s) "
+                                    f"{'disabled' if to_lock else 'enabled'} for user {user_dn}")
+
                 else:
                     logger.error(f"IDPApiUserView::POST:[{portal.name}/{ldap_repo}] Cannot lock user '{user_dn}': no locking filter configured")
                     return JsonResponse({
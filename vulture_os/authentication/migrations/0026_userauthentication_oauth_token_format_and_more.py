@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:12
+
+import django.core.validators
+import djongo.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0025_alter_openidrepository_authorization_endpoint_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userauthentication',
+            name='oauth_token_format',
+            field=models.TextField(choices=[('opaque', 'Opaque (stored in Redis)'), ('jwt', 'Signed JWT (verified locally)')], default='opaque', help_text='Signed JWT access tokens are verified without any Redis lookup', verbose_name='OAuth2 access tokens format'),
+        ),
+        migrations.AddField(
+            model_name='userauthentication',
+            name='oauth_jwt_key_rotation',
+            field=models.PositiveIntegerField(default=86400, help_text='Time in seconds after which a new key is used to sign access tokens', validators=[django.core.validators.MinValueValidator(3600)], verbose_name='JWT signing key rotation'),
+        ),
+        migrations.AddField(
+            model_name='userauthentication',
+            name='oauth_jwt_keys',
+            field=djongo.models.fields.JSONField(default=list, help_text='Signing keys of JWT access tokens, from the oldest to the current one'),
+        ),
+    ]
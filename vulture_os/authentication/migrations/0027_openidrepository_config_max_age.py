@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0026_userauthentication_oauth_token_format_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='openidrepository',
+            name='config_max_age',
+            field=models.PositiveIntegerField(default=3600, help_text='Lifetime in seconds of the provider configuration, given by its Cache-Control header'),
+        ),
+    ]
@@ -27,6 +27,7 @@ from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 from django.forms.models import model_to_dict
+from django.db import connection
 from django.utils import timezone
 from djongo import models
 
@@ -40,12 +41,14 @@ from toolkit.auth.vulturemail_client import VultureMailClient
 from toolkit.auth.totp_client import TOTPClient
 from toolkit.system.hashes import random_sha1
 from toolkit.network.network import get_proxy
+from toolkit.http.utils import get_cache_max_age
 
 # Extern modules imports
 from cryptography import x509
 from cryptography.hazmat.primitives import serialization
 from datetime import timedelta
 from requests_oauthlib import OAuth2Session
+from threading import Lock, Thread
 import requests
 
 # Required exceptions imports
@@ -57,6 +60,17 @@ logger = logging.getLogger('gui')
 
 
 CONFIG_RELOAD_INTERVAL = 1 # hour
+# Bounds of the lifetime announced by providers, in seconds
+CONFIG_MIN_MAX_AGE = 300
+CONFIG_MAX_MAX_AGE = 86400
+# Expired configurations are still used while refreshed in the background, during this number of seconds
+CONFIG_STALE_GRACE = 86400
+CONFIG_FIELDS = ['issuer', 'authorization_endpoint', 'token_endpoint', 'userinfo_endpoint', 'end_session_endpoint',
+                 'last_config_time', 'config_max_age']
+
+# Ids of the repositories whose configuration is being refreshed by this process
+_refreshing = set()
+_refreshing_lock = Lock()
 
 PROVIDERS_TYPE = (
     ('google', 'Google'),
@@ -159,6 +173,10 @@ class OpenIDRepository(BaseRepository):
     last_config_time = models.DateTimeField(
         null=True
     )
+    config_max_age = models.PositiveIntegerField(
+        default=CONFIG_RELOAD_INTERVAL * 3600,
+        help_text=_("Lifetime in seconds of the provider configuration, given by its Cache-Control header")
+    )
     id_alea = models.TextField(
         default=random_sha1
     )
@@ -307,7 +325,10 @@ class OpenIDRepository(BaseRepository):
             raise NotImplemented("OTP client type not implemented yet")
 
     @staticmethod
-    def retrieve_config(provider_url, use_proxy=True, verify_certificate=True):
+    def fetch_config(provider_url, use_proxy=True, verify_certificate=True):
+        """ Retrieve the discovery document of a provider
+        :return     The configuration, and its lifetime in seconds
+        """
         logger.info(f"retrieving openid configuration for provider {provider_url}")
 
         r = requests.get("{}/.well-known/openid-configuration".format(provider_url),
@@ -316,21 +337,58 @@ class OpenIDRepository(BaseRepository):
         r.raise_for_status()
         config = r.json()
         logger.info(config)
-        return config
+        max_age = get_cache_max_age(r, CONFIG_RELOAD_INTERVAL * 3600)
+        return config, min(max(max_age, CONFIG_MIN_MAX_AGE), CONFIG_MAX_MAX_AGE)
+
+    @staticmethod
+    def retrieve_config(provider_url, use_proxy=True, verify_certificate=True):
+        return OpenIDRepository.fetch_config(provider_url, use_proxy, verify_certificate)[0]
+
+    def refresh_config(self):
+        """ Retrieve the provider configuration and save it """
+        config, max_age = OpenIDRepository.fetch_config(self.provider_url, self.use_proxy, self.verify_certificate)
+        self.issuer = config['issuer']
+        self.authorization_endpoint = config['authorization_endpoint']
+        self.token_endpoint = config['token_endpoint']
+        self.userinfo_endpoint = config['userinfo_endpoint']
+        self.end_session_endpoint = config.get('end_session_endpoint') or config['revocation_endpoint']
+        self.last_config_time = timezone.now()
+        self.config_max_age = max_age
+        self.save(update_fields=CONFIG_FIELDS)
+
+    @staticmethod
+    def _refresh_config_task(repo_id):
+        try:
+            OpenIDRepository.objects.get(pk=repo_id).refresh_config()
+        except Exception as e:
+            logger.error(f"OpenIDRepository::refresh_config: Failed to refresh configuration of repository {repo_id}: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(repo_id)
+            # The thread's database connection would never be reused
+            connection.close()
+
+    def refresh_config_in_background(self):
+        """ Refresh the provider configuration in a thread, at most once at a time per repository """
+        with _refreshing_lock:
+            if self.pk in _refreshing:
+                return
+            _refreshing.add(self.pk)
+        Thread(target=OpenIDRepository._refresh_config_task, args=(self.pk,), daemon=True).start()
 
     def openid_save(self, force=True):
         # TODO : Handle CA_BUNDLE
-        # If loaded data is too old, reload it again
-        refresh_time = timezone.now() - timedelta(hours=CONFIG_RELOAD_INTERVAL)
-        if (self.last_config_time is None or self.last_config_time < refresh_time):
-            config = OpenIDRepository.retrieve_config(self.provider_url, self.use_proxy, self.verify_certificate)
-            self.issuer = config['issuer']
-            self.authorization_endpoint = config['authorization_endpoint']
-            self.token_endpoint = config['token_endpoint']
-            self.userinfo_endpoint = config['userinfo_endpoint']
-            self.end_session_endpoint = config.get('end_session_endpoint') or config['revocation_endpoint']
-            self.last_config_time = timezone.now()
-            self.save()
+        # If loaded data is expired, reload it again
+        #  the expired data is kept while refreshed in the background, unless it is too old
+        if self.last_config_time is not None:
+            expiration = self.last_config_time + timedelta(seconds=self.config_max_age)
+            now = timezone.now()
+            if now < expiration:
+                return
+            if now < expiration + timedelta(seconds=CONFIG_STALE_GRACE):
+                self.refresh_config_in_background()
+                return
+        self.refresh_config()
 
     def get_oauth2_session(self, redirect_uri):
         session = OAuth2Session(self.client_id, redirect_uri=redirect_uri, scope=self.scopes)
@@ -36,7 +36,8 @@ from authentication.ldap.models import LDAPRepository
 from authentication.otp.models import OTPRepository
 from authentication.openid.models import OpenIDRepository
 from authentication.user_portal.models import (AUTH_TYPE_CHOICES, SSO_TYPE_CHOICES, SSO_BASIC_MODE_CHOICES,
-                                               SSO_CONTENT_TYPE_CHOICES, UserAuthentication)
+                                               SSO_CONTENT_TYPE_CHOICES, OAUTH_TOKEN_FORMAT_CHOICES,
+                                               UserAuthentication)
 from authentication.user_scope.models import UserScope
 from gui.forms.form_utils import NoValidationField
 from system.pki.models import PROTOCOL_CHOICES as TLS_PROTOCOL_CHOICES, X509Certificate
@@ -96,7 +97,8 @@ class UserAuthenticationForm(ModelForm):
                   'disconnect_url', 'enable_disconnect_message', 'enable_disconnect_portal', 'enable_registration',
                   'group_registration', 'update_group_registration', 'enable_external', 'external_fqdn',
                   'external_listener', 'enable_oauth', 'oauth_client_id', 'oauth_client_secret', 'oauth_redirect_uris',
-                  'oauth_timeout', 'enable_refresh', 'enable_rotation', 'max_nb_refresh', 'enable_sso_forward',
+                  'oauth_timeout', 'oauth_token_format', 'oauth_jwt_key_rotation', 'enable_refresh', 'enable_rotation',
+                  'max_nb_refresh', 'enable_sso_forward',
                   'sso_forward_type','sso_forward_timeout','sso_forward_direct_post','sso_forward_get_method',
                   'sso_forward_follow_redirect_before','sso_forward_follow_redirect','sso_forward_return_post',
                   'sso_forward_content_type','sso_forward_url','sso_forward_user_agent','sso_forward_content',
@@ -133,6 +135,8 @@ class UserAuthenticationForm(ModelForm):
             'oauth_client_secret': TextInput(attrs={'readonly': ''}),
             'oauth_redirect_uris': Textarea(attrs={'class': 'form-control'}),
             'oauth_timeout': NumberInput(attrs={'class': 'form-control'}),
+            'oauth_token_format': Select(choices=OAUTH_TOKEN_FORMAT_CHOICES, attrs={'class': 'form-control select2'}),
+            'oauth_jwt_key_rotation': NumberInput(attrs={'class': 'form-control'}),
             'enable_refresh': CheckboxInput(attrs={'class': 'form-control js-switch'}),
             'enable_rotation': CheckboxInput(attrs={'class': 'form-control js-switch'}),
             'max_nb_refresh': NumberInput(attrs={'class': 'form-control'}),
@@ -170,7 +174,8 @@ class UserAuthenticationForm(ModelForm):
         self.fields['otp_repository'].empty_label = "No double authentication"
         # Set fields as non required in POST data
         for field in ["portal_template", "otp_repository", "otp_max_retry", "group_registration", "user_scope",
-                      "update_group_registration", "max_nb_refresh", "sso_forward_direct_post", "sso_forward_get_method",
+                      "update_group_registration", "oauth_token_format", "oauth_jwt_key_rotation", "max_nb_refresh",
+                      "sso_forward_direct_post", "sso_forward_get_method",
                       "sso_forward_follow_redirect_before", "sso_forward_follow_redirect", "sso_forward_return_post",
                       "sso_forward_enable_capture", "sso_forward_enable_replace", "sso_forward_enable_additionnal",
                       "sso_forward_type", "sso_forward_timeout", "sso_forward_content_type", "sso_forward_tls_proto", "sso_forward_url",
@@ -52,6 +52,8 @@ from system.cluster.models import Cluster
 # Extern modules imports
 from bson import ObjectId
 from jinja2 import Environment, FileSystemLoader
+from secrets import token_hex, token_urlsafe
+import time
 
 # Required exceptions imports
 from jinja2.exceptions import (TemplateAssertionError, TemplateNotFound, TemplatesNotFound, TemplateRuntimeError,
@@ -90,6 +92,12 @@ SSO_CONTENT_TYPE_CHOICES = (
 )
 
 
+OAUTH_TOKEN_FORMAT_CHOICES = (
+    ('opaque', "Opaque (stored in Redis)"),
+    ('jwt', "Signed JWT (verified locally)")
+)
+
+
 def get_random_cookie_name():
     return get_random_string(8, 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
 
@@ -310,6 +318,22 @@ class UserAuthentication(models.Model):
         verbose_name=_("OAuth2 tokens timeout"),
         help_text=_("Time in seconds after which oauth2 tokens will expire")
     )
+    oauth_token_format = models.TextField(
+        default=OAUTH_TOKEN_FORMAT_CHOICES[0][0],
+        choices=OAUTH_TOKEN_FORMAT_CHOICES,
+        verbose_name=_("OAuth2 access tokens format"),
+        help_text=_("Signed JWT access tokens are verified without any Redis lookup")
+    )
+    oauth_jwt_key_rotation = models.PositiveIntegerField(
+        default=86400,
+        validators=[MinValueValidator(3600)],
+        verbose_name=_("JWT signing key rotation"),
+        help_text=_("Time in seconds after which a new key is used to sign access tokens")
+    )
+    oauth_jwt_keys = models.JSONField(
+        default=list,
+        help_text=_("Signing keys of JWT access tokens, from the oldest to the current one")
+    )
     enable_refresh = models.BooleanField(
         default=False,
         verbose_name=_("Enable OAuth2 refresh token"),
@@ -437,8 +461,27 @@ class UserAuthentication(models.Model):
             self.auth_cookie_name = get_random_cookie_name()
         if not self.enable_external:
             self.auth_cookie_name = ""
+        if self.oauth_token_format == "jwt" and not self.oauth_jwt_keys:
+            self.rotate_jwt_keys()
         super(UserAuthentication, self).save(*args, **kwargs)
 
+    def rotate_jwt_keys(self, force=False):
+        """ Add a new JWT signing key if the current one is older than oauth_jwt_key_rotation,
+             and remove the keys that cannot have signed a still valid access token
+        A key signs tokens until its successor is created, so it is removed once its successor
+         is older than oauth_timeout. The last key is never removed
+        :return     True if the keys have been modified, False otherwise
+        """
+        now = int(time.time())
+        keys = list(self.oauth_jwt_keys)
+        if force or not keys or keys[-1]['created'] <= now - self.oauth_jwt_key_rotation:
+            keys.append({'kid': token_hex(8), 'key': token_urlsafe(64), 'created': now})
+        keys = [key for key, successor in zip(keys, keys[1:])
+                if successor['created'] > now - self.oauth_timeout] + keys[-1:]
+        modified = keys != self.oauth_jwt_keys
+        self.oauth_jwt_keys = keys
+        return modified
+
     @staticmethod
     def str_attrs():
         """ List of attributes required by __str__ method """
@@ -467,6 +510,8 @@ class UserAuthentication(models.Model):
 
     def to_dict(self, fields=None):
         data = model_to_dict(self, fields=fields)
+        # Never expose the signing keys of access tokens
+        data.pop('oauth_jwt_keys', None)
         if not fields or "id" in fields:
             data['id'] = str(self.pk)
         if not fields or "repositories" in fields:
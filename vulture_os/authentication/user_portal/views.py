@@ -36,6 +36,7 @@ from authentication.openid.models import OpenIDRepository
 from authentication.user_portal.form import UserAuthenticationForm
 from authentication.user_portal.models import UserAuthentication
 from portal.system.sso_clients import SSOClient
+from services.frontend.models import Frontend
 from system.cluster.models  import Cluster
 from system.pki.models import X509Certificate, PROTOCOLS_TO_INT
 from toolkit.api.responses import build_response
@@ -132,12 +133,16 @@ def user_authentication_edit(request, object_id=None, api=False):
             external_listener_changed = "external_listener" in form.changed_data and profile and profile.enable_external
             # Save the form to get an id if there is not already one
             profile = form.save(commit=False)
-            profile.save()
+            if profile.pk and profile.oauth_jwt_keys:
+                # JWT signing keys are rotated by the crontab, do not overwrite them with the ones loaded by the form
+                profile.save(update_fields=[field.name for field in profile._meta.concrete_fields
+                                            if not field.primary_key and field.name != "oauth_jwt_keys"])
+            else:
+                profile.save()
 
             try:
                 if (repo_changed or disconnect_url_changed or timeout_changed) and profile.workflow_set.count() > 0:
-                    for workflow in profile.workflow_set.all():
-                        nodes = workflow.frontend.reload_conf()
+                    Frontend.reload_confs(set(workflow.frontend for workflow in profile.workflow_set.all()))
 
                 if profile.enable_external:
                     # Automatically create OpenID repo
@@ -29,8 +29,9 @@ from django.conf import settings
 from djongo import models
 from django.template.loader import render_to_string
 
-from services.haproxy.haproxy import TEST_CONF_PATH
-from services.haproxy.haproxy import test_haproxy_conf
+from services.haproxy.haproxy import HAPROXY_PATH, TEST_CONF_PATH
+from services.haproxy.haproxy import format_pattern_file, test_haproxy_conf
+from services.exceptions import ServiceTestConfigError
 
 from bson import ObjectId
 from hashlib import sha1
@@ -118,6 +119,10 @@ OPERATOR_CHOICES = [
 JINJA_PATH = "/home/vlt-os/vulture_os/darwin/access_control/config"
 JINJA_TEST_TEMPLATE = "haproxy_test.conf"
 
+# Large pattern sets are written in HAProxy pattern files, updated at runtime without reload
+ACL_FILES_PATH = HAPROXY_PATH
+ACL_FILE_MIN_PATTERNS = 10
+
 
 class AccessControl(models.Model):
     _id = models.ObjectIdField(default=ObjectId)
@@ -166,6 +171,12 @@ class AccessControl(models.Model):
         """ No need to do API request cause Backends are not relative-to-node objects """
         test_filename = self.get_test_filename()
         conf = self.generate_test_conf()
+        for filename, patterns in self.get_pattern_files(TEST_CONF_PATH).items():
+            try:
+                with open(filename, "w") as f:
+                    f.write(format_pattern_file(patterns))
+            except OSError as e:
+                raise ServiceTestConfigError("Cannot write pattern file {} : {}".format(filename, str(e)), "haproxy")
         # NO Node-specific configuration, we can test-it on local node
         # Backends can not be used, so do not handle the HAProxy "not used" error by setting disabled=True
         test_haproxy_conf(test_filename, conf, disabled=True)
@@ -183,7 +194,7 @@ class AccessControl(models.Model):
         if len(self.rules) <= 0:
             return ""
 
-        rules, tmp_conditions = self.generate_rules()
+        rules, tmp_conditions = self.generate_rules(TEST_CONF_PATH)
 
         conditions = []
         for tmp in tmp_conditions:
@@ -196,7 +207,23 @@ class AccessControl(models.Model):
         })
         return template
 
-    def generate_rules(self):
+    def generate_rules(self, pattern_files_path=None):
+        """ Generate the acl lines of the rules, and the acl names of each OR block
+        :param pattern_files_path: If given, single-line OR blocks sharing the same matcher are merged in one acl,
+                                   reading its patterns from a file of this directory (see get_pattern_files),
+                                   as soon as there are at least ACL_FILE_MIN_PATTERNS of them
+        :return     The acl lines as string, and the list of acl names of each OR block
+        """
+        acls, acls_name, _ = self._compile_rules(pattern_files_path)
+        return acls, acls_name
+
+    def get_pattern_files(self, pattern_files_path=ACL_FILES_PATH):
+        """ Return the pattern files referenced by generate_rules(pattern_files_path)
+        :return     Dict {filename: list of patterns}
+        """
+        return self._compile_rules(pattern_files_path)[2]
+
+    def _compile_rules(self, pattern_files_path):
 
         def make_criterion(criterion, name):
             """
@@ -211,42 +238,75 @@ class AccessControl(models.Model):
                     return "{}({})".format(criterion, name)
             return "" + criterion
 
+        def make_matcher(line):
+            """ Return the acl line without its name and pattern """
+            acl = "{}".format(make_criterion(line['criterion'], line.get('criterion_name')))
+            tmp_lst = [line.get('converter', ''),
+                       line.get('flags', ''),
+                       line.get('operator', '')]
+            # Add -m option if a converter is used
+            if line.get('converter', '') != "":
+                acl += " -m"
+            return acl + ''.join(" " + elem if (elem != "") else "" for elem in tmp_lst)
+
+        def file_matcher(rule):
+            """ Return the matcher of an OR block whose pattern can be moved in a file, None otherwise """
+            if not pattern_files_path or len(rule['lines']) != 1 or rule['lines'][0].get('operator', ''):
+                return None
+            pattern = rule['lines'][0].get('pattern', '')
+            # Pattern files strip spaces, and ignore empty and comment lines
+            if not pattern or pattern != pattern.strip() or pattern.startswith("#"):
+                return None
+            # Quotes and backslashes are interpreted by the config parser, but read literally from pattern files
+            if any(char in pattern for char in ('"', "'", "\\")):
+                return None
+            return make_matcher(rule['lines'][0])
+
+        patterns_by_matcher = {}
+        for rule in self.rules:
+            matcher = file_matcher(rule)
+            if matcher:
+                patterns_by_matcher.setdefault(matcher, {})[rule['lines'][0]['pattern']] = None
+
         # Initialization
         acls = []
         acls_name = []
+        pattern_files = {}
         # For each OR block
 
-        for i, rule in enumerate(self.rules):
-            tmp_names = []
-            for j, line in enumerate(rule['lines']):
-
-                acl = "{}".format(make_criterion(line['criterion'], line.get('criterion_name')))
-
-                pattern = line.get('pattern', '')
-                # ensure quoting in haproxy conf when pattern contains spaces
-                if " " in pattern:
-                    pattern = '"' + pattern + '"'
-
-                tmp_lst = [line.get('converter', ''),
-                           line.get('operator', ''),
-                           pattern]
-                # Add -m option if a converter is used
-                if line.get('converter', '') != "":
-                    acl += " -m"
-
-                tmp_lst.insert(1, line.get('flags', ''))
-                acl += ''.join(" " + elem if (elem != "") else "" for elem in tmp_lst)
+        for rule in self.rules:
+            matcher = file_matcher(rule)
+            if matcher and len(patterns_by_matcher[matcher]) >= ACL_FILE_MIN_PATTERNS:
+                # The filename, and so the acl, does not depend on the patterns :
+                #  the conf does not change when they do
+                filename = "{}/acl_{}_{}.lst".format(pattern_files_path, self.name,
+                                                     sha1(matcher.encode('utf-8')).hexdigest()[:16])
+                # The other OR blocks of this matcher are merged into the first one
+                if filename in pattern_files:
+                    continue
+                pattern_files[filename] = list(patterns_by_matcher[matcher])
+                acl_lines = [f"{matcher} -f {filename}"]
+            else:
+                acl_lines = []
+                for line in rule['lines']:
+                    pattern = line.get('pattern', '')
+                    # ensure quoting in haproxy conf when pattern contains spaces
+                    if " " in pattern:
+                        pattern = '"' + pattern + '"'
+                    acl_lines.append(make_matcher(line) + (" " + pattern if pattern != "" else ""))
 
+            tmp_names = []
+            for acl in acl_lines:
                 acl_hash = sha1(acl.encode('utf-8')).hexdigest()
                 acl_name = f"{self.name}_{acl_hash}"
                 tmp_names.append(acl_name)
 
                 acl = f"acl {acl_name} {acl}"
-                if j > 0 or i > 0:
+                if acls:
                     acl = f"    {acl}"
 
                 acls.append(acl)
 
             acls_name.append(tmp_names)
 
-        return "\n".join(acls), acls_name
+        return "\n".join(acls), acls_name, pattern_files
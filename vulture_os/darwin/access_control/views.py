@@ -147,12 +147,11 @@ def access_control_edit(request, object_id=None, api=None):
 
                 ac.save()
 
-                nodes = set()
+                workflows_by_node = {}
                 reload_all = False
                 for workflow in Workflow.objects.filter(workflowacl__access_control=ac, workflowacl__before_policy=True).distinct():
                     for node in workflow.frontend.get_nodes():
-                        node.api_request("workflow.workflow.build_conf", workflow.pk)
-                        nodes.add(node)
+                        workflows_by_node.setdefault(node, []).append(workflow.pk)
 
                 for backend in Backend.objects.filter(
                     workflow__workflowacl__access_control=ac,
@@ -163,17 +162,22 @@ def access_control_edit(request, object_id=None, api=None):
                     # In case some backends own ACLs, every haproxy will have to be reloaded
                     reload_all = True
 
+                for node, workflow_ids in workflows_by_node.items():
+                    if reload_all:
+                        for workflow_id in workflow_ids:
+                            node.api_request("workflow.workflow.build_conf", workflow_id)
+                    else:
+                        # Only reloads HAProxy if needed, patterns changes are applied through the runtime API
+                        api_res = node.api_request("workflow.workflow.update_acl_conf", workflow_ids)
+                        if not api_res.get('status'):
+                            logger.error("Access_Control::edit: API error while trying to "
+                                        "update workflows ACLs : {}".format(api_res.get('message')))
+
                 if reload_all:
                     api_res = Cluster.api_request("services.haproxy.haproxy.reload_service")
                     if not api_res.get('status'):
                         logger.error("Access_Control::edit: API error while trying to "
                                 "restart HAProxy service : {}".format(api_res.get('message')))
-                else:
-                    for node in nodes:
-                        api_res = node.api_request("services.haproxy.haproxy.reload_service")
-                        if not api_res.get('status'):
-                            logger.error("Access_Control::edit: API error while trying to "
-                                        "restart HAProxy service : {}".format(api_res.get('message')))
 
                 return JsonResponse({
                     'status': True,
@@ -287,10 +287,7 @@ class DarwinPolicyAPIv1(View):
         if DarwinBuffering.objects.filter(destination_filter__policy=policy).exists():
             DarwinPolicy.update_buffering()
 
-        for frontend in policy.frontend_set.all():
-            for node in frontend.get_nodes():
-                node.api_request("services.rsyslogd.rsyslog.build_conf", frontend.pk)
-                node.api_request("services.rsyslogd.rsyslog.restart_service")
+        Frontend.reload_rsyslog_confs(policy.frontend_set.all())
 
         Cluster.api_request("services.darwin.darwin.write_policy_conf", policy.pk)
         Cluster.api_request("services.darwin.darwin.reload_conf")
@@ -358,10 +355,7 @@ class DarwinPolicyAPIv1(View):
                 'error': error
             }, status=500)
 
-        for frontend in policy.frontend_set.all():
-            for node in frontend.get_nodes():
-                node.api_request("services.rsyslogd.rsyslog.build_conf", frontend.pk)
-                node.api_request("services.rsyslogd.rsyslog.restart_service")
+        Frontend.reload_rsyslog_confs(policy.frontend_set.all())
 
         if DarwinBuffering.objects.filter(destination_filter__policy=policy).exists():
             DarwinPolicy.update_buffering()
@@ -398,10 +392,7 @@ class DarwinPolicyAPIv1(View):
                 for filter_conf_path in filter_conf_paths:
                     Cluster.api_request("services.darwin.darwin.delete_filter_conf", filter_conf_path)
 
-                for frontend in policy.frontend_set.all():
-                    for node in frontend.get_nodes():
-                        node.api_request("services.rsyslogd.rsyslog.build_conf", frontend.pk)
-                        node.api_request("services.rsyslogd.rsyslog.restart_service")
+                Frontend.reload_rsyslog_confs(policy.frontend_set.all())
 
                 Cluster.api_request("services.darwin.darwin.reload_conf")
 
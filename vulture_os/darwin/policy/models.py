@@ -363,68 +363,81 @@ class DarwinPolicy(models.Model):
         """
         This function updates all models to create/assign buffer filter(s) to corresponding buffering actions
         it also enables or disables buffer filter depending on conditions
+        Bufferings are loaded at once, and the policy configuration is only written if a buffer filter
+         is enabled or has been disabled
         """
         logger.debug("darwin::update_buffering:: starting to update buffering filters")
-        # Get new (incomplete) bufferings
-        new_bufferings = DarwinBuffering.objects.filter(buffer_filter=None)
         buffer_type = DarwinFilter.objects.get(name="bufr")
-
-        for buffering in new_bufferings:
-            buffer_filter= None
-            # Get equivalent buffering, for same destination filter type
-            existing_buffering = DarwinBuffering.objects.exclude(buffer_filter=None).filter(destination_filter__filter_type=buffering.destination_filter.filter_type).first()
-            # If there is none existing, that means the buffering filter doesn't exist either
-            if not existing_buffering:
-                logger.info("darwin::update_buffering:: no buffer filter for '{}' filter type, creating".format(buffering.destination_filter.filter_type))
+        state = BufferingState()
+
+        # Buffer filter of each destination filter type, taken from an equivalent complete buffering
+        type_buffer_filters = {}
+        for buffering in state.bufferings:
+            if buffering.buffer_filter_id:
+                type_buffer_filters.setdefault(buffering.destination_filter.filter_type_id, buffering.buffer_filter_id)
+
+        internal_policy = None
+        # Complete new bufferings
+        for buffering in state.bufferings:
+            if buffering.buffer_filter_id:
+                continue
+            filter_type = buffering.destination_filter.filter_type
+            # If there is no equivalent buffering, that means the buffering filter doesn't exist either
+            if filter_type.pk not in type_buffer_filters:
+                logger.info("darwin::update_buffering:: no buffer filter for '{}' filter type, creating".format(filter_type))
                 # Create the internal policy if necessary
-                internal_policy, created = DarwinPolicy.objects.get_or_create(
-                    is_internal=True,
-                    name="Internal Policy",
-                    defaults={
-                        "description": "Policy used to contain all internal filters"
-                    })
-                if created:
-                    logger.info("darwin::update_buffering:: internal policy created")
+                if internal_policy is None:
+                    internal_policy, created = DarwinPolicy.objects.get_or_create(
+                        is_internal=True,
+                        name="Internal Policy",
+                        defaults={
+                            "description": "Policy used to contain all internal filters"
+                        })
+                    if created:
+                        logger.info("darwin::update_buffering:: internal policy created")
                 # Create the buffer filter for this destination filter type
                 buffer_filter = FilterPolicy.objects.create(
                     filter_type=buffer_type,
                     policy=internal_policy,
                     enabled=True)
-            # Equivalent buffering already exists, just get the assigned buffer filter
-            else:
-                buffer_filter = existing_buffering.buffer_filter
+                type_buffer_filters[filter_type.pk] = buffer_filter.pk
 
             # Update the buffering action with the assigned or newly-created buffer filter
-            buffering.buffer_filter = buffer_filter
-            buffering.save()
+            buffering.buffer_filter_id = type_buffer_filters[filter_type.pk]
+            buffering.save(update_fields=['buffer_filter'])
 
         # Enable/Disable buffer filters depending on conditions
+        policy_ids = set()
         for buffer_filter in FilterPolicy.objects.filter(filter_type=buffer_type):
-            enable = False
+            buffer_filter.filter_type = buffer_type
+            buffers = state.get_buffers(buffer_filter)
 
             # Update buffer filter only if it still has buffers, delete it otherwise
-            if buffer_filter.buffers.exists():
-                # Iterate over buffers associated with buffer filter
-                # if a destination_filter is associated with a frontend through a policy, the buffer filter can be enabled
-                # (In other words, the buffer filter is enabled only if it has at least one valid source of data)
-                for buffer in buffer_filter.buffers.all():
-                    if buffer.destination_filter.enabled and buffer.destination_filter.policy.frontend_set.exists():
-                        logger.info("darwin::update_buffering:: enabling buffering filter {}".format(buffer_filter))
-                        enable = True
-
-                buffer_filter.enabled = enable
-                buffer_filter.save()
-            else:
-                logger.info("darwin::update_buffering:: filter doesn't have buffers, deleting {}".format(buffer_filter))
+            if not buffers:
+                logger.info("darwin::update_buffering:: filter doesn't have buffers, deleting {}".format(buffer_filter.name))
                 Cluster.api_request("services.darwin.darwin.delete_filter_conf", buffer_filter.conf_path)
                 buffer_filter.delete()
+                continue
+
+            # The buffer filter is enabled only if it has at least one valid source of data :
+            # an enabled destination filter, associated with a frontend through its policy
+            enable = any(state.is_source(buffer) for buffer in buffers)
+            if enable != buffer_filter.enabled:
+                logger.info("darwin::update_buffering:: {} buffering filter {}".format(
+                    "enabling" if enable else "disabling", buffer_filter.name))
+                buffer_filter.enabled = enable
+                buffer_filter.save(update_fields=['enabled'])
+                policy_ids.add(buffer_filter.policy_id)
+            # Its outputs depend on the bufferings, and on the frontends of the destination filters :
+            #  write_policy_conf compares them with the files of each node, and only writes the changed ones
+            elif enable:
+                policy_ids.add(buffer_filter.policy_id)
 
-        try:
-            internal_policy = DarwinPolicy.objects.get(name="Internal Policy", is_internal=True)
-            Cluster.api_request("services.darwin.darwin.write_policy_conf", internal_policy.pk)
-            Cluster.api_request("services.darwin.darwin.reload_policy_filters", internal_policy.pk)
-        except DarwinPolicy.DoesNotExist:
-            logger.error("darwin_policy::update_buffering:: could not find internal policy")
+        if not policy_ids:
+            logger.debug("darwin::update_buffering:: no buffering filter to update")
+        for policy_id in policy_ids:
+            # Filters whose configuration changed are reloaded by write_policy_conf
+            Cluster.api_request("services.darwin.darwin.write_policy_conf", policy_id)
 
 
     @staticmethod
@@ -638,16 +651,17 @@ class FilterPolicy(models.Model):
         return json_conf
 
 
-    def _generate_bufr_conf(self):
+    def _generate_bufr_conf(self, buffering_state=None):
         json_conf = {
             "input_format": [],
             "outputs": []
         }
         filter_type = ""
 
-        if self.buffers.exists():
-            some_buffer = self.buffers.first()
-            input_type = some_buffer.destination_filter.filter_type.name
+        state = buffering_state or BufferingState(buffer_filter_ids=[self.pk])
+        buffers = state.get_buffers(self)
+        if buffers:
+            input_type = buffers[0].destination_filter.filter_type.name
 
             if input_type == "unad":
                 # TODO remove when BUFR is updated with new name format
@@ -673,13 +687,13 @@ class FilterPolicy(models.Model):
                     {"name": "decimal", "type": "string"}
                 ]
 
-            for buffer in self.buffers.all():
+            for buffer in buffers:
                 redis_lists = []
-                for listener in buffer.destination_filter.policy.frontend_set.all().only("name"):
+                for frontend_name in state.get_frontend_names(buffer.destination_filter):
                     # different source name for each listener/frontend
                     # different source name for each filter
                     # different source name for each policy
-                    source = "{}_{}_{}".format(buffer.destination_filter.name, listener.name, buffer.destination_filter.policy.id)
+                    source = "{}_{}_{}".format(buffer.destination_filter.name, frontend_name, buffer.destination_filter.policy_id)
                     redis_lists.append({
                         "source": source,
                         "name": "darwin_bufr_{}".format(source)
@@ -725,9 +739,10 @@ class FilterPolicy(models.Model):
         return json_conf
 
 
-    def conf_to_json(self):
+    def conf_to_json(self, buffering_state=None):
         """
         Function to clean and validate filter configuration before translating it to string and writing it in the configuration file
+        :param buffering_state: BufferingState shared by several buffer filters, loaded by each one otherwise
         """
         json_conf = {
             'redis_socket_path': REDIS_SOCKET_PATH,
@@ -750,7 +765,7 @@ class FilterPolicy(models.Model):
         if self.filter_type.name == "dgad":
             json_conf.update(self._generate_dgad_conf())
         if self.filter_type.name == "bufr":
-            json_conf.update(self._generate_bufr_conf())
+            json_conf.update(self._generate_bufr_conf(buffering_state))
         if self.filter_type.name == "vast":
             json_conf.update(self._generate_vast_conf())
         if self.filter_type.name == "vaml":
@@ -780,3 +795,47 @@ class FilterPolicy(models.Model):
     def __str__(self):
         return "[{}] {}".format(self.policy, self.name)
 
+
+class BufferingState:
+    """ Bufferings with their destination filters, and the names of the frontends using the policies of these filters,
+     loaded with a fixed number of queries whatever the number of bufferings
+    """
+
+    def __init__(self, buffer_filter_ids=None):
+        """
+        :param buffer_filter_ids: If given, only the bufferings of these buffer filters are loaded
+        """
+        # Import here to prevent circular imports
+        from services.frontend.models import Frontend
+
+        bufferings = DarwinBuffering.objects.order_by('pk')
+        if buffer_filter_ids is not None:
+            bufferings = bufferings.filter(buffer_filter_id__in=buffer_filter_ids)
+        self.bufferings = list(bufferings)
+
+        filters = FilterPolicy.objects.in_bulk({buffering.destination_filter_id for buffering in self.bufferings})
+        filter_types = DarwinFilter.objects.in_bulk({f.filter_type_id for f in filters.values()})
+        policies = DarwinPolicy.objects.in_bulk({f.policy_id for f in filters.values()})
+        for darwin_filter in filters.values():
+            darwin_filter.filter_type = filter_types[darwin_filter.filter_type_id]
+            darwin_filter.policy = policies[darwin_filter.policy_id]
+        for buffering in self.bufferings:
+            buffering.destination_filter = filters[buffering.destination_filter_id]
+
+        self.frontend_names = {}
+        if policies:
+            for frontend in Frontend.objects.order_by('pk').only('name', 'darwin_policies'):
+                for policy_id in set(frontend.darwin_policies_id or ()) & set(policies):
+                    self.frontend_names.setdefault(policy_id, []).append(frontend.name)
+
+    def get_buffers(self, buffer_filter):
+        """ Return the bufferings using a buffer filter, as buffer_filter.buffers.all() """
+        return [buffering for buffering in self.bufferings if buffering.buffer_filter_id == buffer_filter.pk]
+
+    def get_frontend_names(self, darwin_filter):
+        """ Return the names of the frontends using the policy of a filter """
+        return self.frontend_names.get(darwin_filter.policy_id, [])
+
+    def is_source(self, buffering):
+        """ Whether the destination filter of a buffering is enabled and receives data from a frontend """
+        return buffering.destination_filter.enabled and bool(self.get_frontend_names(buffering.destination_filter))
@@ -39,18 +39,30 @@ from django.conf import settings
 from django.utils.timezone import now as timezone_now
 from gui.models.rss import RSS
 from toolkit.network.network import get_hostname, get_proxy
-from applications.reputation_ctx.models import ReputationContext
+from applications.reputation_ctx.models import ReputationContext, INDEXED_DB_TYPES, INDEX_SUFFIX
 from system.tenants.models import Tenants
 from system.exceptions import VultureSystemError
 
 import subprocess
 import requests
 from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import BoundedSemaphore
+from time import monotonic
+from urllib.parse import urlparse
 
 import logging
 logging.config.dictConfig(settings.LOG_SETTINGS)
 logger = logging.getLogger('crontab')
 
+# Number of reputation contexts downloaded in parallel, and at most on the same host
+FEED_MAX_WORKERS = 8
+FEED_MAX_PER_HOST = 2
+# (connect, read) timeouts of each reputation context download
+FEED_TIMEOUT = (5.0, 10.0)
+# Maximum duration of the whole reputation contexts refresh, in seconds
+FEED_DEADLINE = 900
+
 
 def security_alert(title, level, content):
     """
@@ -75,6 +87,66 @@ def security_alert(title, level, content):
     return True
 
 
+def _remove_tmp_file(tmp_filename):
+    """ Remove a temporary database file, if it has been created """
+    try:
+        os.remove(tmp_filename)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error("Crontab::security_update: Failed to remove temporary file '{}' : {}".format(tmp_filename, e))
+
+
+def _download_reputation_ctx(reputation_ctx, tmp_filename, host_semaphore, deadline, proxies):
+    """ Download a reputation context into tmp_filename, executed in the feeds worker pool
+        Netset and domain databases are also compiled into tmp_filename + INDEX_SUFFIX
+         if they changed or if their index is missing on disk
+    :param host_semaphore: Semaphore limiting concurrent downloads on the reputation context's host
+    :param deadline: time.monotonic() value after which the download is aborted
+    :return: A tuple (changed, index compiled, duration in seconds, number of bytes written)
+    """
+    with host_semaphore:
+        # The duration does not include the wait for the semaphore
+        start = monotonic()
+        if start > deadline:
+            raise VultureSystemError("Feeds refresh deadline reached before download",
+                                     "download '{}'".format(reputation_ctx.url))
+        changed = reputation_ctx.download_to_file(tmp_filename, reputation_ctx.local_hash(), timeout=FEED_TIMEOUT,
+                                                  deadline=deadline, proxies=proxies)
+    indexed = False
+    if reputation_ctx.db_type in INDEXED_DB_TYPES:
+        if changed:
+            reputation_ctx.compile_index(tmp_filename, tmp_filename + INDEX_SUFFIX)
+            indexed = True
+        elif not os.path.isfile(reputation_ctx.index_filename):
+            reputation_ctx.compile_index(reputation_ctx.absolute_filename, tmp_filename + INDEX_SUFFIX)
+            indexed = True
+    return changed, indexed, monotonic() - start, os.path.getsize(tmp_filename) if changed else 0
+
+
+def reload_rsyslog_databases():
+    """ Reload the rsyslog service once, after all databases have been written, to prevent crash on MMDB access
+    :return: True / False
+    """
+    reload_rsyslog = subprocess.run(['/usr/local/bin/sudo', '/usr/sbin/jexec', 'rsyslog',
+                                     '/usr/sbin/service', 'rsyslogd', 'reload'],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if reload_rsyslog.returncode == 1:
+        if "rsyslogd not running" in reload_rsyslog.stderr.decode('utf8'):
+            logger.info("Crontab::security_update: Databases written and rsyslogd not runing.")
+            return True
+        logger.error("Crontab::security_update: Failed to reload rsyslogd : {}"
+                     .format(reload_rsyslog.stderr.decode('utf8')))
+    elif reload_rsyslog.returncode == 0:
+        logger.info("Crontab::security_update: Databases written and rsyslogd reloaded.")
+        return True
+    else:
+        logger.error("Crontab::security_update: Rsyslogd reload failure : "
+                     "stdout={}, stderr={}".format(reload_rsyslog.stdout.decode('utf8'),
+                                                   reload_rsyslog.stderr.decode('utf8')))
+    return False
+
+
 def security_update(node_logger=None):
     """
     :return: Update Vulture's security databases
@@ -128,50 +200,92 @@ def security_update(node_logger=None):
     # On ALL nodes, write databases on disk
     # All internal reputation contexts are retrieved and created if needed
     # We can now download and write all reputation contexts
-    reputation_ctxs = ReputationContext.objects.filter(enable_hour_download=True)
-    for reputation_ctx in reputation_ctxs:
-        try:
-            content = reputation_ctx.download()
-        except VultureSystemError as e:
-            if "404" in str(e) or "403" in str(e) and reputation_ctx.internal:
-                logger.info("Security_update::info: Reputation context '{}' is now unavailable ({}). "
-                            "Deleting it.".format(reputation_ctx, str(e)))
-                reputation_ctx.delete()
-            else:
-                logger.error("Security_update::error: Failed to download reputation database '{}' : {}"
-                             .format(reputation_ctx.name, e))
-            continue
-        except Exception as e:
-            logger.error("Security_update::error: Failed to download reputation database '{}' : {}"
-                         .format(reputation_ctx.name, e))
-            continue
-        try:
+    reputation_ctxs = list(ReputationContext.objects.filter(enable_hour_download=True))
+    start = monotonic()
+    deadline = start + FEED_DEADLINE
+    host_semaphores = {urlparse(reputation_ctx.url).hostname: BoundedSemaphore(FEED_MAX_PER_HOST)
+                       for reputation_ctx in reputation_ctxs}
+    databases_written = False
+    total_bytes = 0
+    with ThreadPoolExecutor(max_workers=FEED_MAX_WORKERS) as executor:
+        futures = {}
+        for reputation_ctx in reputation_ctxs:
             tmp_filename = "{}{}".format("/tmp/", get_random_string(length=12))
-            with open(tmp_filename, "wb") as f:
-                f.write(content)
-            """ Immediatly reload the rsyslog service to prevent crash on MMDB access """
-            # Filename is a variable of us (not injectable)
-            reload_rsyslog = subprocess.run(['/usr/local/bin/sudo /bin/mv {} {}'
-                                             '&& /usr/local/bin/sudo /usr/sbin/jexec '
-                                             'rsyslog /usr/sbin/service rsyslogd reload'
-                                            .format(tmp_filename, reputation_ctx.absolute_filename)],
-                                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-            if reload_rsyslog.returncode == 1:
-                if "rsyslogd not running" in reload_rsyslog.stderr.decode('utf8'):
-                    logger.info("Crontab::security_update: Database written and rsyslogd not runing.")
+            validators = (reputation_ctx.etag, reputation_ctx.last_modified, reputation_ctx.content_hash)
+            future = executor.submit(_download_reputation_ctx, reputation_ctx, tmp_filename,
+                                     host_semaphores[urlparse(reputation_ctx.url).hostname], deadline, proxies)
+            futures[future] = (reputation_ctx, tmp_filename, validators)
+
+        for future in as_completed(futures):
+            reputation_ctx, tmp_filename, validators = futures[future]
+            try:
+                changed, indexed, duration, nb_bytes = future.result()
+            except VultureSystemError as e:
+                if "404" in str(e) or "403" in str(e) and reputation_ctx.internal:
+                    logger.info("Security_update::info: Reputation context '{}' is now unavailable ({}). "
+                                "Deleting it.".format(reputation_ctx, str(e)))
+                    reputation_ctx.delete()
                 else:
-                    logger.error("Crontab::security_update: It seems that the database cannot be written : {}".format(e))
-            elif reload_rsyslog.returncode == 0:
-                logger.info("Crontab::security_update: Database written and rsyslogd reloaded.")
-            else:
-                logger.error("Crontab::security_update: Database write failure : "
-                             "stdout={}, stderr={}".format(reload_rsyslog.stdout.decode('utf8'),
-                                                           reload_rsyslog.stderr.decode('utf8')))
-            logger.info("Crontab::security_update: Reputation database named '{}' (file '{}') successfully written."
-                        .format(reputation_ctx.name, reputation_ctx.absolute_filename))
-        except Exception as e:
-            logger.error("Security_update::error: Failed to write reputation database '{}' : {}"
-                         .format(reputation_ctx.name, e))
+                    logger.error("Security_update::error: Failed to download reputation database '{}' : {}"
+                                 .format(reputation_ctx.name, e))
+                _remove_tmp_file(tmp_filename)
+                _remove_tmp_file(tmp_filename + INDEX_SUFFIX)
+                continue
+            except Exception as e:
+                logger.error("Security_update::error: Failed to download reputation database '{}' : {}"
+                             .format(reputation_ctx.name, e))
+                _remove_tmp_file(tmp_filename)
+                _remove_tmp_file(tmp_filename + INDEX_SUFFIX)
+                continue
+
+            total_bytes += nb_bytes
+            logger.info("Crontab::security_update: Reputation database named '{}' retrieved in {:.3f}s, "
+                        "{} bytes written.".format(reputation_ctx.name, duration, nb_bytes))
+            if not changed:
+                logger.info("Crontab::security_update: Reputation database named '{}' did not change, skipping."
+                            .format(reputation_ctx.name))
+                _remove_tmp_file(tmp_filename)
+                update_fields = []
+                if validators != (reputation_ctx.etag, reputation_ctx.last_modified, reputation_ctx.content_hash):
+                    update_fields.extend(["etag", "last_modified", "content_hash"])
+                if indexed:
+                    try:
+                        subprocess.check_output(['/usr/local/bin/sudo', '/bin/mv', tmp_filename + INDEX_SUFFIX,
+                                                 reputation_ctx.index_filename], stderr=subprocess.PIPE)
+                        update_fields.extend(["nb_netset", "nb_unique"])
+                    except subprocess.CalledProcessError as e:
+                        logger.error("Security_update::error: Failed to write index of reputation database '{}' : {}"
+                                     .format(reputation_ctx.name, e.stderr.decode('utf8')))
+                        _remove_tmp_file(tmp_filename + INDEX_SUFFIX)
+                if update_fields:
+                    reputation_ctx.save(update_fields=update_fields)
+                continue
+
+            try:
+                # Filename is a variable of us (not injectable)
+                subprocess.check_output(['/usr/local/bin/sudo', '/bin/mv', tmp_filename,
+                                         reputation_ctx.absolute_filename], stderr=subprocess.PIPE)
+                if indexed:
+                    subprocess.check_output(['/usr/local/bin/sudo', '/bin/mv', tmp_filename + INDEX_SUFFIX,
+                                             reputation_ctx.index_filename], stderr=subprocess.PIPE)
+                databases_written = True
+                reputation_ctx.save(update_fields=["etag", "last_modified", "content_hash", "nb_netset",
+                                                   "nb_unique", "last_update"])
+                logger.info("Crontab::security_update: Reputation database named '{}' (file '{}') "
+                            "successfully written.".format(reputation_ctx.name, reputation_ctx.absolute_filename))
+            except subprocess.CalledProcessError as e:
+                logger.error("Security_update::error: Failed to write reputation database '{}' : {}"
+                             .format(reputation_ctx.name, e.stderr.decode('utf8')))
+                _remove_tmp_file(tmp_filename)
+                _remove_tmp_file(tmp_filename + INDEX_SUFFIX)
+            except Exception as e:
+                logger.error("Security_update::error: Failed to write reputation database '{}' : {}"
+                             .format(reputation_ctx.name, e))
+
+    logger.info("Crontab::security_update: {} reputation databases refreshed in {:.3f}s, {} bytes written."
+                .format(len(reputation_ctxs), monotonic() - start, total_bytes))
+    if databases_written:
+        reload_rsyslog_databases()
 
     logger.info("Security_update done.")
 
@@ -0,0 +1,44 @@
+#!/home/vlt-os/env/bin/python
+"""This file is part of Vulture OS.
+
+Vulture OS is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Vulture OS is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Vulture OS.  If not, see http://www.gnu.org/licenses/.
+"""
+__author__ = "Vulture OS"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "4.0.0"
+__maintainer__ = "Vulture OS"
+__email__ = "contact@vultureproject.org"
+__doc__ = 'Jobs related to OAuth2 providers'
+
+from authentication.user_portal.models import UserAuthentication
+from system.cluster.models import Cluster
+from django.conf import settings
+import logging
+
+logging.config.dictConfig(settings.LOG_SETTINGS)
+logger = logging.getLogger('crontab')
+
+
+def rotate_jwt_keys():
+    """
+    :return: Rotate the signing keys of the portals issuing signed access tokens
+    """
+    if Cluster.get_current_node().is_master_mongo:
+        for portal in UserAuthentication.objects.filter(enable_oauth=True, oauth_token_format="jwt"):
+            if portal.rotate_jwt_keys():
+                portal.save(update_fields=['oauth_jwt_keys'])
+                logger.info(f"Crontab::rotate_jwt_keys: JWT signing keys of portal '{portal.name}' rotated")
+
+    return True
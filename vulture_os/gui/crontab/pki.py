@@ -22,24 +22,63 @@ __maintainer__ = "Vulture OS"
 __email__ = "contact@vultureproject.org"
 __doc__ = 'Jobs related to PKI'
 
+from django.conf import settings
 from system.pki.models import X509Certificate
 from system.cluster.models import Cluster
+from concurrent.futures import ThreadPoolExecutor
 from cryptography import x509
 import subprocess
 import os.path
 
+import logging
+logging.config.dictConfig(settings.LOG_SETTINGS)
+logger = logging.getLogger('crontab')
+
+# Maximum number of external CRLs downloaded at the same time
+CRL_MAX_WORKERS = 8
+
 
 def update_crl():
     """
-    :return: Update internal vulture's CRL
+    :return: Update internal vulture's CRL, and external ones
     """
     if Cluster.get_current_node().is_master_mongo:
-        for cert in X509Certificate.objects.filter(status='V'):
-            cert.gen_crl()
+        # The internal CRL is the same for every internal certificate: build it once, through the CA
+        for ca in X509Certificate.objects.filter(status='V', is_vulture_ca=True):
+            ca.gen_crl()
+
+        externals = X509Certificate.objects.filter(status='V', is_vulture_ca=False, is_external=True).exclude(crl_uri="")
+        with ThreadPoolExecutor(max_workers=CRL_MAX_WORKERS) as executor:
+            for cert, future in [(cert, executor.submit(cert.gen_crl)) for cert in externals]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error("Crontab::update_crl: Failed to update CRL of '{}': {}".format(cert.name, e))
 
     return True
 
 
+def get_haproxy_nodes(certificate_ids):
+    """ Return the nodes whose HAProxy uses one of the given certificates """
+    from applications.backend.models import Server
+    from services.frontend.models import Listener
+    from system.cluster.models import Node
+    from system.pki.models import TLSProfile
+
+    profile_ids = set(TLSProfile.objects.filter(x509_certificate_id__in=certificate_ids).values_list('pk', flat=True))
+    if not profile_ids:
+        return set()
+    # Backends are deployed on every node
+    if Server.objects.filter(tls_profile_id__in=profile_ids).exists():
+        return set(Node.objects.exclude(management_ip__exact=''))
+
+    nodes = set()
+    for listener in Listener.objects.only('network_address', 'tls_profiles'):
+        if profile_ids & set(listener.tls_profiles_id or ()):
+            nodes.update(nic.node for nic in listener.network_address.nic.all())
+    return nodes
+
+
 def acme_update():
     """
     :return: Run acme.sh to automatically renew Let's encrypt certificates
@@ -47,21 +86,31 @@ def acme_update():
     subprocess.check_output(["/usr/local/sbin/acme.sh", "--cron", "--home", "/var/db/acme/.acme.sh"])
 
     """ Now update certificate database"""
-    need_restart = False
+    renewed = []
     for cert in X509Certificate.objects.filter(is_vulture_ca=False, is_external=True):
         crypto_cert = x509.load_pem_x509_certificate(cert.cert.encode())
         subject = crypto_cert.subject
         common_name_obj = subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)[0]
         cn = common_name_obj.value
-        if os.path.isfile("/var/db/acme/.acme.sh/{}/{}.cer".format(cn, cn)):
-            with open("/var/db/acme/.acme.sh/{}/{}.cer".format(cn, cn)) as file_cert:
+        acme_path = "/var/db/acme/.acme.sh/{}".format(cn)
+        if os.path.isfile("{}/{}.cer".format(acme_path, cn)):
+            with open("{}/{}.cer".format(acme_path, cn)) as file_cert:
                 pem_cert = file_cert.read()
-                cert.cert = pem_cert
-                cert.save()
-
-                """ Update cert on cluster """
-                cert.save_conf()
-                need_restart = True
+            # Only renewed certificates need to be imported
+            if pem_cert == cert.cert:
+                continue
+            cert.cert = pem_cert
+            # The key and the intermediates may change with the certificate
+            for attr, filename in (('key', "{}.key".format(cn)), ('chain', "fullchain.cer")):
+                if os.path.isfile("{}/{}".format(acme_path, filename)):
+                    with open("{}/{}".format(acme_path, filename)) as file_pem:
+                        setattr(cert, attr, file_pem.read())
+            """ save() updates cert on cluster """
+            cert.save()
+            renewed.append(cert.pk)
+            logger.info("Crontab::acme_update: Certificate '{}' renewed".format(cert.name))
 
-    if need_restart:
-        Cluster.api_request("services.haproxy.haproxy.reload_service")
+    if renewed:
+        # Only nodes using these certificates, which try to update them without reload
+        for node in get_haproxy_nodes(renewed):
+            node.api_request("services.haproxy.haproxy.update_certificates", renewed)
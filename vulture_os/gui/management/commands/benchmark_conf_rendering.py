@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from services.frontend.models import Frontend
+from services.render import render_all, RENDER_WORKERS
+from system.cluster.models import Cluster
+
+from copy import copy
+from time import perf_counter
+
+
+class Command(BaseCommand):
+    help = 'Compare serial and parallel rendering of HAProxy and Rsyslog confs, on synthetic copies of the frontends'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--frontends", type=int, default=500, help="Number of synthetic frontends to render")
+        parser.add_argument("--workers", type=int, default=RENDER_WORKERS, help="Number of worker processes")
+
+    def handle(self, *args, **options):
+        if options["frontends"] < 1 or options["workers"] < 2:
+            raise CommandError("--frontends must be positive and --workers greater than 1.")
+        models = list(Frontend.objects.filter(enabled=True).order_by('pk'))
+        if not models:
+            raise CommandError("At least one enabled frontend is needed as a model.")
+
+        # Synthetic frontends are renamed copies of the existing ones, they keep their relations
+        frontends = []
+        for i in range(options["frontends"]):
+            frontend = copy(models[i % len(models)])
+            frontend.name = f"{frontend.name}_bench_{i}"
+            frontends.append(frontend)
+
+        node = Cluster.get_current_node()
+        global_config = Cluster.get_global_config()
+        for service_name, method in (("haproxy", "generate_conf"), ("rsyslog", "generate_rsyslog_conf")):
+            tasks = [(frontend, method, {'node': node, 'global_config': global_config}) for frontend in frontends]
+
+            start = perf_counter()
+            serial = render_all(tasks, service_name, workers=1)
+            serial_time = perf_counter() - start
+
+            start = perf_counter()
+            parallel = render_all(tasks, service_name, workers=options["workers"])
+            parallel_time = perf_counter() - start
+
+            if serial != parallel:
+                raise CommandError(f"{service_name}: parallel rendering differs from serial rendering.")
+            self.stdout.write(f"{service_name}: {len(tasks)} confs, serial {serial_time:.3f}s, "
+                              f"parallel ({options['workers']} workers) {parallel_time:.3f}s")
+            self.stdout.write(self.style.SUCCESS(f"Speedup: x{serial_time / parallel_time:.1f}"))
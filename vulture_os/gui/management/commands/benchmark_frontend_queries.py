@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from services.frontend.models import Frontend
+from services.frontend.render_context import FrontendRenderContext
+from system.cluster.models import Cluster
+
+from time import perf_counter
+
+
+class Command(BaseCommand):
+    help = 'Count database queries needed to render HAProxy and Rsyslog confs of growing numbers of frontends, ' \
+           'with and without a render context'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Also check that renderings with and without a render context are identical")
+
+    def render(self, frontends, node, global_config, with_context):
+        confs = []
+        context = FrontendRenderContext(frontends, node=node) if with_context else None
+        for frontend in frontends:
+            render_context = context.for_frontend(frontend) if context else None
+            confs.append(frontend.generate_conf(node=node, global_config=global_config,
+                                                render_context=render_context))
+            confs.append(frontend.generate_rsyslog_conf(node=node, global_config=global_config,
+                                                        render_context=render_context))
+        return confs
+
+    def handle(self, *args, **options):
+        frontends = list(Frontend.objects.order_by('pk'))
+        if not frontends:
+            raise CommandError("At least one frontend is needed.")
+        node = Cluster.get_current_node()
+        global_config = Cluster.get_global_config()
+
+        self.stdout.write(f"{'Frontends':>10}{'Queries':>10}{'Time':>10}{'Ctx queries':>14}{'Ctx time':>10}")
+        sizes = sorted({size for size in (1, 2, 5, 10, 20, 50, 100) if size < len(frontends)} | {len(frontends)})
+        for size in sizes:
+            results = []
+            for with_context in (False, True):
+                # Frontends are fetched again, so that nothing is cached on the instances
+                subset = list(Frontend.objects.filter(pk__in=[f.pk for f in frontends[:size]]).order_by('pk'))
+                with CaptureQueriesContext(connection) as queries:
+                    start = perf_counter()
+                    confs = self.render(subset, node, global_config, with_context)
+                    duration = perf_counter() - start
+                results.append((confs, len(queries), duration))
+            if options["check"] and results[0][0] != results[1][0]:
+                raise CommandError(f"Renderings of {size} frontends differ with a render context.")
+            self.stdout.write(f"{size:>10}{results[0][1]:>10}{results[0][2]:>9.3f}s"
+                              f"{results[1][1]:>14}{results[1][2]:>9.3f}s")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from system.cluster.models import Node
+
+from time import perf_counter
+
+
+class Command(BaseCommand):
+    help = 'Count database queries needed to compute the network objects of each node, as used by PF templates'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'Node':<30}{'Listeners':>10}{'Forwarders':>12}{'Backends':>10}{'Queries':>10}{'Time':>10}")
+        for node in Node.objects.all():
+            with CaptureQueriesContext(connection) as queries:
+                start = perf_counter()
+                nb_listeners = len(node._get_enabled_listeners())
+                nb_forwarders = len(node.get_forwarders_enabled)
+                nb_backends = len(node.get_backends_enabled)
+                # Second access is served by the per-pass cache
+                node.get_forwarders_enabled
+                node.get_backends_enabled
+                duration = perf_counter() - start
+            self.stdout.write(f"{node.name:<30}{nb_listeners:>10}{nb_forwarders:>12}{nb_backends:>10}"
+                              f"{len(queries):>10}{duration:>9.3f}s")
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from toolkit.redis.redis_base import RedisBase
+
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import requests
+
+
+def redis_commands_count(redis):
+    """ Return the total number of commands processed by a Redis server, from INFO commandstats """
+    return sum(stats['calls'] for stats in redis.info("commandstats").values())
+
+
+class Command(BaseCommand):
+    help = 'Load test a portal endpoint (log_in, oauth2/token, ...), reporting latencies and Redis commands per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Full URL of the portal endpoint")
+        parser.add_argument("--method", default="POST", choices=("GET", "POST"))
+        parser.add_argument("--data", action="append", default=[], help="Body parameter, as key=value")
+        parser.add_argument("--header", action="append", default=[], help="Request header, as 'Name: value'")
+        parser.add_argument("--requests", type=int, default=200, help="Total number of requests")
+        parser.add_argument("--concurrency", type=int, default=10, help="Number of concurrent clients")
+        parser.add_argument("--insecure", action="store_true", help="Do not verify server certificate")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+        try:
+            data = dict(param.split("=", 1) for param in options["data"])
+            headers = {name.strip(): value.strip() for name, value in
+                       (header.split(":", 1) for header in options["header"])}
+        except ValueError:
+            raise CommandError("Malformed --data or --header parameter.")
+
+        session = requests.Session()
+
+        def send_request(_):
+            start = perf_counter()
+            response = session.request(options["method"], options["url"], data=data, headers=headers,
+                                       verify=not options["insecure"], allow_redirects=False)
+            return perf_counter() - start, response.status_code
+
+        redis = RedisBase().redis
+        commands_before = redis_commands_count(redis)
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            results = list(executor.map(send_request, range(options["requests"])))
+        duration = perf_counter() - start
+        # The first INFO call is counted in the second snapshot
+        nb_commands = redis_commands_count(redis) - commands_before - 1
+
+        latencies = sorted(latency for latency, _ in results)
+        status_codes = {}
+        for _, status_code in results:
+            status_codes[status_code] = status_codes.get(status_code, 0) + 1
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000
+
+        self.stdout.write(f"{len(results)} requests in {duration:.3f}s ({len(results) / duration:.1f} req/s)")
+        self.stdout.write(f"Status codes: {status_codes}")
+        self.stdout.write(f"Latency p50: {percentile(50):.2f}ms, p99: {percentile(99):.2f}ms, "
+                          f"max: {latencies[-1] * 1000:.2f}ms")
+        self.stdout.write(f"Redis commands on local node: {nb_commands / len(results):.1f} per request")
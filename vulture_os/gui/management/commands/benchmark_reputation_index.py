@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from applications.reputation_ctx.models import ReputationContext, INDEXED_DB_TYPES
+from toolkit.network.netset import compile_index, iter_entries
+
+from ipaddress import ip_address, ip_network
+from random import choice, getrandbits
+from time import perf_counter
+
+
+class Command(BaseCommand):
+    help = 'Compare lookup speed of a netset/domain reputation context between its compiled index and its raw list'
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", help="Name of the reputation context")
+        parser.add_argument("--lookups", type=int, default=100000, help="Number of lookups in the compiled index")
+        parser.add_argument("--raw-lookups", type=int, default=100, help="Number of lookups in the raw list")
+
+    def handle(self, *args, **options):
+        try:
+            reputation_ctx = ReputationContext.objects.get(name=options["name"])
+        except ReputationContext.DoesNotExist:
+            raise CommandError(f"Reputation context '{options['name']}' not found.")
+        if reputation_ctx.db_type not in INDEXED_DB_TYPES:
+            raise CommandError(f"Reputation context of type '{reputation_ctx.db_type}' cannot be indexed.")
+
+        with open(reputation_ctx.absolute_filename, "rb") as f:
+            raw_entries = list(iter_entries(f))
+        start = perf_counter()
+        index = compile_index(reputation_ctx.db_type, raw_entries)
+        build_time = perf_counter() - start
+        self.stdout.write(f"{len(raw_entries)} raw entries compiled into {index.nb_entries} entries "
+                          f"({index.nb_unique} unique) in {build_time:.3f}s")
+
+        # Half of the values are taken from the list, the other half are random
+        if reputation_ctx.db_type == "domain":
+            raw_list = [entry.split()[-1].lower().rstrip(".") for entry in raw_entries]
+            values = [choice(raw_list) if i % 2 else f"{getrandbits(32):x}.example" for i in range(options["lookups"])]
+
+            def raw_lookup(value):
+                return any(value == domain or value.endswith("." + domain) for domain in raw_list)
+        else:
+            version = 4 if reputation_ctx.db_type == "ipv4_netset" else 6
+            raw_list = []
+            for entry in raw_entries:
+                try:
+                    raw_list.append(ip_network(entry.split()[0], strict=False))
+                except ValueError:
+                    continue
+            values = [str(choice(raw_list).network_address) if i % 2 and raw_list
+                      else str(ip_address(getrandbits(32 if version == 4 else 128)))
+                      for i in range(options["lookups"])]
+
+            def raw_lookup(value):
+                address = ip_address(value)
+                return any(address in network for network in raw_list)
+
+        start = perf_counter()
+        for value in values:
+            index.lookup(value)
+        index_time = (perf_counter() - start) / max(len(values), 1)
+
+        raw_values = values[:options["raw_lookups"]]
+        start = perf_counter()
+        for value in raw_values:
+            raw_lookup(value)
+        raw_time = (perf_counter() - start) / max(len(raw_values), 1)
+
+        self.stdout.write(f"Compiled index: {index_time * 1e6:.2f}us per lookup ({len(values)} lookups)")
+        self.stdout.write(f"Raw list: {raw_time * 1e6:.2f}us per lookup ({len(raw_values)} lookups)")
+        if index_time:
+            self.stdout.write(self.style.SUCCESS(f"Speedup: x{raw_time / index_time:.1f}"))
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from services.frontend.models import Frontend
+from services.haproxy.haproxy import format_pattern_file, normalize_conf
+from system.cluster.models import Node
+from workflow.models import Workflow
+
+from difflib import unified_diff
+from json import dumps as json_dumps, loads as json_loads
+import os
+import subprocess
+import sys
+
+# String hashing is randomized per process : renderings of other processes are compared with these seeds
+HASH_SEEDS = ("1", "2")
+
+
+class Command(BaseCommand):
+    help = 'Render the configuration of every frontend and workflow twice in this process, then in processes ' \
+           'with different hash seeds, and check that all renderings are identical'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--diff", action="store_true", help="Print the differences of unstable renderings")
+        parser.add_argument("--dump", action="store_true",
+                            help="Only print the renderings as JSON, used by the cross-process check")
+
+    def renderings(self):
+        """ Return the list of (name, render function) of all the configurations """
+        renderings = []
+        nodes = list(Node.objects.order_by('pk'))
+        for frontend in Frontend.objects.order_by('pk'):
+            renderings.extend((f"Frontend '{frontend.name}' on '{node.name}'",
+                               lambda frontend=frontend, node=node: frontend.generate_conf(node=node))
+                              for node in nodes)
+            renderings.append((f"Frontend '{frontend.name}' rsyslog", frontend.generate_rsyslog_conf))
+        for workflow in Workflow.objects.order_by('pk'):
+            renderings.append((f"Workflow '{workflow.name}'", workflow.generate_conf))
+            # Compared by update_acl_conf to choose between runtime updates and a reload
+            renderings.append((f"Workflow '{workflow.name}' ACL pattern files",
+                               lambda workflow=workflow: "".join(f"# {filename}\n{format_pattern_file(patterns)}"
+                                                                 for filename, patterns
+                                                                 in workflow.get_pattern_files().items())))
+        return renderings
+
+    def render_in_process(self, seed):
+        """ Render all the configurations in a new process, with the given PYTHONHASHSEED
+        :return     Dict of renderings by name
+        """
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        try:
+            output = subprocess.check_output([sys.executable, "manage.py", "check_conf_determinism", "--dump"],
+                                             cwd=settings.BASE_DIR, env=env, stderr=subprocess.PIPE)
+        except subprocess.CalledProcessError as e:
+            raise CommandError(f"Rendering with PYTHONHASHSEED={seed} failed: {e.stderr.decode('utf8', 'replace')}")
+        return json_loads(output)
+
+    def check(self, name, first, second, labels=("first", "second")):
+        """ Compare two renderings of a configuration
+        :return     True if both renderings are byte-for-byte identical
+        """
+        if first == second:
+            return True
+        semantic = "semantic" if normalize_conf(first or "") != normalize_conf(second or "") else "formatting only"
+        self.stdout.write(self.style.ERROR(f"{name}: rendering is not stable between {labels[0]} and "
+                                           f"{labels[1]} ({semantic})"))
+        if self.options["diff"]:
+            self.stdout.writelines(unified_diff((first or "").splitlines(True), (second or "").splitlines(True),
+                                                fromfile=labels[0], tofile=labels[1]))
+        return False
+
+    def handle(self, *args, **options):
+        self.options = options
+        renderings = self.renderings()
+        if options["dump"]:
+            self.stdout.write(json_dumps({name: render() for name, render in renderings}))
+            return
+
+        nb_failed = 0
+        local = {}
+        for name, render in renderings:
+            local[name] = render()
+            nb_failed += not self.check(name, local[name], render())
+
+        seeds = [self.render_in_process(seed) for seed in HASH_SEEDS]
+        for name in local:
+            for seed, remote in zip(HASH_SEEDS, seeds):
+                nb_failed += not self.check(name, local[name], remote.get(name),
+                                            labels=("this process", f"PYTHONHASHSEED={seed}"))
+
+        if nb_failed:
+            raise CommandError(f"{nb_failed} renderings of {len(local)} configurations are not deterministic.")
+        self.stdout.write(self.style.SUCCESS(f"{len(local)} configurations rendered identically, "
+                                             f"also with PYTHONHASHSEED={' and '.join(HASH_SEEDS)}."))
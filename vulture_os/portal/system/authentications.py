@@ -30,6 +30,7 @@ from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
 
 # Django project imports
 # FIXME from gui.models.repository_settings  import KerberosRepository, LDAPRepository
+from portal.system.jwt_tokens import issue_access_token, token_family_member
 from portal.system.redis_sessions import (REDISBase, REDISAppSession, REDISPortalSession, REDISOauth2Session,
                                           REDISRefreshSession, RedisOpenIDSession)
 from portal.views.responses import (split_domain, basic_authentication_response, kerberos_authentication_response,
@@ -156,6 +157,12 @@ class Authentication(object):
 
     def write_oauth2_session(self, scopes):
         logger.debug(f"AUTH::write_oauth2_session: Redis oauth2 session scopes are {scopes}")
+        if self.workflow.authentication.oauth_token_format == "jwt":
+            # Signed tokens are not stored server-side, a new one is issued for each authentication
+            self.oauth2_token, _ = issue_access_token(self.redis_base, self.workflow.authentication, scopes)
+            logger.debug(f"AUTH::write_oauth2_session: signed access token successfuly created : {self.oauth2_token}")
+            return
+
         if not self.oauth2_token:
             self.oauth2_token = str(uuid4())
 
@@ -185,7 +192,8 @@ class Authentication(object):
             scopes,
             timeout,
             self.oauth2_token,
-            self.workflow.id)
+            self.workflow.id,
+            access_member=token_family_member(self.oauth2_token))
 
         logger.debug(f"AUTH::write_refresh_session: refresh token successfuly created : {self.refresh_token}")
 
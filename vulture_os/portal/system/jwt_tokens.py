@@ -0,0 +1,233 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This file is part of Vulture OS.
+
+Vulture OS is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Vulture OS is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Vulture OS.  If not, see http://www.gnu.org/licenses/.
+"""
+__author__ = "Vulture OS"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "4.0.0"
+__maintainer__ = "Vulture OS"
+__email__ = "contact@vultureproject.org"
+__doc__ = 'Signed JWT access tokens of IDP portals, verified without Redis'
+
+# Django system imports
+from django.conf import settings
+
+# Django project imports
+from authentication.user_portal.models import UserAuthentication
+from portal.system.redis_sessions import REDISBase, REDISOauth2Session, REDISTokenFamily
+
+# Required exceptions imports
+
+# Extern modules imports
+from json import dumps as json_dumps, loads as json_loads
+from time import monotonic
+from uuid import uuid4
+import jwt
+import time
+
+# Logger configuration imports
+import logging
+
+logging.config.dictConfig(settings.LOG_SETTINGS)
+logger = logging.getLogger('portal_authentication')
+
+
+JWT_ALGORITHM = "HS256"
+# Sorted set of revoked tokens ("jti:<jti>") and locked users ("sub:<client_id>:<sub>"), scored by expiration
+DENY_LIST_KEY = "oauth2_jwt_deny_list"
+# Seconds during which a worker uses its copy of the verification keys and of the deny-list
+KEYS_CACHE_TTL = 60
+KEYS_RELOAD_INTERVAL = 1
+DENY_LIST_REFRESH = 5
+# Scopes granted to the clients, the only part of the user session put in the tokens
+GRANTED_SCOPES = ("openid",)
+
+# Per worker caches : portal id -> (load time, client_id, {kid: key}), and (load time, deny-list members)
+_keys_cache = {}
+_deny_list = (None, frozenset())
+
+
+def is_portal_jwt(token):
+    """ Check if a token is a JWT signed by an IDP portal, without verifying it """
+    try:
+        return bool(jwt.get_unverified_header(token).get('kid')) and token.count(".") == 2
+    except jwt.PyJWTError:
+        return False
+
+
+def issue_access_token(redis_base, portal, scope, timeout=None):
+    """ Sign a new access token with the current key of the portal
+    The token is signed, not encrypted : it only contains the subject, the client and the granted scopes.
+     The user scope stays in Redis, for the userinfo endpoint
+    :param redis_base: REDISBase instance
+    :param portal: UserAuthentication with oauth_token_format "jwt"
+    :param scope: User scope, returned by the userinfo endpoint
+    :param timeout: Validity of the token in seconds, oauth_timeout by default
+    :return     The token and its session : issue and expiration times, and user scope
+    """
+    if not portal.oauth_jwt_keys:
+        raise jwt.InvalidKeyError(f"Portal '{portal.name}' does not have any JWT signing key")
+    key = portal.oauth_jwt_keys[-1]
+    iat = int(time.time())
+    claims = {
+        'jti': uuid4().hex,
+        'exp': iat + (timeout or portal.oauth_timeout),
+        'client_id': portal.oauth_client_id,
+        'sub': str(scope.get('sub', "")),
+        'scope': " ".join(GRANTED_SCOPES),
+    }
+    token = jwt.encode(claims, key['key'], algorithm=JWT_ALGORITHM, headers={'kid': key['kid']})
+    session = {'iat': iat, 'exp': claims['exp'], 'scope': scope}
+    redis_base.setex(_session_key(claims['jti']), claims['exp'] - iat, json_dumps(session))
+    # HAProxy's check_session_from_header only needs this marker, as for opaque tokens
+    redis_base.setex(f"oauth2_{token}_{portal.oauth_client_id}", claims['exp'] - iat, 1)
+    return token, session
+
+
+def _session_key(jti):
+    return f"oauth2_jwt_{jti}"
+
+
+def _get_verification_keys(portal_id, kid):
+    """ Return the (client_id, {kid: key}) of a portal, from the cache of the worker
+         The keys are reloaded from the database when the cache expires, or when a new kid is seen
+    """
+    now = monotonic()
+    cached = _keys_cache.get(portal_id)
+    if cached is None or now - cached[0] > KEYS_CACHE_TTL or \
+            (kid not in cached[2] and now - cached[0] > KEYS_RELOAD_INTERVAL):
+        portal = UserAuthentication.objects.only('oauth_client_id', 'oauth_token_format', 'oauth_jwt_keys')\
+                                           .get(pk=portal_id)
+        keys = {}
+        if portal.oauth_token_format == "jwt":
+            keys = {key['kid']: key['key'] for key in portal.oauth_jwt_keys}
+        cached = _keys_cache[portal_id] = (now, portal.oauth_client_id, keys)
+    return cached[1], cached[2]
+
+
+def _get_deny_list():
+    """ Return the members of the deny-list, refreshed from Redis every DENY_LIST_REFRESH seconds """
+    global _deny_list
+    loaded, members = _deny_list
+    now = monotonic()
+    if loaded is None or now - loaded > DENY_LIST_REFRESH:
+        result = REDISBase().zrangebyscore(DENY_LIST_KEY, int(time.time()), "+inf")
+        # Keep the previous copy if Redis is not reachable
+        if result is not None:
+            members = frozenset(result)
+        _deny_list = (now, members)
+    return members
+
+
+def verify_access_token(portal_id, token):
+    """ Verify an access token signed by a portal, without any Redis round trip
+    :return     The claims of the token, or None if the token has not been signed by this portal
+    :raise      jwt.PyJWTError if the token is invalid, expired or revoked
+    """
+    if not is_portal_jwt(token):
+        return None
+    kid = jwt.get_unverified_header(token)['kid']
+    client_id, keys = _get_verification_keys(portal_id, kid)
+    if kid not in keys:
+        return None
+    claims = jwt.decode(token, keys[kid], algorithms=[JWT_ALGORITHM],
+                        options={"require": ["exp", "jti", "sub", "client_id"]})
+    if claims['client_id'] != client_id:
+        raise jwt.InvalidTokenError("Token has not been issued for this client")
+    deny_list = _get_deny_list()
+    if f"jti:{claims['jti']}" in deny_list or f"sub:{client_id}:{claims['sub']}" in deny_list:
+        raise jwt.InvalidTokenError("Token has been revoked")
+    return claims
+
+
+def get_access_token_session(portal_id, token):
+    """ Verify an access token signed by a portal, and return its session
+    :return     The session of the token (iat, exp and user scope), or None if the token has not been signed by this portal
+    :raise      jwt.PyJWTError if the token is invalid, expired, revoked, or if its session is not found
+    """
+    claims = verify_access_token(portal_id, token)
+    if not claims:
+        return None
+    session = REDISBase().get(_session_key(claims['jti']))
+    if not session:
+        raise jwt.InvalidTokenError("Token session not found")
+    return json_loads(session)
+
+
+def revoke_access_token(redis_base, token):
+    """ Revoke an access token : signed tokens are added to the deny-list until they expire,
+         opaque tokens are deleted from Redis
+    """
+    if not is_portal_jwt(token):
+        REDISOauth2Session(redis_base, f"oauth2_{token}").delete()
+        return
+    # The token comes from a server-side session, its signature does not need to be verified again
+    claims = jwt.decode(token, options={"verify_signature": False})
+    now = int(time.time())
+    if claims.get('exp', 0) <= now:
+        return
+    redis_base.delete(f"oauth2_{token}_{claims.get('client_id')}")
+    redis_base.delete(_session_key(claims['jti']))
+    redis_base.zadd(DENY_LIST_KEY, {f"jti:{claims['jti']}": claims['exp']})
+    # Expired entries are useless
+    redis_base.zremrangebyscore(DENY_LIST_KEY, "-inf", now)
+
+
+def token_family_member(token):
+    """ Return the member of a refresh token family (REDISTokenFamily) revoking an access token """
+    if not is_portal_jwt(token):
+        return f"oauth2_{token}"
+    claims = jwt.decode(token, options={"verify_signature": False})
+    return f"jwt:{claims['exp']}:{claims['jti']}:oauth2_{token}_{claims.get('client_id')}"
+
+
+def revoke_token_family(redis_base, family):
+    """ Revoke all the refresh and access tokens of a family, in one atomic operation
+    :return     The number of revoked tokens
+    """
+    return REDISTokenFamily(redis_base, family).revoke(DENY_LIST_KEY)
+
+
+def set_subject_denied(redis_base, portal, sub, denied):
+    """ Deny (or allow again) all the signed access tokens of a user, and their HAProxy markers
+    :return     The number of tokens disabled or enabled
+    """
+    member = f"sub:{portal.oauth_client_id}:{sub}"
+    if denied:
+        # No token issued before this point can be valid after oauth_timeout
+        redis_base.zadd(DENY_LIST_KEY, {member: int(time.time()) + portal.oauth_timeout})
+    else:
+        redis_base.zrem(DENY_LIST_KEY, member)
+
+    # HAProxy markers of a denied user are kept under another name, to restore them once allowed again
+    prefix, disabled_prefix = "oauth2_", "disabled_oauth2_"
+    if not denied:
+        prefix, disabled_prefix = disabled_prefix, prefix
+    count = 0
+    now = int(time.time())
+    suffix = f"_{portal.oauth_client_id}"
+    for key in redis_base.scan_all(f"{prefix}*{suffix}", type="string"):
+        token = key[len(prefix):-len(suffix)]
+        if not is_portal_jwt(token):
+            continue
+        claims = jwt.decode(token, options={"verify_signature": False})
+        if claims.get('sub') != sub or claims.get('exp', 0) <= now:
+            continue
+        redis_base.delete(key)
+        redis_base.setex(f"{disabled_prefix}{token}{suffix}", claims['exp'] - now, 1)
+        count += 1
+    return count
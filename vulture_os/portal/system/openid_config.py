@@ -0,0 +1,64 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This file is part of Vulture OS.
+
+Vulture OS is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Vulture OS is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Vulture OS.  If not, see http://www.gnu.org/licenses/.
+"""
+__author__ = "Vulture OS"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "4.0.0"
+__maintainer__ = "Vulture OS"
+__email__ = "contact@vultureproject.org"
+__doc__ = 'Cached OpenID discovery documents of IDP portals'
+
+# Django system imports
+
+# Django project imports
+from authentication.user_portal.models import UserAuthentication
+
+# Required exceptions imports
+
+# Extern modules imports
+from hashlib import sha256
+from time import monotonic
+import json
+
+
+# Seconds during which a worker serves its copy of a discovery document, and clients may cache it
+DISCOVERY_CACHE_TTL = 60
+DISCOVERY_MAX_AGE = 300
+# The issuer comes from the Host header : bound the number of cached documents
+DISCOVERY_CACHE_SIZE = 1024
+
+# (portal id, issuer) -> (load time, configuration, JSON body, ETag)
+_discovery_cache = {}
+
+
+def get_openid_configuration(portal_id, issuer):
+    """ Return the discovery document of a portal for an issuer, from the cache of the worker
+    :return     The configuration (which must not be modified), its JSON body and its ETag
+    :raise      UserAuthentication.DoesNotExist
+    """
+    key = (str(portal_id), issuer)
+    now = monotonic()
+    cached = _discovery_cache.get(key)
+    if cached is None or now - cached[0] > DISCOVERY_CACHE_TTL:
+        config = UserAuthentication.objects.get(pk=portal_id).generate_openid_config(issuer)
+        body = json.dumps(config, sort_keys=True).encode('utf8')
+        etag = '"{}"'.format(sha256(body).hexdigest()[:32])
+        if len(_discovery_cache) >= DISCOVERY_CACHE_SIZE:
+            _discovery_cache.clear()
+        cached = _discovery_cache[key] = (now, config, body, etag)
+    return cached[1], cached[2], cached[3]
@@ -34,7 +34,8 @@ from authentication.learning_profiles.models import LearningProfile
 
 # Required exceptions imports
 from .exceptions                     import TokenNotFoundError, REDISWriteError
-from redis                          import Redis, ConnectionError as RedisConnectionError, ResponseError as RedisResponseError
+from redis                          import Redis, ResponseError as RedisResponseError
+from redis.connection               import ConnectionPool, UnixDomainSocketConnection
 
 # Extern modules imports
 from datetime import datetime, timedelta
@@ -42,6 +43,7 @@ from hashlib                        import sha1
 import json
 import time
 from copy import deepcopy
+from uuid import uuid4
 
 # Logger configuration
 import logging
@@ -51,6 +53,38 @@ logger = logging.getLogger('portal_authentication')
 
 # Global variables
 DEFAULT_TIMEOUT = 900
+REDIS_SOCKET = "/var/sockets/redis/redis.sock"
+# Idle time (in seconds) after which a pooled connection is checked with a PING before use
+REDIS_HEALTH_CHECK_INTERVAL = 30
+# Time (in seconds) during which the replication role of the local Redis is cached
+REDIS_ROLE_CACHE_TTL = 5
+
+# Revoke all the tokens of a refresh token family, atomically
+#  KEYS[1]: family set, KEYS[2]: deny-list of signed access tokens, ARGV[1]: current timestamp
+#  Members are Redis keys (refresh_<token>, oauth2_<token>) or signed access tokens (jwt:<exp>:<jti>:<HAProxy key>)
+REVOKE_FAMILY_SCRIPT = """
+local count = 0
+for _, member in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    if string.sub(member, 1, 4) == 'jwt:' then
+        local exp, jti, marker = string.match(member, '^jwt:(%d+):([^:]+):(.+)$')
+        if exp and tonumber(exp) > tonumber(ARGV[1]) then
+            redis.call('ZADD', KEYS[2], exp, 'jti:' .. jti)
+            redis.call('DEL', marker)
+        end
+    else
+        if string.sub(member, 1, 7) == 'oauth2_' then
+            local repo = redis.call('HGET', member, 'repo')
+            if repo then
+                redis.call('DEL', member .. '_' .. repo)
+            end
+        end
+        redis.call('DEL', member)
+    end
+    count = count + 1
+end
+redis.call('DEL', KEYS[1])
+return count
+"""
 
 
 
@@ -606,12 +640,19 @@ class REDISRefreshSession(REDISSession):
     def delete(self):
         self.delete_in_redis(self.key)
 
-    def store_refresh_token(self, oauth2_data, timeout, oauth2_token, portal_id, overridden_by=None):
+    def store_refresh_token(self, oauth2_data, timeout, oauth2_token, portal_id, overridden_by=None, family=None,
+                            access_member=None):
+        """
+        :param family: Family of the refresh token : a new one by default, or the current one of the session
+        :param access_member: Family member revoking the access token, oauth2_<oauth2_token> by default
+        """
+        family = family or self.keys.get('family') or uuid4().hex
         data = {
             'scope': oauth2_data,
             'access_token': oauth2_token,
             'overridden_by': overridden_by,
             'portal_id': portal_id,
+            'family': family,
         }
         if not self.keys:
             self.keys = data
@@ -621,17 +662,41 @@ class REDISRefreshSession(REDISSession):
             self.keys['access_token'] = oauth2_token
             self.keys['overridden_by'] = overridden_by
             self.keys['portal_id'] = portal_id
+            self.keys['family'] = family
 
             for key,item in oauth2_data.items():
                 self.keys['scope'][key] = item
         if not self.write_in_redis(timeout):
             logger.error("REDIS::store_refresh_token: Error while writing portal_session in Redis")
             raise REDISWriteError("REDISRefreshSession::store_refresh_token: Unable to write Oauth2 infos in REDIS")
+        REDISTokenFamily(self.handler, family).add(timeout, self.key, access_member or f"oauth2_{oauth2_token}")
 
         logger.debug(f"REDISRefreshSession::store_refresh_token: self.keys {self.keys}")
         return self.key
 
 
+class REDISTokenFamily(object):
+    """ Set of the refresh tokens derived from a same authentication, and of the access tokens issued with them
+         A replayed refresh token revokes the whole family in one atomic script
+    """
+    def __init__(self, redis_handler, family_id):
+        self.handler = redis_handler
+        self.key = f"refresh_family_{family_id}"
+
+    def add(self, timeout, *members):
+        """ Add tokens to the family, which expires with its last refresh token """
+        self.handler.sadd(self.key, *members)
+        if timeout:
+            self.handler.expire(self.key, timeout)
+
+    def revoke(self, deny_list_key):
+        """ Delete all the tokens of the family
+        :param deny_list_key: Sorted set in which signed access tokens are denied
+        :return     The number of revoked tokens, or None on error
+        """
+        return self.handler.eval(REVOKE_FAMILY_SCRIPT, [self.key, deny_list_key], [int(time.time())])
+
+
 class RedisOpenIDSession(REDISSession):
     def __init__(self, redis_handler, openid_token):
         super().__init__(redis_handler, openid_token)
@@ -653,6 +718,8 @@ class RedisOpenIDSession(REDISSession):
 
 class REDISBase(object):
     """Base class for database wrapper
+        All instances of a process share the same connection pools:
+         instantiating this class does not open any connection
     """
 
     ip = settings.REDISIP
@@ -660,89 +727,73 @@ class REDISBase(object):
     r = None
     logger = logging.getLogger('redis_events')
 
+    # Process-wide connection pools, keyed by None for the local socket and (host, port) for a remote master
+    _pools = {}
+    # Cached (timestamp, master (host, port) or None if the local Redis is the master)
+    _master = None
+
     def __init__(self):
         super(REDISBase, self).__init__()
+        self.r = Redis(connection_pool=self._get_pool())
 
+    @classmethod
+    def _get_pool(cls, master=None):
+        """ Return the shared connection pool of the local Redis socket, or of a remote master
+            Connections are checked lazily with a PING if they have been idle for REDIS_HEALTH_CHECK_INTERVAL
+            redis-py resets the pool's connections in a forked child
+        """
+        pool = cls._pools.get(master)
+        if pool is None:
+            if master is None:
+                pool = ConnectionPool(connection_class=UnixDomainSocketConnection, path=REDIS_SOCKET, db=0,
+                                      decode_responses=True, health_check_interval=REDIS_HEALTH_CHECK_INTERVAL)
+            else:
+                pool = ConnectionPool(host=master[0], port=master[1], db=0, decode_responses=True,
+                                      health_check_interval=REDIS_HEALTH_CHECK_INTERVAL)
+            pool = cls._pools.setdefault(master, pool)
+        return pool
+
+    def _get_master(self):
+        """ Return the client to use for write commands : the local one if the local Redis is the master
+             The replication role is cached for REDIS_ROLE_CACHE_TTL seconds, instead of an INFO per write
+        """
+        cached = REDISBase._master
+        if cached is None or time.monotonic() - cached[0] > REDIS_ROLE_CACHE_TTL:
+            replication = self.r.info("replication")
+            master = None
+            if "master" not in replication['role']:
+                master = (replication['master_host'], replication['master_port'])
+            cached = REDISBase._master = (time.monotonic(), master)
+        if cached[1] is None:
+            return self.r
+        return Redis(connection_pool=self._get_pool(cached[1]))
+
+    def _write(self, command, *args):
+        """ Execute a write command : need master Redis """
+        master = self._get_master()
+        # If current cluster is Master
+        if master is self.r:
+            return getattr(self.r, command)(*args)
         try:
-            #self.r = Redis(host=self.ip, port=self.port, db=0)
-            self.r = Redis(unix_socket_path='/var/sockets/redis/redis.sock', db=0, decode_responses=True)
-            self.r.info()
+            return getattr(master, command)(*args)
         except Exception as e:
-            self.logger.info("REDISBase: REDIS connexion issue")
+            self.logger.info("REDISSession: Redis connexion issue")
             self.logger.exception(e)
-            raise RedisConnectionError(e)
-
+            # The master may have changed, check the role again next time
+            REDISBase._master = None
+            return None
 
     # Write function : need master Redis
     def delete(self, key):
-        result = None
-        # Get role of current cluster
-        cluster_info = self.r.info()
-        # If current cluster isn't master: get the master
-        if "master" not in cluster_info['role']:
-            # backup current cluster
-            r_backup = self.r
-            # And connect to master
-            try:
-                self.r = Redis(host=cluster_info['master_host'], port=cluster_info['master_port'], db=0)
-                result = self.r.delete(key)
-            except Exception as e:
-                self.logger.info("REDISSession: Redis connexion issue")
-                self.logger.exception(e)
-                result = None
-            # Finally restore the backuped cluster
-            self.r = r_backup
-        else:  # If current cluster is Master
-            result = self.r.delete(key)
-        return result
-
+        return self._write("delete", key)
 
     # Write function : need master Redis
     def hdel(self, hash, key):
-        result = None
-        # Get role of current cluster
-        cluster_info = self.r.info()
-        # If current cluster isn't master: get the master
-        if "master" not in cluster_info['role']:
-            # backup current cluster
-            r_backup = self.r
-            # And connect to master
-            try:
-                self.r = Redis(host=cluster_info['master_host'], port=cluster_info['master_port'], db=0)
-                result = self.r.hdel(hash, key)
-            except Exception as e:
-                self.logger.info("REDISSession: Redis connexion issue")
-                self.logger.exception(e)
-                result = None
-            # Finally restore the backuped cluster
-            self.r = r_backup
-        else:  # If current cluster is Master
-            result = self.r.hdel(hash, key)
-        return result
-
+        return self._write("hdel", hash, key)
 
     # Write function : need master Redis
     def set(self, key, value):
-        result = None
-        # Get role of current cluster
-        cluster_info = self.r.info()
-        # If current cluster isn't master: get the master
-        if "master" not in cluster_info['role']:
-            # backup current cluster
-            r_backup = self.r
-            # And connect to master
-            try:
-                self.r = Redis(host=cluster_info['master_host'], port=cluster_info['master_port'], db=0)
-                result = self.r.set(key, value)
-            except Exception as e:
-                self.logger.info("REDISSession: Redis connexion issue")
-                self.logger.exception(e)
-                result = None
-            # Finally restore the backuped cluster
-            self.r = r_backup
-        else:  # If current cluster is Master
-            result = self.r.set(key, value)
-        return result
+        return self._write("set", key, value)
 
 
     # Retrieve function : no need master
@@ -779,52 +830,54 @@ class REDISBase(object):
         return v
 
 
+    # Write function : need master Redis
+    def setex(self, key, ttl, value):
+        return self._write("setex", key, ttl, value)
+
+
+    # Write function : need master Redis
+    def sadd(self, key, *members):
+        return self._write("sadd", key, *members)
+
+
+    # Write function : need master Redis
+    def eval(self, script, keys, args):
+        return self._write("eval", script, len(keys), *keys, *args)
+
+
+    # Write function : need master Redis
+    def zadd(self, key, mapping):
+        return self._write("zadd", key, mapping)
+
+
+    # Write function : need master Redis
+    def zrem(self, key, *members):
+        return self._write("zrem", key, *members)
+
+
+    # Write function : need master Redis
+    def zremrangebyscore(self, key, min, max):
+        return self._write("zremrangebyscore", key, min, max)
+
+
+    # Retrieve function : no need master
+    def zrangebyscore(self, key, min, max):
+        try:
+            v = self.r.zrangebyscore(key, min, max)
+        except Exception as e:
+            self.logger.exception(e)
+            return None
+        return v
+
+
     # Write function : need master Redis
     def expire(self, key, ttl):
-        result = None
-        # Get role of current cluster
-        cluster_info = self.r.info()
-        # If current cluster isn't master: get the master
-        if "master" not in cluster_info['role']:
-            # backup current cluster
-            r_backup = self.r
-            # And connect to master
-            try:
-                self.r = Redis(host=cluster_info['master_host'], port=cluster_info['master_port'], db=0)
-                result = self.r.expire(key, ttl)
-            except Exception as e:
-                self.logger.info("REDISSession: Redis connexion issue")
-                self.logger.exception(e)
-                result = None
-            # Finally restore the backuped cluster
-            self.r = r_backup
-        else:  # If current cluster is Master
-            result = self.r.expire(key, ttl)
-        return result
+        return self._write("expire", key, ttl)
 
 
     # Write function : need master Redis
     def expireat(self, key, ttl):
-        result = None
-        # Get role of current cluster
-        cluster_info = self.r.info()
-        # If current cluster isn't master: get the master
-        if "master" not in cluster_info['role']:
-            # backup current cluster
-            r_backup = self.r
-            # And connect to master
-            try:
-                self.r = Redis(host=cluster_info['master_host'], port=cluster_info['master_port'], db=0)
-                result = self.r.expireat(key, ttl)
-            except Exception as e:
-                self.logger.info("REDISSession: Redis connexion issue")
-                self.logger.exception(e)
-                result = None
-            # Finally restore the backuped cluster
-            self.r = r_backup
-        else:  # If current cluster is Master
-            result = self.r.expireat(key, ttl)
-        return result
+        return self._write("expireat", key, ttl)
 
 
     # Retrieve ttl function : no need master
@@ -841,50 +894,12 @@ class REDISBase(object):
 
     # Write function : need master Redis
     def hset(self, hash, key, value):
-        result = None
-        # Get role of current cluster
-        cluster_info = self.r.info()
-        # If current cluster isn't master: get the master
-        if "master" not in cluster_info['role']:
-            # backup current cluster
-            r_backup = self.r
-            # And connect to master
-            try:
-                self.r = Redis(host=cluster_info['master_host'], port=cluster_info['master_port'], db=0)
-                result = self.r.hset(hash, key, value)
-            except Exception as e:
-                self.logger.info("REDISSession: Redis connexion issue")
-                self.logger.exception(e)
-                result = None
-            # Finally restore the backuped cluster
-            self.r = r_backup
-        else:  # If current cluster is Master
-            result = self.r.hset(hash, key, value)
-        return result
+        return self._write("hset", hash, key, value)
 
 
     # Write function : need master Redis
     def hmset(self, hash, mapping):
-        result = None
-        # Get role of current cluster
-        cluster_info = self.r.info()
-        # If current cluster isn't master: get the master
-        if "master" not in cluster_info['role']:
-            # backup current cluster
-            r_backup = self.r
-            # And connect to master
-            try:
-                self.r = Redis(host=cluster_info['master_host'], port=cluster_info['master_port'], db=0)
-                result = self.r.hmset(hash, mapping)
-            except Exception as e:
-                self.logger.info("REDISSession: Redis connexion issue")
-                self.logger.exception(e)
-                result = None
-            # Finally restore the backuped cluster
-            self.r = r_backup
-        else:  # If current cluster is Master
-            result = self.r.hmset(hash, mapping)
-        return result
+        return self._write("hmset", hash, mapping)
 
 
     # Retrieve function : no need master
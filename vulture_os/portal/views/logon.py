@@ -31,7 +31,8 @@ path.append("/home/vlt-os/vulture_os/portal")
 # Django system imports
 from django.conf                     import settings
 from django.http                     import (HttpResponseRedirect, HttpResponseServerError, HttpResponseForbidden,
-                                             JsonResponse, HttpResponse)
+                                             JsonResponse, HttpResponse, HttpResponseNotModified)
+from django.utils.cache              import patch_cache_control
 from django.utils import timezone
 from django.db.models import Q
 
@@ -44,7 +45,11 @@ from portal.system.sso_forwards      import SSOForwardPOST, SSOForwardBASIC, SSO
 from workflow.models import Workflow
 from authentication.openid.models import OpenIDRepository
 from authentication.user_portal.models import UserAuthentication
-from portal.system.redis_sessions import REDISBase, REDISPortalSession, RedisOpenIDSession, REDISOauth2Session, REDISRefreshSession
+from portal.system.jwt_tokens import (get_access_token_session, issue_access_token, revoke_access_token,
+                                      revoke_token_family, token_family_member)
+from portal.system.openid_config import DISCOVERY_MAX_AGE, get_openid_configuration
+from portal.system.redis_sessions import (REDISBase, REDISPortalSession, RedisOpenIDSession, REDISOauth2Session,
+                                          REDISRefreshSession, REDISTokenFamily)
 from portal.views.responses          import error_response, HttpResponseTemporaryRedirect
 
 # Required exceptions imports
@@ -93,12 +98,6 @@ def validate_portal_cookie(portal_cookie):
 
 
 def openid_configuration(request, portal_id):
-    try:
-        portal = UserAuthentication.objects.get(pk=portal_id)
-    except Exception as e:
-        logger.exception(e)
-        return HttpResponseForbidden()
-
     # Build the callback url
     # Get scheme
     scheme = request.headers['x-forwarded-proto']
@@ -107,7 +106,19 @@ def openid_configuration(request, portal_id):
 
     issuer = "{}://{}".format(scheme, fqdn)
 
-    return JsonResponse(portal.generate_openid_config(issuer))
+    try:
+        _, body, etag = get_openid_configuration(portal_id, issuer)
+    except Exception as e:
+        logger.exception(e)
+        return HttpResponseForbidden()
+
+    if etag in request.headers.get('If-None-Match', ""):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=DISCOVERY_MAX_AGE)
+    return response
 
 
 def openid_start(request, workflow_id, repo_id):
@@ -270,7 +281,12 @@ def openid_callback(request, workflow_id, repo_id):
                                 openid=False) \
                    or authentication.generate_response()
     else:
-        session = RedisOpenIDSession(REDISBase(), f"oauth2_{oauth2_token}")
+        try:
+            session = get_access_token_session(portal.pk, oauth2_token) or \
+                      RedisOpenIDSession(REDISBase(), f"oauth2_{oauth2_token}")
+        except jwt.PyJWTError as e:
+            logger.error(f"PORTAL::openid_callback: Invalid access token: {e}")
+            return error_response(portal, "Invalid access token")
         resp = {
             'access_token': oauth2_token,
             'token_type': "Bearer",
@@ -366,7 +382,7 @@ def openid_token(request, portal_id):
 
     try:
         portal = UserAuthentication.objects.get(pk=portal_id)
-        portal_configuration = portal.generate_openid_config(f"{scheme}://{fqdn}")
+        portal_configuration, _, _ = get_openid_configuration(portal_id, f"{scheme}://{fqdn}")
         logger.debug(f"PORTAL::openid_token:: portal_configuration is {portal_configuration}")
     except UserAuthentication.DoesNotExist:
         logger.error(f"PORTAL::openid_token: could not find a portal with id {portal_id}")
@@ -402,9 +418,15 @@ def openid_token(request, portal_id):
 
         if request.POST.get('grant_type') == "authorization_code":
             session_token = RedisOpenIDSession(REDISBase(), f"token_{request.POST.get('code')}")
-            session = REDISOauth2Session(REDISBase(), f"oauth2_{session_token['access_token']}")
+            assert session_token.exists(), f"Code '{request.POST.get('code')}' doesn't seem to be valid."
 
-            assert session_token.exists() and session.exists(), f"Code '{request.POST.get('code')}' doesn't seem to be valid."
+            # Signed access tokens are verified locally, opaque ones are retrieved from Redis
+            session = get_access_token_session(portal.pk, session_token['access_token'])
+            if session is None:
+                session = REDISOauth2Session(REDISBase(), f"oauth2_{session_token['access_token']}")
+                assert session.exists(), f"Code '{request.POST.get('code')}' doesn't seem to be valid."
+            else:
+                session['token_ttl'] = session['exp'] - session['iat']
 
             # Allow public Single-Page Apps to ommit client_secret if initial authorization request used PKCE
             # So if code_verifier is absent, the client_secret is still required
@@ -451,11 +473,18 @@ def openid_token(request, portal_id):
             if refresh['overridden_by'] != None:
                 logger.error("PORTAL::openid_token: The refresh token provided has been expired.")
 
+                if refresh['family']:
+                    # Delete every token pair in the chain at once
+                    nb_tokens = revoke_token_family(REDISBase(), refresh['family'])
+                    logger.warn(f"PORTAL::openid_token: {nb_tokens} tokens of family {refresh['family']} revoked")
+                    return JsonResponse({'error':"invalid_request", "error_description": "Unknown refresh token."},
+                                        status=400)
+
                 # Delete this invalid refresh token
                 logger.warn(f"PORTAL::openid_token: deleting overridden refresh_token {refresh_token}")
                 refresh.delete()
 
-                # Delete every token pair in the chain
+                # Delete every token pair in the chain, for refresh tokens stored without family
                 while refresh['overridden_by'] != None:
                     refresh_token = refresh['overridden_by']
                     refresh = REDISRefreshSession(REDISBase(), f"refresh_{refresh_token}")
@@ -463,7 +492,7 @@ def openid_token(request, portal_id):
                     if refresh['overridden_by'] == None:
                         # Delete current active access token
                         logger.warn(f"PORTAL::openid_token: invalidating access_token {refresh['access_token']}")
-                        REDISOauth2Session(REDISBase(), f"oauth2_{refresh['access_token']}").delete()
+                        revoke_access_token(REDISBase(), refresh['access_token'])
                     logger.warn(f"PORTAL::openid_token: deleting refresh_token {refresh_token}")
                     refresh.delete()
 
@@ -474,19 +503,26 @@ def openid_token(request, portal_id):
             logger.debug(f"PORTAL::openid_token: Refreshing the session with refresh token: {refresh_token}")
 
             # Get current access_token
-            current_oauth2_session = REDISOauth2Session(REDISBase(), f"oauth2_{refresh['access_token']}")
+            current_oauth2_token = refresh['access_token']
 
-            new_oauth2_token = str(uuid4())
-            new_oauth2_session = REDISOauth2Session(REDISBase(), "oauth2_" + new_oauth2_token)
-            # Use client_id as repo_id to allow linking token to both it's IDP and connector in Vulture
-            new_oauth2_session.register_authentication(
-                str(portal.oauth_client_id),
-                refresh['scope'],
-                portal.oauth_timeout,
-            )
+            if portal.oauth_token_format == "jwt":
+                # Signed access tokens are not stored in Redis
+                new_oauth2_token, new_oauth2_session = issue_access_token(REDISBase(), portal, refresh['scope'])
+                new_oauth2_session['token_ttl'] = new_oauth2_session['exp'] - new_oauth2_session['iat']
+            else:
+                new_oauth2_token = str(uuid4())
+                new_oauth2_session = REDISOauth2Session(REDISBase(), "oauth2_" + new_oauth2_token)
+                # Use client_id as repo_id to allow linking token to both it's IDP and connector in Vulture
+                new_oauth2_session.register_authentication(
+                    str(portal.oauth_client_id),
+                    refresh['scope'],
+                    portal.oauth_timeout,
+                )
 
             new_refresh_token = refresh_token
+            timeout = portal.oauth_timeout * (portal.max_nb_refresh + 1) + 60
             if portal.enable_rotation:
+                family = refresh['family']
                 new_refresh_token = str(uuid4())
                 if portal.max_nb_refresh > 0:
                     refresh['overridden_by'] = new_refresh_token
@@ -497,21 +533,24 @@ def openid_token(request, portal_id):
                 # Grab the new refresh token
                 refresh = REDISRefreshSession(REDISBase(), "refresh_" + new_refresh_token)
 
-                timeout = portal.oauth_timeout * (portal.max_nb_refresh + 1) + 60
-
-                # Write the new token in redis
+                # Write the new token in redis, in the family of the previous one
                 refresh.store_refresh_token(
                     new_oauth2_session['scope'],
                     timeout,
                     new_oauth2_token,
-                    f"portal_{portal_id}"
+                    f"portal_{portal_id}",
+                    family=family,
+                    access_member=token_family_member(new_oauth2_token)
                 )
             else:
                 refresh['access_token'] = new_oauth2_token
                 refresh.write_in_redis()
+                if refresh['family']:
+                    REDISTokenFamily(REDISBase(), refresh['family']).add(timeout, token_family_member(new_oauth2_token))
 
             # Invalidate previous token
-            current_oauth2_session.delete()
+            if current_oauth2_token:
+                revoke_access_token(REDISBase(), current_oauth2_token)
 
             return JsonResponse({
                 'access_token': new_oauth2_token,
@@ -528,6 +567,10 @@ def openid_token(request, portal_id):
     except RedisError as e:
         logger.exception(e)
         return JsonResponse({"error": "internal_error", "error_description": "Session error"}, status=500)
+    except jwt.PyJWTError as e:
+        logger.error(f"PORTAL::openid_token: Invalid access token: {e}")
+        return JsonResponse({'error': "invalid_grant", "error_description": "Invalid access token."},
+                            status=400)
     except AssertionError as e:
         logger.exception(e)
         return JsonResponse({'error':"invalid_request", "error_description": str(e)},
@@ -549,7 +592,10 @@ def openid_userinfo(request, portal_id=None, workflow_id=None):
         if portal_id:
             assert UserAuthentication.objects.filter(pk=portal_id).exists()
         elif workflow_id:
-            assert Workflow.objects.filter(pk=workflow_id).exists()
+            workflow_portals = Workflow.objects.filter(pk=workflow_id).values_list('authentication_id', flat=True)
+            assert workflow_portals
+            # Portal of the workflow, if any, to verify its signed access tokens
+            portal_id = workflow_portals[0]
         else:
             return HttpResponseForbidden()
     except AssertionError:
@@ -566,6 +612,14 @@ def openid_userinfo(request, portal_id=None, workflow_id=None):
         token = request.headers.get('Authorization').replace("Bearer ", "")
         ret = {}
 
+        ## Signed access tokens of the portal, verified without Redis ##
+        if portal_id:
+            session = get_access_token_session(portal_id, token)
+            if session:
+                ret = session['scope']
+                ret.update({'exp': session['exp'], 'iat': session['iat']})
+                return JsonResponse(ret)
+
         ## JWT ##
         try:
             jwt_unverified = jwt.decode(jwt=token, options={"verify_signature": False, "verify_exp": True, "require": ["exp", "iss"]})
@@ -27,28 +27,26 @@ from django.conf import settings
 
 # Django project imports
 from applications.reputation_ctx.models import ReputationContext
-from darwin.policy.models import DarwinPolicy, FilterPolicy, DarwinFilter
+from darwin.policy.models import BufferingState, DarwinPolicy, FilterPolicy, DarwinFilter
 from django.utils.translation import gettext_lazy as _
-from services.rsyslogd.rsyslog import build_conf as rsyslog_build_conf
-from services.rsyslogd.rsyslog import restart_service as rsyslog_restart_service
+from services.rsyslogd.rsyslog import build_confs as rsyslog_build_confs
 from services.service import Service
+from services.darwin.manager_client import DarwinManagerClient
 from services.darwin.models import DarwinSettings
 from system.cluster.models import Cluster
-from system.config.models import write_conf, delete_conf as delete_conf_file
+from system.config.models import write_confs, delete_conf as delete_conf_file
 
 # Required exceptions imports
-from django.core.exceptions import ObjectDoesNotExist
 from json import JSONDecodeError, dumps as json_dumps
 from services.exceptions import ServiceStatusError, ServiceReloadError, ServiceExit
 from system.exceptions import VultureSystemError
-from subprocess import CalledProcessError
 
 # Extern modules imports
+from ast import literal_eval
 from glob import glob as file_glob
-from json import loads as json_loads
 from os import walk as os_walk
+from os.path import exists as path_exists
 from re import compile as re_compile
-from subprocess import check_output, PIPE
 
 # Logger configuration imports
 import logging
@@ -61,6 +59,9 @@ DARWIN_PERMS = "640"
 DARWIN_OWNERS = "darwin:vlt-conf"
 MANAGEMENT_SOCKET = "/var/sockets/darwin/darwin.sock"
 
+# Client of the Darwin manager, which answers one request per connection
+manager_client = DarwinManagerClient(MANAGEMENT_SOCKET)
+
 
 class DarwinService(Service):
     """ Darwin service class wrapper """
@@ -83,31 +84,25 @@ class DarwinService(Service):
         return "Darwin Service"
 
 
-def _send_command(node_logger, command):
-    logger.info("sending command to darwin manager: '{}'".format(command))
+def _send_commands(node_logger, commands):
+    """ Send commands to Darwin manager over one connection
+    :return     The list of JSON replies, or raise ServiceReloadError
+    """
+    logger.info("sending commands to darwin manager: '{}'".format(commands))
     try:
-        """ Try to connect and send command to Darwin manager """
-        cmd_res = check_output(["/usr/bin/nc", "-U", MANAGEMENT_SOCKET],
-                               stderr=PIPE,
-                               input=command.encode('utf8'),
-                               timeout=60).decode('utf8')
+        """ Try to connect and send commands to Darwin manager """
+        replies = manager_client.commands(commands)
         node_logger.info("Connection to darwin management socket succeed.")
+        return replies
+    except JSONDecodeError as e:
         """ Darwin manager always answer in JSON """
-        try:
-            json_res = json_loads(cmd_res)
-        except JSONDecodeError:
-            raise ServiceReloadError("Darwin manager response is not a valid JSON", "Darwin",
-                                        traceback=cmd_res)
+        raise ServiceReloadError("Darwin manager response is not a valid JSON", "Darwin", traceback=e.doc)
+    except OSError as e:
+        raise ServiceReloadError("Failed to connect to darwin management socket.", "Darwin", traceback=str(e))
 
-        return json_res
-
-    except CalledProcessError as e:
-        """ Return code != 0 """
-        stdout = e.stdout.decode('utf8')
-        stderr = e.stderr.decode('utf8')
-        raise ServiceReloadError("Failed to connect to darwin management socket.", "Darwin",
-                                    traceback=(stderr or stdout))
 
+def _send_command(node_logger, command):
+    return _send_commands(node_logger, [command])[0]
 
 
 def get_darwin_sockets():
@@ -153,38 +148,42 @@ def reload_policy_filters(node_logger, policy_id):
 
 
 def reload_all(node_logger):
-    """ Triggers a rewrite of all filters' configuration file, main configuration file and reload all filters
+    """ Triggers a rewrite of all filters' configuration file and main configuration file,
+         Rsyslog and Darwin are restarted only if their configuration changed
     """
     logger.info("Darwin::reload_all:: Reloading all Darwin configuration")
     this_node = Cluster.get_current_node()
 
-    # Reload every filter's config file
-    for policy in DarwinPolicy.objects.all().only("id"):
+    # Rewrite changed filters' config files
+    changed_filters = []
+    frontend_ids = set()
+    for policy in DarwinPolicy.objects.all().only("id", "name"):
         try:
             logger.debug("Darwin::reload_all:: updating configuration files for policy {}".format(policy.id))
-            write_policy_conf(node_logger, policy.id)
-            logger.info("Darwin::reload_all:: Regenerating configuration for associated Listeners...")
-            # SHOULD always be the case (should is key here)
-            if this_node is not None:
-                for frontend in policy.frontend_set.all():
-                    if this_node in frontend.get_nodes():
-                        rsyslog_build_conf(node_logger, frontend.pk)
-                logger.info("Darwin::reload_all:: Successfully updated configuration files")
-            else:
-                logger.error("Darwin::reload_all:: Couldn't get current node, cannot update Rsyslog configuration files")
+            result, changed, deleted = _write_policy_conf(node_logger, policy)
+            changed_filters.extend(changed + deleted)
         except VultureSystemError as e:
             logger.error("Darwin::reload_all:: error while reloading policy {} : {}".format(policy.id, e))
-            continue
 
-    # Restart Rsyslog
-    logger.info("Darwin::reload_all:: Restarting Rsyslog")
-    rsyslog_restart_service(node_logger)
+        # Rsyslog confs may be stale for other reasons (links to frontends, bufferings, templates...) :
+        #  all frontends are rebuilt, build_confs only writes changed files and restarts Rsyslog on changes
+        # SHOULD always be the case (should is key here)
+        if this_node is not None:
+            frontend_ids.update(frontend.pk for frontend in policy.frontend_set.all()
+                                if this_node in frontend.get_nodes())
+        else:
+            logger.error("Darwin::reload_all:: Couldn't get current node, cannot update Rsyslog configuration files")
 
-    # Reload the main Darwin configuration (don't update filters yet)
-    logger.info("Darwin::reload_all:: rewriting main configuration file")
-    reload_conf(node_logger)
+    # Regenerate configuration of associated Listeners, each frontend once, Rsyslog is restarted if needed
+    if frontend_ids:
+        logger.info("Darwin::reload_all:: Regenerating configuration for associated Listeners...")
+        node_logger.info(rsyslog_build_confs(node_logger, list(frontend_ids)))
 
-    return restart_service(node_logger)
+    # Rewrite the main Darwin configuration
+    logger.info("Darwin::reload_all:: rewriting main configuration file")
+    if DarwinService().reload_conf() or changed_filters:
+        return restart_service(node_logger)
+    return "Darwin configuration has not changed"
 
 
 def delete_filter_conf(node_logger, filter_conf_path):
@@ -214,44 +213,44 @@ def delete_filter_conf(node_logger, filter_conf_path):
     return result
 
 
-def write_policy_conf(node_logger, policy_id):
-    """ Writes all enabled filters' configuration in a policy
-        Also deletes configuration files of all previously enabled filters in the policy
+def _read_conf(conf_path):
+    """ Return the content of a configuration file, None if it cannot be read """
+    try:
+        with open(conf_path, encoding="utf8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_policy_conf(node_logger, policy):
+    """ Writes the configuration of the enabled filters of a policy which changed,
+         and deletes the configuration files of its disabled filters
+    :return     (result, names of the filters whose configuration has been written,
+                 names of the filters whose configuration has been deleted), or raise VultureSystemError
     """
     error = False
     result = ""
-    try:
-        policy = DarwinPolicy.objects.get(pk=policy_id)
-    except DarwinPolicy.DoesNotExist:
-        raise VultureSystemError("Could not get policy with id {}".format(policy_id), "write Darwin configuration files for a policy")
     logger.info("writing policy conf '{}'".format(policy.name))
 
-    for filter_instance in policy.filterpolicy_set.all():
+    files = []
+    changed = []
+    deleted = []
+    filter_instances = list(policy.filterpolicy_set.all())
+    # Bufferings of the buffer filters of the policy, loaded once
+    buffer_filter_ids = [f.pk for f in filter_instances if f.filter_type.name == "bufr"]
+    buffering_state = BufferingState(buffer_filter_ids=buffer_filter_ids) if buffer_filter_ids else None
+    for filter_instance in filter_instances:
 
         if filter_instance.enabled and filter_instance.filter_type.is_launchable:
-            logger.info("writing filter '{}' conf".format(filter_instance.name))
-
-            try:
-                write_conf(
-                    node_logger,
-                    [
-                        filter_instance.conf_path,
-                        "{}\n".format(filter_instance.conf_to_json()),
-                        DARWIN_OWNERS, DARWIN_PERMS
-                    ]
-                )
-            except ServiceExit:
-                raise
-            except Exception as e:
-                logger.error("Darwin::write_policy_conf:: error while writing conf: {}".format(e))
-                logger.critical(e, exc_info=1)
-                result += "error while writing file '{}': {}\n".format(filter_instance.conf_path, e)
-                error = True
+            content = "{}\n".format(filter_instance.conf_to_json(buffering_state=buffering_state))
+            if _read_conf(filter_instance.conf_path) == content:
+                logger.debug("filter '{}' conf has not changed".format(filter_instance.name))
                 continue
+            logger.info("writing filter '{}' conf".format(filter_instance.name))
+            files.append([filter_instance.conf_path, content, DARWIN_OWNERS, DARWIN_PERMS])
+            changed.append(filter_instance.name)
 
-            result += "\nSuccessfully wrote file '{}'".format(filter_instance.conf_path)
-
-        else:
+        elif path_exists(filter_instance.conf_path):
             logger.info("filter '{}' not enabled, deleting conf".format(filter_instance.name))
 
             try:
@@ -259,17 +258,55 @@ def write_policy_conf(node_logger, policy_id):
                     node_logger,
                     filter_instance.conf_path
                 )
+                deleted.append(filter_instance.name)
             except ServiceExit:
                 raise
             except Exception as e:
                 if "No such file or directory" in str(e):
                     node_logger.info("File '{}' already deleted".format(filter_instance.conf_path))
+                    deleted.append(filter_instance.name)
                 else:
                     result += "Failed to delete configuration file '{}' : {}\n".format(filter_instance.conf_path, e)
                     error = True
 
+    if files:
+        try:
+            write_confs(node_logger, files)
+            result += "".join("\nSuccessfully wrote file '{}'".format(f[0]) for f in files)
+        except ServiceExit:
+            raise
+        except Exception as e:
+            logger.error("Darwin::write_policy_conf:: error while writing conf: {}".format(e))
+            logger.critical(e, exc_info=1)
+            result += "error while writing files {}: {}\n".format([f[0] for f in files], e)
+            error = True
+
     if error:
-        raise VultureSystemError(result, "write Darwin configuration files for policy {}".format(policy_id))
+        raise VultureSystemError(result, "write Darwin configuration files for policy {}".format(policy.pk))
+    return result, changed, deleted
+
+
+def write_policy_conf(node_logger, policy_id):
+    """ Writes the changed configuration of enabled filters in a policy, and hot-reloads these filters
+        Also deletes configuration files of all previously enabled filters in the policy
+    """
+    try:
+        policy = DarwinPolicy.objects.get(pk=policy_id)
+    except DarwinPolicy.DoesNotExist:
+        raise VultureSystemError("Could not get policy with id {}".format(policy_id), "write Darwin configuration files for a policy")
+
+    result, changed, deleted = _write_policy_conf(node_logger, policy)
+    if changed:
+        # New filters are not known by the manager until darwin.conf is reloaded (reload_conf), do not raise
+        try:
+            replies = _send_commands(node_logger, [{'type': "update_filters", 'filters': [name]} for name in changed])
+        except ServiceReloadError as e:
+            node_logger.error("Cannot reload Darwin filters {}: {}".format(changed, e))
+            return result
+        for name, reply in zip(changed, replies):
+            if reply.get('status') != "OK":
+                node_logger.info("Darwin filter '{}' not updated: {}".format(name, reply.get('errors', '')))
+        result += "\nFilters reloaded: {}".format(", ".join(changed))
     return result
 
 
@@ -278,19 +315,32 @@ def update_filter(node_logger, filter_id):
          Only used when an attribute of a filter has been modified
           (for example the log level)
     """
-    try:
-        darwin_filter = FilterPolicy.objects.get(pk=filter_id)
-    except ObjectDoesNotExist:
-        raise ServiceReloadError("DarwinFilter with id {} not found".format(filter_id), "Darwin")
+    return update_filters(node_logger, [filter_id])
 
-    reply = _send_command(node_logger, "{{\"type\": \"update_filters\", " \
-        "\"filters\": [\"{}\"]}}\n".format(darwin_filter.name))
-    if reply.get('status') == "KO":
+
+def update_filters(node_logger, filter_ids):
+    """ Hot update of several Darwin filters, over one connection to the management unix socket
+    """
+    # The list is casted to string by asynchronous api
+    if isinstance(filter_ids, str):
+        filter_ids = literal_eval(filter_ids)
+
+    darwin_filters = list(FilterPolicy.objects.filter(pk__in=filter_ids).only('name'))
+    if len(darwin_filters) != len(set(filter_ids)):
+        missing = set(filter_ids) - {darwin_filter.pk for darwin_filter in darwin_filters}
+        raise ServiceReloadError("DarwinFilter with id {} not found".format(", ".join(map(str, missing))), "Darwin")
+
+    replies = _send_commands(node_logger, [{'type': "update_filters", 'filters': [darwin_filter.name]}
+                                           for darwin_filter in darwin_filters])
+    result = ""
+    for darwin_filter, reply in zip(darwin_filters, replies):
+        if reply.get('status') == "KO":
             raise ServiceReloadError("Darwin manager failed to update filter '{}': {}".format(darwin_filter.name, reply.get('errors', '')), "Darwin")
-    elif reply.get('status') != "OK":
-        raise ServiceReloadError("Darwin manager returned an unexpected result: {}".format(reply.get('errors', ''), "Darwin"))
-    node_logger.info("Darwin filter '{}' hot update successful.".format(darwin_filter.name))
-    return "Darwin filter '{}' hot update successful.".format(darwin_filter.name)
+        elif reply.get('status') != "OK":
+            raise ServiceReloadError("Darwin manager returned an unexpected result: {}".format(reply.get('errors', '')), "Darwin")
+        node_logger.info("Darwin filter '{}' hot update successful.".format(darwin_filter.name))
+        result += "Darwin filter '{}' hot update successful.\n".format(darwin_filter.name)
+    return result.rstrip("\n")
 
 
 def monitor_filters():
@@ -299,27 +349,17 @@ def monitor_filters():
     """
     try:
         """ Connect to Darwin manager and try to monitor filters """
-        cmd_res = check_output(["/usr/bin/nc", "-U", MANAGEMENT_SOCKET],
-                               stderr=PIPE,
-                               input="{\"type\": \"monitor\"}\n".encode('utf8'),
-                               timeout=20).decode('utf8')
-        logger.debug("Connection to darwin management socket succeed.")
-        """ Darwin manager always answer in JSON """
-        try:
-            json_res = json_loads(cmd_res)
-        except JSONDecodeError:
-            # Do NOT set traceback, it will be retrieved from JSON exception
-            raise ServiceStatusError("Darwin manager response is not a valid JSON : '{}'".format(cmd_res), "darwin")
-
+        json_res = manager_client.command({'type': "monitor"}, timeout=20)
         logger.debug("Darwin manager response decoded.")
         return json_res
 
-    except CalledProcessError as e:
-        """ Return code != 0 """
-        stdout = e.stdout.decode('utf8')
-        stderr = e.stderr.decode('utf8')
+    except JSONDecodeError as e:
+        """ Darwin manager always answer in JSON """
+        # Do NOT set traceback, it will be retrieved from JSON exception
+        raise ServiceStatusError("Darwin manager response is not a valid JSON : '{}'".format(e.doc), "darwin")
+    except OSError as e:
         raise ServiceStatusError("Failed to connect to darwin management socket.",
-                                 "darwin", traceback=(stderr or stdout))
+                                 "darwin", traceback=str(e))
 
 
 def restart_service(node_logger):
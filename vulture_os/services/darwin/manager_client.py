@@ -0,0 +1,167 @@
+#!/home/vlt-os/env/bin/python
+"""This file is part of Vulture OS.
+
+Vulture OS is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Vulture OS is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Vulture OS.  If not, see http://www.gnu.org/licenses/.
+"""
+__author__ = "Vulture OS"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "4.0.0"
+__maintainer__ = "Vulture OS"
+__email__ = "contact@vultureproject.org"
+__doc__ = 'Client of the Darwin manager management socket'
+
+# Django system imports
+
+# Django project imports
+
+# Required exceptions imports
+from json import JSONDecodeError
+
+# Extern modules imports
+from codecs import getincrementaldecoder
+from json import JSONDecoder, dumps as json_dumps
+from threading import Lock
+import socket
+
+# Logger configuration imports
+import logging
+logger = logging.getLogger('services')
+
+
+RECV_SIZE = 65536
+
+
+class DarwinManagerClient:
+    """ Client of the Darwin manager
+    Commands are JSON objects, replies are decoded incrementally from the stream, one JSON value per line.
+    Each command is sent once the previous reply is received : the manager reads a request at once.
+    The manager answers one request per connection, so by default a connection is opened for each command.
+    With keep_alive, the connection is kept between commands, until the manager closes one : it does not
+     serve more than one request then, and keep_alive is disabled.
+    Only depends on the socket path : it can be used against any fake manager listening on a unix socket
+    """
+
+    def __init__(self, socket_path, timeout=60, keep_alive=False):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._sock = None
+        self._buffer = ""
+        self._utf8 = None
+        self._lock = Lock()
+        self._decoder = JSONDecoder()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def connect(self):
+        """ Open a new connection to the manager, raise OSError on failure """
+        self.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._buffer = ""
+        self._utf8 = getincrementaldecoder("utf8")()
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._buffer = ""
+
+    def command(self, command, timeout=None):
+        """ Send a command and return the decoded reply
+        :param command: dict, or JSON string
+        :param timeout: Seconds to wait for the reply, self.timeout by default
+        :return     The decoded reply, or raise OSError (connection failure, timeout) or JSONDecodeError
+        """
+        return self.commands([command], timeout=timeout)[0]
+
+    def commands(self, commands, timeout=None):
+        """ Send several commands over the same connection
+        :return     The list of decoded replies, in the order of the commands
+        """
+        with self._lock:
+            return [self._exchange(command, timeout or self.timeout) for command in commands]
+
+    def _exchange(self, command, timeout):
+        payload = "{}\n".format((command if isinstance(command, str) else json_dumps(command)).strip())
+        # A kept connection may have been closed by the manager since the last command :
+        #  the command is sent again on a new connection, only if it could not be sent at all
+        kept = self._sock is not None
+        if not kept:
+            self.connect()
+        self._sock.settimeout(timeout)
+        try:
+            self._sock.sendall(payload.encode('utf8'))
+        except OSError:
+            self.close()
+            if not kept:
+                raise
+            logger.info("Darwin manager closed the connection, it is not kept anymore")
+            self.keep_alive = False
+            self.connect()
+            self._sock.settimeout(timeout)
+            try:
+                self._sock.sendall(payload.encode('utf8'))
+            except OSError:
+                self.close()
+                raise
+
+        try:
+            reply = self._read_reply()
+        except (OSError, JSONDecodeError):
+            self.close()
+            raise
+        if reply is None:
+            self.close()
+            raise ConnectionError("Darwin manager closed the connection without reply")
+        if not self.keep_alive:
+            self.close()
+        return reply
+
+    def _read_reply(self):
+        """ Read the next JSON value of the stream
+        :return     The decoded value, or None if the connection is closed before any data
+        """
+        while True:
+            text = self._buffer.lstrip()
+            if text:
+                try:
+                    reply, end = self._decoder.raw_decode(text)
+                    self._buffer = text[end:]
+                    return reply
+                except JSONDecodeError as e:
+                    # Incomplete, unless a whole line has been received : do not wait for the timeout
+                    if "\n" in text:
+                        raise JSONDecodeError("Darwin manager response is not a valid JSON", text, e.pos)
+            chunk = self._sock.recv(RECV_SIZE)
+            if not chunk:
+                self._buffer += self._utf8.decode(b"", final=True)
+                if self._buffer.strip():
+                    raise JSONDecodeError("Darwin manager response is not a valid JSON", self._buffer, 0)
+                return None
+            self._buffer += self._utf8.decode(chunk)
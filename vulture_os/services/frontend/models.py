@@ -28,7 +28,7 @@ from uuid import uuid4
 import datetime
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.template import Context, Template as JinjaTemplate
+from django.template import Context
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.forms.models import model_to_dict
@@ -38,6 +38,7 @@ from djongo import models
 from applications.logfwd.models import LogOM, LogOMMongoDB
 from applications.reputation_ctx.models import ReputationContext, DATABASES_PATH
 from darwin.policy.models import DarwinPolicy, FilterPolicy, DarwinBuffering
+from services.frontend.render_context import generate_log_om_conf, log_condition_names, log_condition_template
 from services.haproxy.haproxy import test_haproxy_conf, HAPROXY_OWNER, HAPROXY_PATH, HAPROXY_PERMS
 from system.error_templates.models import ErrorTemplate
 from system.cluster.models import Cluster, NetworkAddress, NetworkInterfaceCard, Node
@@ -48,8 +49,9 @@ from toolkit.http.headers import Header
 from system.tenants.models import Tenants
 
 # Extern modules imports
+from copy import copy
+from hashlib import sha1
 from jinja2 import Environment, FileSystemLoader
-from re import search as re_search
 from requests import post
 import glob
 
@@ -1376,8 +1378,9 @@ class Frontend(models.Model):
             'additional_infos': additional_infos
         }
 
-    def to_template(self, listener_list=[], header_list=None, node=None):
+    def to_template(self, listener_list=[], header_list=None, node=None, render_context=None):
         """ Dictionary used to create configuration file
+        :param render_context: FrontendRenderContext with the relations of this frontend already loaded
 
         :return     Dictionnary of configuration parameters
         """
@@ -1387,14 +1390,17 @@ class Frontend(models.Model):
         if not listener_list and self.pk:
             # Retrieve listeners into database
             # No .only ! Used to generated conf, neither str, we need the whole object
-            if node:
-                listener_list = self.listener_set.filter(network_address__nic__node=node)
+            if render_context:
+                listener_list = render_context.listeners.get(self.pk, [])
+            elif node:
+                listener_list = self.listener_set.filter(network_address__nic__node=node).order_by('pk')
             else:
-                listener_list = self.listener_set.all()
+                listener_list = self.listener_set.all().order_by('pk')
 
         # Same for headers
         if not header_list:
-            header_list = self.headers.all()
+            header_list = render_context.headers.get(self.pk, []) if render_context \
+                else self.headers.all().order_by('pk')
 
 
         reputation_database_v4 = None
@@ -1414,12 +1420,16 @@ class Frontend(models.Model):
         reputation_ctxs = []
         # Test self.pk to prevent M2M errors when object isn't saved in DB
         if self.enable_logging and self.pk:
-            for reputation_ctx in self.frontendreputationcontext_set.filter(enabled=True):
-                reputation_ctxs.append(reputation_ctx)
+            if render_context:
+                reputation_ctxs = render_context.reputation_ctxs.get(self.pk, [])
+            else:
+                reputation_ctxs = list(self.frontendreputationcontext_set.filter(enabled=True).order_by('pk'))
 
         workflow_list = []
         if self.pk:
-            for w in self.workflow_set.filter(enabled=True):
+            workflows = render_context.workflows.get(self.pk, []) if render_context \
+                else self.workflow_set.filter(enabled=True).order_by('pk')
+            for w in workflows:
                 workflow_list.append({
                     'id': w.pk,
                     'name': w.name,
@@ -1467,14 +1477,16 @@ class Frontend(models.Model):
             'reputation_database_v6': reputation_database_v6,
             'geoip_database': geoip_database,
             'reputation_ctxs': reputation_ctxs,
-            'workflows': sorted(workflow_list, reverse=True, key=lambda x: len(x['public_dir'].split('/'))),
+            # Deepest public_dir first, ties keep a stable order so that the rendering does not change between calls
+            'workflows': sorted(workflow_list, key=lambda x: (-len(x['public_dir'].split('/')), x['id'])),
             'JAIL_ADDRESSES': JAIL_ADDRESSES,
             'CONF_PATH': HAPROXY_PATH,
             'tags': self.tags,
             'nb_workers': self.nb_workers,
             'mmdb_cache_size': self.mmdb_cache_size,
             'redis_batch_size': self.redis_batch_size,
-            'darwin_filters': FilterPolicy.objects.filter(policy__in=self.darwin_policies.all()),
+            'darwin_filters': render_context.get_darwin_filters(self) if render_context
+            else FilterPolicy.objects.filter(policy__in=self.darwin_policies.all()).order_by('pk'),
             'keep_source_fields': self.keep_source_fields,
             'darwin_mode': self.darwin_mode,
             'tenants_config': self.tenants_config,
@@ -1482,14 +1494,17 @@ class Frontend(models.Model):
             'filebeat_config': self.filebeat_config,
             'filebeat_listening_mode': self.filebeat_listening_mode,
             # Test self.pk to prevent M2M errors when object isn't saved in DB
-            'external_idps': self.userauthentication_set.filter(enable_external=True) if self.pk else [],
+            'external_idps': render_context.external_idps.get(self.pk, []) if render_context
+            else self.userauthentication_set.filter(enable_external=True).order_by('pk') if self.pk else [],
         }
 
         """ And returns the attributes of the class """
         return result
 
-    def generate_conf(self, listener_list=None, header_list=None, node=None):
+    def generate_conf(self, listener_list=None, header_list=None, node=None, global_config=None, render_context=None):
         """ Render the conf with Jinja template and self.to_template() method
+        :param global_config: Cluster global Config, fetched if not given (shared when rendering several frontends)
+        :param render_context: FrontendRenderContext of the rendering pass, if any
         :return     The generated configuration as string, or raise
         """
         """ If no HAProxy conf - Rsyslog only conf """
@@ -1502,8 +1517,9 @@ class Frontend(models.Model):
             template = jinja2_env.get_template(JINJA_TEMPLATE)
             return template.render({'conf': self.to_template(listener_list=listener_list,
                                                              header_list=header_list,
-                                                             node=node),
-                                    'global_config': Cluster.get_global_config().to_dict()})
+                                                             node=node,
+                                                             render_context=render_context),
+                                    'global_config': (global_config or Cluster.get_global_config()).to_dict()})
         # In ALL exceptions, associate an error message
         # The exception instantiation MUST be IN except statement, to retrieve traceback in __init__
         except TemplateNotFound:
@@ -1613,37 +1629,46 @@ class Frontend(models.Model):
             logger.error(e, exc_info=1)
             raise VultureSystemConfigError("on node '{}'.\nRequest failure.".format(node.name))
 
-    def render_log_condition(self):
+    def render_log_condition(self, render_context=None):
         log_oms = {}
         clean_log_condition = self.log_condition
-        for line in self.log_condition.split('\n'):
-            if line.count('{') < 2:
-                continue
-            match = re_search("{{([^}]+)}}", line)
-            if match:
-                log_om = LogOM().select_log_om_by_name(match.group(1))
-                if log_om.enabled:
-                    if log_om.internal and isinstance(log_om, LogOMMongoDB):
-                        log_om.collection = self.ruleset
-                    # Ensure variable names don't have a '-' character (and only those variables)
-                    clean_log_condition = self.log_condition.replace(match.group(1), match.group(1).replace('-','_'))
-                    log_oms[match.group(1).replace('-','_')] = LogOM.generate_conf(log_om, self.ruleset, frontend=self.name)
-                    logger.info("Configuration of Log Forwarder named '{}' generated.".format(log_om.name))
+        # A Log Forwarder used several times is generated once
+        log_om_confs = render_context.log_om_confs if render_context else {}
+        for name in log_condition_names(self.log_condition):
+            if render_context:
+                log_om = render_context.get_log_om_by_name(name)
+            else:
+                log_om = LogOM().select_log_om_by_name(name)
+            if log_om.enabled:
+                if log_om.internal and isinstance(log_om, LogOMMongoDB):
+                    # Forwarders of a render context are shared by all its frontends
+                    log_om = copy(log_om)
+                    log_om.collection = self.ruleset
+                # Ensure variable names don't have a '-' character (and only those variables)
+                clean_log_condition = self.log_condition.replace(name, name.replace('-','_'))
+                log_oms[name.replace('-','_')] = generate_log_om_conf(log_om, self.ruleset, self.name, log_om_confs)
+                logger.info("Configuration of Log Forwarder named '{}' generated.".format(log_om.name))
         internal_ruleset = ""
 
-        tpl = JinjaTemplate(clean_log_condition)
+        tpl = log_condition_template(clean_log_condition)
         return internal_ruleset + "\n\n" + tpl.render(Context(log_oms, autoescape=False)) + "\n"
 
-    def render_log_condition_failure(self):
+    def render_log_condition_failure(self, render_context=None):
         """ Render log_forwarders' config from self.log_forwarders_parse_failure
             & Associate the correct template depending on parser
         :return  Str containing the rendered config
         """
         result = ""
-        for log_forwarder in self.log_forwarders_parse_failure.all().only('id'):
-            log_om = LogOM().select_log_om(log_forwarder.id)
+        if render_context:
+            log_om_ids = render_context.log_forwarders_parse_failure.get(self.pk, [])
+        else:
+            log_om_ids = [log_forwarder.id for log_forwarder in self.log_forwarders_parse_failure.all().only('id')]
+        log_om_confs = render_context.log_om_confs if render_context else {}
+        for log_om_id in log_om_ids:
+            log_om = render_context.get_log_om(log_om_id) if render_context else LogOM().select_log_om(log_om_id)
             if log_om.enabled:
-                result += LogOM.generate_conf(log_om, self.ruleset+"_garbage", frontend=self.name+"_garbage") + "\n"
+                result += generate_log_om_conf(log_om, self.ruleset+"_garbage", self.name+"_garbage",
+                                               log_om_confs) + "\n"
         return result
 
     @property
@@ -1668,8 +1693,11 @@ class Frontend(models.Model):
 
         return conf['filebeat_config']
 
-    def generate_rsyslog_conf(self):
+    def generate_rsyslog_conf(self, node=None, global_config=None, render_context=None):
         """ Generate rsyslog configuration of this frontend
+        :param node: Current node, and global_config: Cluster global Config,
+                     fetched if not given (shared when rendering several frontends)
+        :param render_context: FrontendRenderContext of the rendering pass, if any
         """
         # Import here to prevent populate reetrant issues
         from services.rsyslogd.rsyslog import JINJA_PATH as JINJA_RSYSLOG_PATH
@@ -1678,14 +1706,19 @@ class Frontend(models.Model):
         try:
             jinja2_env = Environment(loader=FileSystemLoader(JINJA_RSYSLOG_PATH))
             template = jinja2_env.get_template(template_name)
-            conf = self.to_template()
+            conf = self.to_template(render_context=render_context)
             conf['ruleset'] = self.ruleset
-            conf['log_condition'] = self.render_log_condition() if self.enabled and self.enable_logging else ""
-            conf['log_condition_failure'] = self.render_log_condition_failure() if self.enabled and self.enable_logging else ""
-            conf['not_internal_forwarders'] = self.log_forwarders.exclude(internal=True)
+            conf['log_condition'] = self.render_log_condition(render_context) if self.enabled and self.enable_logging else ""
+            conf['log_condition_failure'] = self.render_log_condition_failure(render_context) if self.enabled and self.enable_logging else ""
+            if render_context:
+                conf['not_internal_forwarders'] = render_context.not_internal_forwarders.get(self.pk, [])
+                darwin_filters = render_context.get_darwin_filters(self, enabled_only=True)
+            else:
+                conf['not_internal_forwarders'] = self.log_forwarders.exclude(internal=True)
+                darwin_filters = FilterPolicy.objects.filter(policy__in=self.darwin_policies.all(), enabled=True)
 
             darwin_actions = []
-            for darwin_filter in FilterPolicy.objects.filter(policy__in=self.darwin_policies.all(), enabled=True):
+            for darwin_filter in darwin_filters:
                 if not darwin_filter.filter_type.is_launchable:
                     continue
 
@@ -1700,9 +1733,14 @@ class Frontend(models.Model):
                 # - enrichment should be disabled
                 # - socket should point to related buffer filter
                 # - inputs should include buffer source
-                if darwin_filter.buffering.exists():
+                if render_context:
+                    buffering = render_context.get_buffering(darwin_filter)
+                elif darwin_filter.buffering.exists():
                     # shouldn't raise, but exceptions are handled at the end of the function anyway
                     buffering = darwin_filter.buffering.get()
+                else:
+                    buffering = None
+                if buffering:
                     action['disable_enrichment'] = True
                     action['buffer_source'] = "{}_{}_{}".format(buffering.destination_filter.name, self.name, buffering.destination_filter.policy.id)
                     action['filter_socket'] = buffering.buffer_filter.socket_path
@@ -1722,8 +1760,8 @@ class Frontend(models.Model):
                 darwin_actions.append(action)
 
             return template.render({'frontend': conf,
-                                    'node': Cluster.get_current_node(),
-                                    'global_config': Cluster.get_global_config(),
+                                    'node': node or Cluster.get_current_node(),
+                                    'global_config': global_config or Cluster.get_global_config(),
                                     'darwin_actions': darwin_actions})
         # In ALL exceptions, associate an error message
         # The exception instantiation MUST be IN except statement, to retrieve traceback in __init__
@@ -1825,6 +1863,42 @@ class Frontend(models.Model):
 
         return result
 
+    @staticmethod
+    def reload_confs(frontends):
+        """ Generate conf of several frontends on their nodes,
+         with one request per node that reloads HAProxy at most once
+        :return     The set of updated nodes
+        """
+        frontends_by_node = {}
+        for frontend in frontends:
+            for node in frontend.get_nodes():
+                frontends_by_node.setdefault(node, []).append(frontend.pk)
+
+        for node, frontend_ids in frontends_by_node.items():
+            api_res = node.api_request("services.haproxy.haproxy.build_confs", frontend_ids)
+            if not api_res.get('status'):
+                logger.error(f"[FRONTEND] API error while trying to reload confs on {node.name} : "
+                             f"{api_res.get('message')}")
+        return set(frontends_by_node)
+
+    @staticmethod
+    def reload_rsyslog_confs(frontends):
+        """ Rebuild the rsyslog conf of frontends on their nodes,
+         with one request per node that restarts Rsyslog at most once
+        :return     The set of updated nodes
+        """
+        frontends_by_node = {}
+        for frontend in frontends:
+            for node in frontend.get_nodes():
+                frontends_by_node.setdefault(node, []).append(frontend.pk)
+
+        for node, frontend_ids in frontends_by_node.items():
+            api_res = node.api_request("services.rsyslogd.rsyslog.build_confs", frontend_ids)
+            if not api_res.get('status'):
+                logger.error(f"[FRONTEND] API error while trying to reload rsyslog confs on {node.name} : "
+                             f"{api_res.get('message')}")
+        return set(frontends_by_node)
+
     def reload_conf(self):
         """ Generate conf based on MongoDB data and save-it on concerned nodes
          :return  A set of the updated nodes or raise a ServiceError or SystemError
@@ -2229,6 +2303,11 @@ class BlacklistWhitelist(models.Model):
     type_rule = models.TextField(default="blacklist")
     name = models.TextField(default="")
 
+    def get_acl_name(self, index, condition):
+        """ Return a stable name for the index-th ACL of this rule """
+        digest = sha1("{}:{}:{}".format(self.pk, index, condition).encode('utf8')).hexdigest()
+        return "acl_{}".format(digest[:16])
+
     def generate_conf(self):
         rules = json.loads(self.rule)
 
@@ -2286,49 +2365,19 @@ class BlacklistWhitelist(models.Model):
         if len(condition_list) <= 0:
             return ""
 
-        acl_name = "acl_"
-        acl_name_list = []
-        current_acl_name = "{}{}".format(acl_name, str(uuid4()))
-        acl_name_list.append(current_acl_name)
+        # ACL names are derived from the rule and its conditions : same rule, same configuration
+        acl_name_list = [self.get_acl_name(index, condition_tuple[0])
+                         for index, condition_tuple in enumerate(condition_list)]
         acl_str = ""
         spaces = "    "
 
-        if mode == "$or":
-            for condition_tuple in condition_list:
-                acl_str += "acl {} {}\n{}".format(current_acl_name, condition_tuple[0], spaces)
-                current_acl_name = "{}{}".format(acl_name, str(uuid4()))
-                acl_name_list.append(current_acl_name)
-
-            acl_str += "http-request deny if"
-            condition_size = len(condition_list)
-
-            for index in range(condition_size):
-                inversion = ""
-
-                if condition_list[index][1]:
-                    inversion = "!"
-
-                if index > 0:
-                    acl_str += " or {}{}".format(inversion, acl_name_list[index])
-                else:
-                    acl_str += " {}{}".format(inversion, acl_name_list[index])
-
-        else:
-            for condition_tuple in condition_list:
-                acl_str += "acl {} {}\n{}".format(current_acl_name, condition_tuple[0], spaces)
-                current_acl_name = "{}{}".format(acl_name, str(uuid4()))
-                acl_name_list.append(current_acl_name)
-
-            acl_str += "http-request deny if"
-            condition_size = len(condition_list)
-
-            for index in range(condition_size):
-                inversion = ""
-
-                if condition_list[index][1]:
-                    inversion = "!"
+        for current_acl_name, condition_tuple in zip(acl_name_list, condition_list):
+            acl_str += "acl {} {}\n{}".format(current_acl_name, condition_tuple[0], spaces)
 
-                acl_str += " {}{}".format(inversion, acl_name_list[index])
+        acl_str += "http-request deny if"
+        separator = " or " if mode == "$or" else " "
+        acl_str += " " + separator.join("{}{}".format("!" if condition_tuple[1] else "", current_acl_name)
+                                        for current_acl_name, condition_tuple in zip(acl_name_list, condition_list))
 
         return acl_str
 
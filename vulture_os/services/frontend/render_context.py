@@ -0,0 +1,260 @@
+#!/home/vlt-os/env/bin/python
+"""This file is part of Vulture OS.
+
+Vulture OS is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Vulture OS is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Vulture OS.  If not, see http://www.gnu.org/licenses/.
+"""
+__author__ = "Vulture OS"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "4.0.0"
+__maintainer__ = "Vulture OS"
+__email__ = "contact@vultureproject.org"
+__doc__ = 'Relations of frontends bulk-loaded once for a configuration pass'
+
+# Django system imports
+from django.conf import settings
+from django.template import Template as JinjaTemplate
+
+# Django project imports
+from applications.logfwd.models import LogOM
+from applications.reputation_ctx.models import ReputationContext
+from darwin.policy.models import DarwinBuffering, DarwinFilter, DarwinPolicy, FilterPolicy
+from system.error_templates.models import ErrorTemplate
+from system.tenants.models import Tenants
+from toolkit.http.headers import Header
+
+# Required exceptions imports
+
+# Extern modules imports
+from collections import OrderedDict
+from copy import copy
+from hashlib import sha1
+from re import search as re_search
+
+# Logger configuration imports
+import logging
+logging.config.dictConfig(settings.LOG_SETTINGS)
+logger = logging.getLogger('services')
+
+
+# Parsed log_conditions kept by each process, shared by all frontends using the same condition
+LOG_CONDITION_CACHE_SIZE = 256
+_log_condition_cache = OrderedDict()
+
+
+def _cached(kind, text, parse):
+    """ Return parse(text), cached by kind and content hash, least recently used entries are dropped first """
+    key = (kind, sha1(text.encode('utf-8')).hexdigest())
+    try:
+        _log_condition_cache.move_to_end(key)
+        return _log_condition_cache[key]
+    except KeyError:
+        result = _log_condition_cache[key] = parse(text)
+        if len(_log_condition_cache) > LOG_CONDITION_CACHE_SIZE:
+            _log_condition_cache.popitem(last=False)
+        return result
+
+
+def _parse_log_condition_names(log_condition):
+    names = []
+    for line in log_condition.split('\n'):
+        if line.count('{') < 2:
+            continue
+        match = re_search("{{([^}]+)}}", line)
+        if match:
+            names.append(match.group(1))
+    return tuple(names)
+
+
+def log_condition_names(log_condition):
+    """ Return the names of the Log Forwarders used in a log_condition, in order of appearance """
+    return _cached("names", log_condition, _parse_log_condition_names)
+
+
+def log_condition_template(log_condition):
+    """ Return the compiled template of a log_condition, parsed once per content """
+    return _cached("template", log_condition, JinjaTemplate)
+
+
+def generate_log_om_conf(log_om, ruleset, frontend_name, confs):
+    """ Return LogOM.generate_conf() of a Log Forwarder for a frontend, memoised in confs
+    The output name of a Log Forwarder contains the frontend name, it is part of the key along with the ruleset
+    """
+    key = (log_om.pk, ruleset, frontend_name)
+    if key not in confs:
+        confs[key] = LogOM.generate_conf(log_om, ruleset, frontend=frontend_name)
+    return confs[key]
+
+
+def _group_by(objects, attribute):
+    groups = {}
+    for obj in objects:
+        groups.setdefault(getattr(obj, attribute), []).append(obj)
+    return groups
+
+
+def _ids(frontends, attribute):
+    ids = set()
+    for frontend in frontends:
+        ids.update(getattr(frontend, attribute) or ())
+    return ids
+
+
+class FrontendRenderContext:
+    """ Relations used by Frontend.to_template, generate_conf and generate_rsyslog_conf,
+     loaded for many frontends with a constant number of queries.
+     Log Forwarders and darwin bufferings are loaded once and shared by all the frontends of the pass
+    """
+
+    def __init__(self, frontends, node=None):
+        """
+        :param frontends: Frontends to render, their foreign keys are set from the loaded objects
+        :param node: If given, only listeners on this node are loaded
+        """
+        # Import here to prevent circular imports
+        from authentication.user_portal.models import UserAuthentication
+        from services.frontend.models import FrontendReputationContext, Listener
+        from workflow.models import Workflow
+        from applications.backend.models import Backend
+
+        frontends = list(frontends)
+        ids = [frontend.pk for frontend in frontends]
+
+        """ Foreign keys of the frontends """
+        reputation_ctxs = ReputationContext.objects.in_bulk({
+            getattr(frontend, attr) for frontend in frontends
+            for attr in ('logging_reputation_database_v4_id', 'logging_reputation_database_v6_id',
+                         'logging_geoip_database_id')} - {None})
+        error_templates = ErrorTemplate.objects.in_bulk({f.error_template_id for f in frontends} - {None})
+        tenants = Tenants.objects.in_bulk({f.tenants_config_id for f in frontends} - {None})
+        for frontend in frontends:
+            for attr in ('logging_reputation_database_v4', 'logging_reputation_database_v6', 'logging_geoip_database'):
+                if getattr(frontend, attr + "_id") in reputation_ctxs:
+                    setattr(frontend, attr, reputation_ctxs[getattr(frontend, attr + "_id")])
+            if frontend.error_template_id in error_templates:
+                frontend.error_template = error_templates[frontend.error_template_id]
+            if frontend.tenants_config_id in tenants:
+                frontend.tenants_config = tenants[frontend.tenants_config_id]
+
+        """ Reverse relations """
+        listeners = Listener.objects.filter(frontend_id__in=ids)
+        if node:
+            listeners = listeners.filter(network_address__nic__node=node)
+        self.listeners = _group_by(listeners.order_by('pk'), 'frontend_id')
+
+        headers = Header.objects.in_bulk(_ids(frontends, 'headers_id'))
+        self.headers = {frontend.pk: [headers[pk] for pk in sorted(frontend.headers_id or ()) if pk in headers]
+                        for frontend in frontends}
+
+        frontend_reputation_ctxs = list(FrontendReputationContext.objects.filter(frontend_id__in=ids, enabled=True)
+                                                                        .order_by('pk'))
+        reputation_ctxs = ReputationContext.objects.in_bulk({f.reputation_ctx_id for f in frontend_reputation_ctxs})
+        for frontend_reputation_ctx in frontend_reputation_ctxs:
+            frontend_reputation_ctx.reputation_ctx = reputation_ctxs[frontend_reputation_ctx.reputation_ctx_id]
+        self.reputation_ctxs = _group_by(frontend_reputation_ctxs, 'frontend_id')
+
+        workflows = list(Workflow.objects.filter(frontend_id__in=ids, enabled=True).order_by('pk'))
+        backends = Backend.objects.in_bulk({workflow.backend_id for workflow in workflows})
+        for workflow in workflows:
+            workflow.backend = backends[workflow.backend_id]
+        self.workflows = _group_by(workflows, 'frontend_id')
+
+        self.external_idps = _group_by(UserAuthentication.objects.filter(enable_external=True,
+                                                                         external_listener_id__in=ids)
+                                                                 .order_by('pk'), 'external_listener_id')
+
+        """ Darwin filters, and their bufferings """
+        self.darwin_policies = {frontend.pk: set(frontend.darwin_policies_id or ()) for frontend in frontends}
+        filters = list(FilterPolicy.objects.filter(policy_id__in=_ids(frontends, 'darwin_policies_id')).order_by('pk'))
+        bufferings = list(DarwinBuffering.objects.filter(destination_filter_id__in=[f.pk for f in filters]))
+        buffer_filters = FilterPolicy.objects.in_bulk({b.buffer_filter_id for b in bufferings} - {None})
+        all_filters = {**buffer_filters, **{f.pk: f for f in filters}}
+        filter_types = DarwinFilter.objects.in_bulk({f.filter_type_id for f in all_filters.values()})
+        policies = DarwinPolicy.objects.in_bulk({f.policy_id for f in all_filters.values()})
+        for darwin_filter in all_filters.values():
+            darwin_filter.filter_type = filter_types[darwin_filter.filter_type_id]
+            darwin_filter.policy = policies[darwin_filter.policy_id]
+        for buffering in bufferings:
+            buffering.destination_filter = all_filters[buffering.destination_filter_id]
+            if buffering.buffer_filter_id:
+                buffering.buffer_filter = all_filters[buffering.buffer_filter_id]
+        self.darwin_filters = filters
+        self.bufferings = _group_by(bufferings, 'destination_filter_id')
+
+        """ Log Forwarders, by name (log_condition) and by id (parse failure) """
+        names = set()
+        for frontend in frontends:
+            names.update(log_condition_names(frontend.log_condition))
+        failure_ids = _ids(frontends, 'log_forwarders_parse_failure_id')
+        self.log_oms_by_name = {}
+        self.log_oms_by_id = {}
+        # As LogOM.select_log_om_by_name, the first subclass wins
+        for log_om_class in LogOM.__subclasses__():
+            if names:
+                for log_om in log_om_class.objects.filter(name__in=names):
+                    self.log_oms_by_name.setdefault(log_om.name, log_om)
+            if failure_ids:
+                for log_om in log_om_class.objects.filter(pk__in=failure_ids):
+                    self.log_oms_by_id.setdefault(log_om.pk, log_om)
+        not_internal = LogOM.objects.filter(pk__in=_ids(frontends, 'log_forwarders_id'), internal=False).order_by('pk')
+        self.not_internal_forwarders = {frontend.pk: [log_om for log_om in not_internal
+                                                      if log_om.pk in (frontend.log_forwarders_id or ())]
+                                        for frontend in frontends}
+        self.log_forwarders_parse_failure = {frontend.pk: sorted(frontend.log_forwarders_parse_failure_id or ())
+                                             for frontend in frontends}
+        # Generated Log Forwarder configurations of the pass, see generate_log_om_conf()
+        self.log_om_confs = {}
+
+    def for_frontend(self, frontend):
+        """ Return a copy of the context restricted to one frontend, lighter to send to a render worker """
+        context = copy(self)
+        for attr in ('listeners', 'headers', 'reputation_ctxs', 'workflows', 'external_idps', 'darwin_policies',
+                     'not_internal_forwarders', 'log_forwarders_parse_failure'):
+            values = getattr(self, attr)
+            setattr(context, attr, {frontend.pk: values[frontend.pk]} if frontend.pk in values else {})
+        context.darwin_filters = self.get_darwin_filters(frontend)
+        context.bufferings = {f.pk: self.bufferings[f.pk] for f in context.darwin_filters if f.pk in self.bufferings}
+        names = set(log_condition_names(frontend.log_condition))
+        context.log_oms_by_name = {name: log_om for name, log_om in self.log_oms_by_name.items() if name in names}
+        ids = set(self.log_forwarders_parse_failure.get(frontend.pk, ()))
+        context.log_oms_by_id = {pk: log_om for pk, log_om in self.log_oms_by_id.items() if pk in ids}
+        return context
+
+    def get_darwin_filters(self, frontend, enabled_only=False):
+        """ Return the filters of the darwin policies of a frontend """
+        policies = self.darwin_policies.get(frontend.pk, ())
+        return [f for f in self.darwin_filters if f.policy_id in policies and (f.enabled or not enabled_only)]
+
+    def get_buffering(self, darwin_filter):
+        """ Return the buffering of a darwin filter, None if it is not buffered
+         Raise DarwinBuffering.MultipleObjectsReturned, as darwin_filter.buffering.get()
+        """
+        bufferings = self.bufferings.get(darwin_filter.pk, [])
+        if len(bufferings) > 1:
+            raise DarwinBuffering.MultipleObjectsReturned("Filter {} has several bufferings".format(darwin_filter.pk))
+        return bufferings[0] if bufferings else None
+
+    def get_log_om_by_name(self, name):
+        """ Return a Log Forwarder by name, as LogOM.select_log_om_by_name """
+        try:
+            return self.log_oms_by_name[name]
+        except KeyError:
+            raise LogOM.DoesNotExist("Log Forwarder named '{}' not found.".format(name))
+
+    def get_log_om(self, object_id):
+        """ Return a Log Forwarder by id, as LogOM.select_log_om """
+        try:
+            return self.log_oms_by_id[object_id]
+        except KeyError:
+            raise LogOM.DoesNotExist("Log Forwarder with id '{}' not found.".format(object_id))
@@ -29,6 +29,7 @@ from django.core.exceptions import ObjectDoesNotExist
 
 # Django project imports
 from services.haproxy.models import HAProxySettings
+from services.render import render_all
 from services.service import Service
 
 # Local imports
@@ -46,6 +47,8 @@ from system.exceptions import VultureSystemConfigError
 from subprocess import CalledProcessError
 
 # Extern modules imports
+from ast import literal_eval
+from os.path import exists
 from subprocess import check_output, PIPE
 from jinja2 import Environment, FileSystemLoader
 
@@ -61,6 +64,8 @@ TEST_CONF_PATH = "/var/tmp/haproxy"
 HAPROXY_OWNER = "vlt-os:vlt-web"
 HAPROXY_PERMS = "644"
 MANAGEMENT_SOCKET = "/var/sockets/haproxy/haproxy.sock"
+# Maximum number of commands sent on one connection to the runtime API, to not exceed its line buffer
+RUNTIME_BATCH_SIZE = 50
 
 JINJA_PATH = "/home/vlt-os/vulture_os/services/config/"
 JINJA_TEMPLATE = "haproxy_internals.cfg"
@@ -245,6 +250,93 @@ def hot_action_frontend(frontend_name, action):
         raise ServiceError(error_msg, "haproxy", "{} frontend".format(frontend_name), traceback=stderr or stdout)
 
 
+def escape_runtime_arg(arg):
+    """ Escape an argument of a runtime API command : spaces and semicolons are separators """
+    return arg.replace("\\", "\\\\").replace(" ", "\\ ").replace(";", "\\;")
+
+
+def runtime_commands(commands):
+    """ Send commands to the HAProxy runtime API, through the management socket
+    :param commands: List of commands, with arguments escaped by escape_runtime_arg
+    :return     The list of non-empty lines answered by HAProxy, error messages or raise ServiceError
+    """
+    answers = []
+    for i in range(0, len(commands), RUNTIME_BATCH_SIZE):
+        answers.extend(_send_runtime_input("{}\n".format(";".join(commands[i:i + RUNTIME_BATCH_SIZE]))))
+    return answers
+
+
+def _send_runtime_input(data):
+    """ Send raw input to the HAProxy runtime API, on one connection
+    :return     The list of non-empty lines answered by HAProxy, or raise ServiceError
+    """
+    try:
+        cmd_res = check_output(["/usr/bin/nc", "-U", MANAGEMENT_SOCKET], stderr=PIPE,
+                               input=data.encode('utf8')).decode('utf8')
+    except CalledProcessError as e:
+        stdout = e.stdout.decode('utf8')
+        stderr = e.stderr.decode('utf8')
+        raise ServiceError("Failed to connect to haproxy admin socket.", "haproxy", "send runtime commands",
+                           traceback=(stderr or stdout))
+    return [line for line in cmd_res.split("\n") if line.strip()]
+
+
+def update_ssl_cert(filename, payload):
+    """ Replace a certificate used by the running HAProxy, through a runtime API transaction, without reload
+    The file on disk must be written too, to be used by the next reloads
+    :param filename: The certificate file, as referenced by "crt <filename>"
+    :param payload: The new content of the file (PEM certificate, key and chain)
+    :return     The answer of HAProxy, or raise ServiceError
+    """
+    # The payload ends at the first empty line
+    pem = "\n".join(line for line in payload.split("\n") if line.strip())
+    answers = _send_runtime_input("set ssl cert {} <<\n{}\n\n".format(escape_runtime_arg(filename), pem))
+    if not any(answer.startswith("Transaction") for answer in answers):
+        raise ServiceError("Failed to update certificate '{}'".format(filename), "haproxy", "set ssl cert",
+                           traceback="\n".join(answers))
+    answers = _send_runtime_input("commit ssl cert {}\n".format(escape_runtime_arg(filename)))
+    if not any("Success!" in answer for answer in answers):
+        raise ServiceError("Failed to commit certificate '{}'".format(filename), "haproxy", "commit ssl cert",
+                           traceback="\n".join(answers))
+    return "\n".join(answers)
+
+
+def format_pattern_file(patterns):
+    """ Return the content of an HAProxy pattern file (acl -f), one pattern per line """
+    return "".join("{}\n".format(pattern) for pattern in patterns)
+
+
+def read_pattern_file(filename):
+    """ Return the patterns of a pattern file written by format_pattern_file, or None if it does not exist """
+    try:
+        with open(filename, encoding="utf8") as f:
+            return [line for line in f.read().split("\n") if line]
+    except OSError:
+        return None
+
+
+def update_acl_file(filename, previous_patterns, patterns):
+    """ Apply the changes of an acl pattern file on the running HAProxy, without reload
+    The file on disk must be written too, to be used by the next reloads
+    :param filename: The pattern file, as referenced by "acl ... -f <filename>"
+    :return     The number of patterns added and deleted, or raise ServiceError
+    """
+    previous = set(previous_patterns)
+    current = set(patterns)
+    commands = ["del acl {} {}".format(filename, escape_runtime_arg(pattern))
+                for pattern in sorted(previous - current)]
+    commands.extend("add acl {} {}".format(filename, escape_runtime_arg(pattern))
+                    for pattern in sorted(current - previous))
+    if not commands:
+        return 0
+    # Successful add/del commands do not answer anything
+    errors = runtime_commands(commands)
+    if errors:
+        raise ServiceError("Failed to update acl file '{}'".format(filename), "haproxy", "update acl file",
+                           traceback="\n".join(errors))
+    return len(commands)
+
+
 def host_start_frontend(node_logger, frontend_name):
     node_logger.debug("Try to enable frontend '{}'".format(frontend_name))
     res = hot_action_frontend(frontend_name, "enable")
@@ -259,6 +351,29 @@ def host_stop_frontend(node_logger, frontend_name):
     return res
 
 
+def update_certificates(node_logger, certificate_ids):
+    """ Load renewed certificates into the running HAProxy, HAProxy is reloaded only if it is not possible
+    The certificate files must have been written before (X509Certificate.save_conf)
+    :param node_logger: Logger sent to all API requests
+    :param certificate_ids: The ids of the X509Certificates, as a list
+    """
+    from system.pki.models import X509Certificate  # because of circular imports
+
+    # The list is casted to string by asynchronous api
+    if isinstance(certificate_ids, str):
+        certificate_ids = literal_eval(certificate_ids)
+
+    certificates = X509Certificate.objects.filter(pk__in=certificate_ids).only('name', 'cert', 'key', 'chain')
+    try:
+        for certificate in certificates:
+            update_ssl_cert(certificate.bundle_filename, certificate.as_bundle())
+            node_logger.info("Certificate '{}' updated in HAProxy.".format(certificate.name))
+    except ServiceError as e:
+        node_logger.error("Cannot update certificate in HAProxy ({}), reloading it : {}".format(e, e.traceback))
+        return reload_service(node_logger)
+    return "Certificates updated without reload."
+
+
 def reload_service(node_logger):
     # Do not handle exceptions here, they are handled by process_message
     service = HaproxyService()
@@ -300,6 +415,20 @@ def delete_conf(node_logger, filename):
         raise ServiceError("'{}' : {}".format(filename, (stderr or stdout)), "haproxy", "delete haproxy conf file")
 
 
+def normalize_conf(conf):
+    """ Return the meaningful lines of an HAProxy configuration,
+     without indentation, blank lines and comment lines, which do not change the behavior of HAProxy
+    :param conf: Configuration as string, may be None
+    :return     The list of stripped lines
+    """
+    lines = []
+    for line in (conf or "").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            lines.append(line)
+    return lines
+
+
 def build_conf(node_logger, frontend_id):
     """ Generate conf of haproxy frontend
     with it's ID
@@ -317,10 +446,12 @@ def build_conf(node_logger, frontend_id):
         frontend = models.Frontend.objects.get(pk=frontend_id)
         """ Generate ruleset conf of asked frontend """
         tmp = frontend.generate_conf(node=node)
-        if frontend.configuration.get(node.name) != tmp:
+        previous_conf = frontend.configuration.get(node.name)
+        if previous_conf != tmp:
             frontend.configuration[node.name] = tmp
             frontend.save()
-            reload = True
+            # Only formatting changes : the new conf is written, but HAProxy does not need a reload
+            reload = previous_conf is None or normalize_conf(previous_conf) != normalize_conf(tmp)
         """ And write-it """
 
         write_conf(node_logger, [frontend.get_filename(), frontend.configuration[node.name],
@@ -341,3 +472,47 @@ def build_conf(node_logger, frontend_id):
     else:
         result += "HAProxy conf hasn't changed."
     return result
+
+
+def build_confs(node_logger, frontend_ids):
+    """ Generate conf of several haproxy frontends, with shared node and global config,
+     and reload HAProxy at most once
+    :param node_logger: Logger sent to all API requests
+    :param frontend_ids: The ids of the frontends, as a list
+    :return:
+    """
+    from services.frontend import models  # because of circular imports
+    from services.frontend.render_context import FrontendRenderContext
+
+    # The list is casted to string by asynchronous api
+    if isinstance(frontend_ids, str):
+        frontend_ids = literal_eval(frontend_ids)
+
+    result = ""
+    reload = False
+    node = Cluster.get_current_node()
+    global_config = Cluster.get_global_config()
+    frontends = list(models.Frontend.objects.filter(pk__in=frontend_ids).order_by('pk'))
+    # Relations of all the frontends are loaded with a constant number of queries
+    context = FrontendRenderContext(frontends, node=node)
+    confs = render_all([(frontend, "generate_conf", {'node': node, 'global_config': global_config,
+                                                     'render_context': context.for_frontend(frontend)})
+                        for frontend in frontends], "haproxy")
+    for frontend, tmp in zip(frontends, confs):
+        previous_conf = frontend.configuration.get(node.name)
+        if previous_conf == tmp and exists(frontend.get_filename()):
+            continue
+        if previous_conf != tmp:
+            frontend.configuration[node.name] = tmp
+            frontend.save(update_fields=['configuration'])
+            # Only formatting changes : the new conf is written, but HAProxy does not need a reload
+            reload |= previous_conf is None or normalize_conf(previous_conf) != normalize_conf(tmp)
+        write_conf(node_logger, [frontend.get_filename(), tmp, models.FRONTEND_OWNER, models.FRONTEND_PERMS])
+        result += "Frontend '{}' conf written.\n".format(frontend.pk)
+
+    if reload:
+        result += "HAProxy conf updated. Reloading service.\n"
+        result += HaproxyService().reload()
+    else:
+        result += "HAProxy conf hasn't changed."
+    return result
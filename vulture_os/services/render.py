@@ -0,0 +1,89 @@
+#!/home/vlt-os/env/bin/python
+"""This file is part of Vulture OS.
+
+Vulture OS is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Vulture OS is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Vulture OS.  If not, see http://www.gnu.org/licenses/.
+"""
+__author__ = "Vulture OS"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "4.0.0"
+__maintainer__ = "Vulture OS"
+__email__ = "contact@vultureproject.org"
+__doc__ = 'Render scheduler of configuration templates, on a process pool'
+
+# Django system imports
+from django.conf import settings
+
+# Django project imports
+
+# Required exceptions imports
+from services.exceptions import ServiceJinjaError
+
+# Extern modules imports
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count, get_context
+from traceback import format_exc
+
+# Logger configuration imports
+import logging
+logging.config.dictConfig(settings.LOG_SETTINGS)
+logger = logging.getLogger('services')
+
+
+# Below this number of renders, the start of the workers costs more than it saves
+PARALLEL_RENDER_MIN = 20
+RENDER_WORKERS = min(max(cpu_count() - 1, 1), 8)
+
+
+def _init_worker():
+    """ Workers are spawned (forked MongoDB clients are not safe to use), Django has to be set up again """
+    import django
+    django.setup()
+
+
+def _render(task):
+    """ Render one task in a worker
+    :return     (conf, None), or (None, (error message, traceback)) as exceptions may not be picklable
+    """
+    obj, method, kwargs = task
+    try:
+        return getattr(obj, method)(**kwargs), None
+    except Exception as e:
+        return None, (str(e), getattr(e, "traceback", None) or format_exc())
+
+
+def render_all(tasks, service_name, workers=None):
+    """ Render configurations, on a process pool if there are enough of them
+    The objects are pickled with the data already fetched by the caller (prefetched relations, node, global config...)
+    :param tasks: List of (object, method name, kwargs), the method returns the rendered configuration
+    :param service_name: Name of the service, used in errors
+    :param workers: Number of worker processes, RENDER_WORKERS by default, 1 to render serially
+    :return     The list of rendered configurations, in the order of the tasks, or raise ServiceJinjaError
+    """
+    workers = workers or RENDER_WORKERS
+    if workers <= 1 or len(tasks) < PARALLEL_RENDER_MIN:
+        return [getattr(obj, method)(**kwargs) for obj, method, kwargs in tasks]
+
+    logger.debug("Rendering {} {} configurations with {} workers".format(len(tasks), service_name, workers))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                             initializer=_init_worker) as executor:
+        # map() keeps the order of the tasks : the result does not depend on the scheduling
+        results = list(executor.map(_render, tasks, chunksize=max(len(tasks) // (workers * 4), 1)))
+
+    confs = []
+    for conf, error in results:
+        if error:
+            raise ServiceJinjaError(error[0], service_name, traceback=error[1])
+        confs.append(conf)
+    return confs
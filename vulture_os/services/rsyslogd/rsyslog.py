@@ -28,6 +28,8 @@ from django.conf import settings
 # Django project imports
 from services.service import Service
 from services.frontend.models import Frontend
+from services.frontend.render_context import FrontendRenderContext
+from services.render import render_all
 from services.rsyslogd.models import RsyslogSettings
 from system.cluster.models import Cluster
 from system.config.models import write_conf
@@ -40,6 +42,7 @@ from subprocess import CalledProcessError
 from system.exceptions import VultureSystemError
 
 # Extern modules imports
+from ast import literal_eval
 from jinja2 import Environment, FileSystemLoader
 from re import search as re_search
 from subprocess import check_output, PIPE
@@ -169,6 +172,48 @@ def build_conf(node_logger, frontend_id=None):
     return result
 
 
+def build_confs(node_logger, frontend_ids):
+    """ Generate rulesets conf of several frontends, with shared node and global config,
+     write the changed ones and restart Rsyslog at most once
+    :param node_logger: Logger sent to all API requests
+    :param frontend_ids: The ids of the frontends, as a list
+    :return:
+    """
+    # The list is casted to string by asynchronous api
+    if isinstance(frontend_ids, str):
+        frontend_ids = literal_eval(frontend_ids)
+
+    result = ""
+    node = Cluster.get_current_node()
+    global_config = Cluster.get_global_config()
+    changed = False
+    frontends = list(Frontend.objects.filter(pk__in=frontend_ids).order_by('pk'))
+    # Relations of all the frontends are loaded with a constant number of queries
+    context = FrontendRenderContext(frontends)
+    confs = render_all([(frontend, "generate_rsyslog_conf", {'node': node, 'global_config': global_config,
+                                                             'render_context': context.for_frontend(frontend)})
+                        for frontend in frontends], "rsyslog")
+    for frontend, frontend_conf in zip(frontends, confs):
+        try:
+            with open(frontend.get_rsyslog_filename(), encoding="utf8") as f:
+                if f.read() == frontend_conf:
+                    continue
+        except OSError:
+            pass
+        write_conf(node_logger, [frontend.get_rsyslog_filename(), frontend_conf, RSYSLOG_OWNER, RSYSLOG_PERMS])
+        result += "Frontend '{}' conf written.\n".format(frontend.pk)
+        changed = True
+
+    """ Generate inputs configuration """
+    service = RsyslogService()
+    if service.reload_conf() or changed:
+        result += "Rsyslog conf updated. Restarting service.\n"
+        result += service.restart()
+    else:
+        result += "Rsyslog conf hasn't changed."
+    return result
+
+
 def reload_service(node_logger):
     # Do not handle exceptions here, they are handled by process_message
     service = RsyslogService()
@@ -374,104 +374,123 @@ class Node(models.Model):
                                       proto, l.network_address.family, l.max_src, l.max_rate))
         return listeners_enabled
 
+    def _get_enabled_listeners(self):
+        """ Return tuples (listener id, frontend id, address family) of listeners bound to this node
+             and used by an enabled Frontend
+            Results are cached on the instance: as Cluster.get_current_node() returns a new instance,
+             they live for one configuration generation pass
+        """
+        cache = self.__dict__.setdefault('_network_cache', {})
+        if "listeners" not in cache:
+            from services.frontend.models import Listener
+            families = {address.id: address.family
+                        for address in NetworkAddress.objects.filter(nic__node=self).only('id', 'ip').distinct()}
+            cache['listeners'] = [(listener_id, frontend_id, families[address_id])
+                                  for listener_id, frontend_id, address_id in Listener.objects.filter(
+                                      network_address_id__in=list(families.keys()),
+                                      frontend__enabled=True).values_list('id', 'frontend_id', 'network_address_id')]
+        return cache['listeners']
+
     @property
     def get_forwarders_enabled(self):
         """ Return all tuples (family, proto, ip, port) for each LogForwarders """
-        from applications.logfwd.models import LogOM, LogOMRELP, LogOMHIREDIS, LogOMFWD, LogOMElasticSearch, LogOMMongoDB, LogOMKAFKA
-        # !!! REQUIRED BY listener_set !
-        from services.frontend.models import Listener
+        from applications.logfwd.models import LogOMRELP, LogOMHIREDIS, LogOMFWD, LogOMElasticSearch, LogOMMongoDB, LogOMKAFKA
+        from services.frontend.models import Frontend
+        cache = self.__dict__.setdefault('_network_cache', {})
+        if "forwarders" in cache:
+            return cache['forwarders']
         result = set()
         """ Retrieve LogForwarders used in enabled Frontends """
-        """ First, retrieve LogForwarders that bind to the address of the node """
-        addresses = self.addresses()
-        """ For each address, retrieve the associated listeners having frontend enabled """
-        listener_ids = list()
-        for a in addresses:
-            listener_ids.extend([l.id for l in a.listener_set.filter(frontend__enabled=True)])
-
-        logfwds = list()
-        """ Retrieve LogForwarder used by the frontend using listeners """
-        # Log Forwarder RELP
-        logfwds.extend(list(LogOMRELP.objects.filter(enabled=True, frontend_set__listener__in=listener_ids)))
-
-        # Log Forwarder REDIS
-        logfwds.extend(list(LogOMHIREDIS.objects.filter(enabled=True, frontend_set__listener__in=listener_ids)))
-
-        # Log Forwarder Syslog
-        logfwds.extend(list(LogOMFWD.objects.filter(enabled=True, frontend_set__listener__in=listener_ids)))
-
-        # Log Forwarder ElasticSearch
-        logfwds.extend(list(LogOMElasticSearch.objects.filter(enabled=True, frontend_set__listener__in=listener_ids)))
-
-        # Log Forwarder MongoDB
-        logfwds.extend(list(LogOMMongoDB.objects.filter(enabled=True, frontend_set__listener__in=listener_ids)))
-
-        # Log Forwarder Kafka
-        logfwds.extend(list(LogOMKAFKA.objects.filter(enabled=True, frontend_set__listener__in=listener_ids)))
+        """ First, retrieve ids of LogForwarders used by the frontends listening on the addresses of the node """
+        frontend_ids = {frontend_id for _, frontend_id, _ in self._get_enabled_listeners()}
+        listener_logfwd_ids = set()
+        if frontend_ids:
+            for log_fwds in Frontend.objects.filter(pk__in=list(frontend_ids)).values_list('log_forwarders', flat=True):
+                listener_logfwd_ids.update(log_fwds or [])
 
         """Second, retrieve Log Forwarders directly associated with the node and not a listener eg. KAFKA and REDIS"""
+        node_logfwd_ids = set()
         # Test self.pk to prevent M2M errors when object isn't saved in DB
         if self.pk:
-            logfwds.extend([LogOM().select_log_om(log_fwd) for log_fwds in self.frontend_set.values_list('log_forwarders', flat=True) for log_fwd in log_fwds])
+            for log_fwds in self.frontend_set.values_list('log_forwarders', flat=True):
+                node_logfwd_ids.update(log_fwds or [])
+
+        """ Retrieve all needed LogForwarders with one query per type """
+        logfwds = list()
+        logfwd_ids = list(listener_logfwd_ids | node_logfwd_ids)
+        if logfwd_ids:
+            for logfwd_class in (LogOMRELP, LogOMHIREDIS, LogOMFWD, LogOMElasticSearch, LogOMMongoDB, LogOMKAFKA):
+                # LogForwarders used through a listener are only kept if enabled
+                logfwds.extend([logfwd for logfwd in logfwd_class.objects.filter(pk__in=logfwd_ids)
+                                if logfwd.pk in node_logfwd_ids or logfwd.enabled])
 
         """Add the protocol, destination ip and port of the log forwarder to the result"""
         for logfwd in logfwds:
             # Log Forwarder RELP
-            if hasattr(logfwd, 'logomrelp'):
+            if isinstance(logfwd, LogOMRELP):
                 result.add(("tcp", logfwd.target, logfwd.port))  # TCP
 
             # Log Forwarder REDIS
-            elif hasattr(logfwd, 'logomhiredis'):
+            elif isinstance(logfwd, LogOMHIREDIS):
                 result.add(("tcp", logfwd.target, logfwd.port))  # TCP
 
             # Log Forwarder Syslog
-            elif hasattr(logfwd, 'logomfwd'):
+            elif isinstance(logfwd, LogOMFWD):
                 result.add((logfwd.protocol, logfwd.target, logfwd.port))  # proto
 
             # Log Forwarder ElasticSearch
-            elif hasattr(logfwd, 'logomelasticsearch'):
+            elif isinstance(logfwd, LogOMElasticSearch):
                 """ For elasticsearch, we need to parse the servers """
                 for ip, port in re_findall("https?://([^:]+):(\d+)", logfwd.servers):
                     result.add(("tcp", ip, port))
 
             # Log Forwarder MongoDB
-            elif hasattr(logfwd, 'logommongodb'):
+            elif isinstance(logfwd, LogOMMongoDB):
                 """ For OMMongoDB - parse uristr """
                 for ip, port in parse_uristr(logfwd.uristr):
                     result.add(('tcp', ip, port))
 
             # Log Forwarder Kafka
-            elif hasattr(logfwd, 'logomkafka'):
+            elif isinstance(logfwd, LogOMKAFKA):
                 """ For kafka, we need to parse the brokers """
                 for ip, port in re_findall("([^:\"\']+):(\d+)", logfwd.broker):
                     result.add(("tcp", ip, port))
 
-        return list(result)
+        cache['forwarders'] = list(result)
+        return cache['forwarders']
 
     @property
     def get_backends_enabled(self):
         """ Return all tuples (family, proto, ip, port) for each enabled Backends on this node """
-        from applications.backend.models import Backend
-        # !!! REQUIRED BY listener_set !
-        from services.frontend.models import Listener
+        from applications.backend.models import Server
+        from workflow.models import Workflow
+        cache = self.__dict__.setdefault('_network_cache', {})
+        if "backends" in cache:
+            return cache['backends']
         result = set()
-        """ Retrieve Backends used in enabled Frontends """
-        addresses = self.addresses()
-        """ For each address, retrieve the associated listeners having frontend enabled """
-        listener_addr = dict()
-        for a in addresses:
-            try:
-                listener_addr[a].extend([l.id for l in a.listener_set.filter(frontend__enabled=True)])
-            except KeyError:
-                listener_addr[a] = [l.id for l in a.listener_set.filter(frontend__enabled=True)]
-
-        """ Loop on each NetworkAddress to retrieve Backends associated with (enabled) Frontends """
-        for network_address, listener_ids in listener_addr.items():
-            for backend in Backend.objects.filter(enabled=True, frontend__listener__in=listener_ids):
-                for server in backend.server_set.filter(mode="net"):
-                    result.add((network_address.family, "tcp", server.target, server.port))  # TCP
-
-        return result
+        """ Retrieve the address families of the (enabled) Frontends listening on this node """
+        frontend_families = dict()
+        for _address, frontend_id, family in self._get_enabled_listeners():
+            frontend_families.setdefault(frontend_id, set()).add(family)
+
+        """ Retrieve enabled Backends associated with those Frontends """
+        backend_families = dict()
+        if frontend_families:
+            for frontend_id, backend_id in Workflow.objects.filter(frontend_id__in=list(frontend_families.keys()),
+                                                                   backend__enabled=True) \
+                                                           .values_list('frontend_id', 'backend_id'):
+                backend_families.setdefault(backend_id, set()).update(frontend_families[frontend_id])
+
+        """ Retrieve the network servers of all those Backends at once """
+        if backend_families:
+            for backend_id, target, port in Server.objects.filter(backend_id__in=list(backend_families.keys()),
+                                                                  mode="net") \
+                                                          .values_list('backend_id', 'target', 'port'):
+                for family in backend_families[backend_id]:
+                    result.add((family, "tcp", target, port))  # TCP
+
+        cache['backends'] = result
+        return cache['backends']
 
     def process_messages(self):
         """
@@ -38,7 +38,9 @@ from subprocess import CalledProcessError
 
 # Extern modules imports
 from ast import literal_eval
-from tempfile import mktemp
+from os import rmdir
+from os.path import basename, dirname, join as path_join
+from tempfile import mkdtemp, mktemp
 from re import match as re_match
 from subprocess import check_output, PIPE
 
@@ -173,6 +175,73 @@ def write_conf(logger, args):
                                        "Please see traceback for more informations.")
 
 
+def write_confs(logger, files):
+    """ Write several files on disk, with one sudo mv, chown and chmod
+         per (directory, owner, permissions) instead of three per file
+    :param files: List of [file_path, file_content, owner, perm], as the arguments of write_conf
+    """
+    # parse arguments because we can be called by asynchronous api
+    if isinstance(files, str):
+        files = literal_eval(files)
+
+    groups = {}
+    for file_path, file_content, owner, perm in files:
+        # The last content given for a path wins
+        groups.setdefault((dirname(file_path), owner, perm), {})[basename(file_path)] = file_content
+
+    for (directory, owner, perm), contents in groups.items():
+        # Temporary files have the name of their destination, to be moved in one command
+        temp_dir = mkdtemp(prefix="/var/tmp/")
+        file_paths = [path_join(directory, filename) for filename in contents]
+        command = ""
+        try:
+            for filename, file_content in contents.items():
+                with open(path_join(temp_dir, filename), "w", encoding="utf8") as f:
+                    f.write(str(file_content))
+
+            logger.debug("Moving files from '{}' to '{}'".format(temp_dir, directory))
+            command = ['/usr/local/bin/sudo', '/bin/mv'] + [path_join(temp_dir, f) for f in contents] + [directory]
+            check_output(command, stderr=PIPE)
+
+            logger.debug("Applying owner '{}' and permissions '{}' on files {}".format(owner, perm, file_paths))
+            command = ['/usr/local/bin/sudo', '/usr/sbin/chown', owner] + file_paths
+            check_output(command, stderr=PIPE)
+            command = ['/usr/local/bin/sudo', '/bin/chmod', perm] + file_paths
+            check_output(command, stderr=PIPE)
+
+            logger.info("Files {} successfully written.".format(file_paths))
+
+        except PermissionError as e:
+            logger.error("Failed to create/write files {}:".format(file_paths))
+            logger.exception(e)
+            raise VultureSystemConfigError("The path '{}' does not have correct permissions. \n "
+                                           "Cannot create/write the files {}.".format(temp_dir, file_paths))
+        except CalledProcessError as e:
+            logger.error("Failed to execute command {}: {}".format(command, e.stderr))
+            logger.exception(e)
+            if "No such file or directory" in e.stderr.decode('utf8'):
+                raise VultureSystemConfigError("Directory '{}' does not seems to exists.".format(directory),
+                                               traceback=e.stderr.decode('utf8'))
+            raise VultureSystemConfigError("Cannot write files {}.".format(file_paths),
+                                           traceback=(e.stdout or e.stderr).decode('utf8'))
+        # Do NOT remove THIS ! Used to handle "service vultured stop"
+        except ServiceExit:
+            raise
+
+        except Exception as e:
+            logger.error("No referenced error in write_confs method : ")
+            logger.exception(e)
+            raise VultureSystemConfigError("Unknown error occurred. \n"
+                                           "Please see traceback for more informations.")
+        finally:
+            try:
+                rmdir(temp_dir)
+            except OSError:
+                pass
+
+    return "{} files written".format(len(files))
+
+
 def delete_conf(logger, filenames):
     """ """
     # Import here to prevent circular import
@@ -181,12 +250,14 @@ def delete_conf(logger, filenames):
     from system.pki.models import CERT_PATH
     from services.darwin.darwin import DARWIN_PATH
     from services.rsyslogd.rsyslog import RSYSLOG_PATH
+    from services.haproxy.haproxy import HAPROXY_PATH
 
     allowed_files_regex = ["{}/\w+_\d+\.html".format(ERROR_TPL_PATH),
                            "{}/.*\.(mmdb|netset|lookup)".format(REPUTATION_CTX_DB_PATH),
                            "{}/[\w\_\-\.]+-\d+\.(chain|crt|pem|key|pub)".format(CERT_PATH),
                            "{}/parser_[0-9]+\.rb".format(RSYSLOG_PATH),
-                           "{}/f[\w-]+/f[\w-]+_[0-9]+.conf".format(DARWIN_PATH)]
+                           "{}/f[\w-]+/f[\w-]+_[0-9]+.conf".format(DARWIN_PATH),
+                           "{}/acl_[^/]+_[0-9a-f]{{16}}\.lst$".format(HAPROXY_PATH)]
 
     # Filenames can be a list casted to string
     if filenames[0] == '[':
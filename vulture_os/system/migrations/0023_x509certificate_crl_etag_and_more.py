@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0022_alter_tlsprofile_protocols'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='x509certificate',
+            name='crl_etag',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='x509certificate',
+            name='crl_last_modified',
+            field=models.TextField(default=''),
+        ),
+    ]
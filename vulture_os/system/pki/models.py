@@ -29,6 +29,7 @@ from django.utils.translation import gettext_lazy as _
 from djongo import models
 import logging
 import OpenSSL
+import urllib.error
 import urllib.request
 import datetime
 
@@ -42,6 +43,12 @@ from ssl import TLSVersion
 logging.config.dictConfig(settings.LOG_SETTINGS)
 logger = logging.getLogger('gui')
 
+# Timeout (in seconds) of external CRL downloads
+CRL_DOWNLOAD_TIMEOUT = 10
+# Validity (in days) of the internal CRL, it is signed again when it expires in less than CRL_RENEW_DAYS
+CRL_VALIDITY_DAYS = 365
+CRL_RENEW_DAYS = 30
+
 
 PROTOCOLS_TO_INT = {
     'tlsv10': int(TLSVersion.TLSv1),
@@ -176,12 +183,27 @@ class X509Certificate(models.Model):
     # This is for external certificate, not managed by us
     is_external = models.BooleanField(default=False)
     crl_uri = models.TextField(blank=True, default='')
+    """ HTTP validators of the last external CRL download """
+    crl_etag = models.TextField(default="")
+    crl_last_modified = models.TextField(default="")
 
     rev_date = models.TextField(blank=True)
 
     def __init__(self, *args, **kwargs):
         super(X509Certificate, self).__init__(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the deployed material, to write the files only if it changes
+        if not instance.get_deferred_fields() & {'name', 'cert', 'key', 'chain'}:
+            instance._deployed_material = instance.get_material()
+        return instance
+
+    def get_material(self):
+        """ Attributes the certificate files depend on """
+        return self.name, self.cert, self.key, self.chain
+
     def to_dict(self, fields=None):
         result = model_to_dict(self, fields=fields)
         result['bundle_filename'] = self.bundle_filename
@@ -359,14 +381,22 @@ class X509Certificate(models.Model):
         except x509.ExtensionNotFound:
             return False
 
-    def gen_crl(self):
+    def gen_crl(self, force=False):
         """ Build and return the CRL associated to the Vulture's internal ROOT CA
+        :param force: Build the CRL even if the revoked certificates did not change,
+                      download the external CRL without conditional request
         """
 
         if self.is_vulture_ca:
             logger.debug("PKI::gen_crl: Building Vulture's internal CRL")
+            certs = X509Certificate.objects.filter(status='R').order_by('serial').only('serial', 'rev_date')
+            vulture_ca_cert = self.get_vulture_ca()
+            ca_cert = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, str(vulture_ca_cert.cert))
+            if not force and vulture_ca_cert.is_crl_up_to_date(ca_cert, certs):
+                logger.debug("PKI::gen_crl: Revoked certificates did not change, CRL kept")
+                return vulture_ca_cert.crl
+
             CRL = OpenSSL.crypto.CRL()
-            certs = X509Certificate.objects.filter(status='R').order_by('serial')
             for cert in certs:
                 try:
                     rev = OpenSSL.crypto.Revoked()
@@ -380,27 +410,76 @@ class X509Certificate(models.Model):
 
             # Now generate the CRL
             logger.debug("PKI::gen_crl: Storing the CRL into vulture_ca_cert")
-            vulture_ca_cert = self.get_vulture_ca()
             ca_key = OpenSSL.crypto.load_privatekey(OpenSSL.crypto.FILETYPE_PEM, str(vulture_ca_cert.key))
-            ca_cert = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, str(vulture_ca_cert.cert))
-            ca_crl = CRL.export(ca_cert, ca_key, OpenSSL.crypto.FILETYPE_PEM, 365, b"sha256")
+            ca_crl = CRL.export(ca_cert, ca_key, OpenSSL.crypto.FILETYPE_PEM, CRL_VALIDITY_DAYS, b"sha256")
             vulture_ca_cert.crl = ca_crl
-            vulture_ca_cert.save()
+            # The CRL is not written on disk, the certificate files do not need to be written again
+            vulture_ca_cert.save_crl()
             return ca_crl
 
         elif self.is_external and self.crl_uri:
             logger.debug("PKI::gen_crl: Fetching external CRL")
-            self.crl = self.download_crl()
+            validators = (self.crl_etag, self.crl_last_modified)
+            crl = self.download_crl(conditional=not force)
+            if crl is None:
+                # Keep the last valid CRL rather than none
+                return self.crl
+            if crl == self.crl and validators == (self.crl_etag, self.crl_last_modified):
+                logger.debug("PKI::gen_crl: External CRL did not change")
+                return self.crl
+            self.crl = crl
             logger.debug("PKI::gen_crl: Storing the CRL into database")
-            self.save()
+            self.save_crl()
             return self.crl
 
-    def download_crl(self):
+    def is_crl_up_to_date(self, ca_cert, revoked_certs):
+        """ Check if the CRL of this CA is signed by ca_cert, far from expiration,
+             and lists exactly revoked_certs, as built by gen_crl()
+        """
+        if not self.crl:
+            return False
+        try:
+            crl = x509.load_pem_x509_crl(self.crl.encode())
+            if not crl.is_signature_valid(ca_cert.to_cryptography().public_key()):
+                return False
+            if crl.next_update - datetime.datetime.utcnow() < datetime.timedelta(days=CRL_RENEW_DAYS):
+                return False
+            # Serials are given to OpenSSL as hexadecimal strings
+            expected = {(int(str(cert.serial), 16), str(cert.rev_date)) for cert in revoked_certs}
+            current = {(revoked.serial_number, revoked.revocation_date.strftime("%Y%m%d%H%M%SZ")) for revoked in crl}
+            return expected == current
+        except Exception as e:
+            logger.info("PKI::is_crl_up_to_date: CRL will be built again: {}".format(str(e)))
+            return False
+
+    def save_crl(self):
+        """ Save the CRL and its download validators, without writing the certificate files """
+        super().save(update_fields=['crl', 'crl_etag', 'crl_last_modified'])
+
+    def download_crl(self, timeout=CRL_DOWNLOAD_TIMEOUT, conditional=False):
+        """ Download the CRL of an external certificate
+        :param conditional: Send the validators of the last download, the current CRL is returned if not modified
+        :return     The CRL as string, or None if the download failed
+        """
         if self.is_external and self.crl_uri:
+            headers = {}
+            if conditional and self.crl:
+                if self.crl_etag:
+                    headers['If-None-Match'] = self.crl_etag
+                if self.crl_last_modified:
+                    headers['If-Modified-Since'] = self.crl_last_modified
             try:
-                response = urllib.request.urlopen(self.crl_uri)
-                data = response.read()
+                request = urllib.request.Request(self.crl_uri, headers=headers)
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    data = response.read()
+                    self.crl_etag = response.headers.get("ETag", "")
+                    self.crl_last_modified = response.headers.get("Last-Modified", "")
                 return data.decode('utf-8')
+            except urllib.error.HTTPError as e:
+                if e.code == 304:
+                    return self.crl
+                logger.error("PKI::getCRL: {}".format(str(e)))
+                return None
             except Exception as e:
                 logger.error("PKI::getCRL: {}".format(str(e)))
                 return None
@@ -474,7 +553,7 @@ class X509Certificate(models.Model):
 
 
     def save_conf(self):
-        """ Write cert as all formats currently supported
+        """ Write cert as all formats currently supported, in one API request
         This function raise VultureSystemConfigError if failure """
         from system.cluster.models import Cluster
         extensions = self.get_extensions()
@@ -482,14 +561,14 @@ class X509Certificate(models.Model):
         # Retrieve and stock variable to improve loop perf
         base_filename = self.get_base_filename()
 
-        """ For each extensions to be written """
-        for extension, buffer in extensions.items():
-            params = [base_filename + extension, buffer, CERT_OWNER, CERT_PERMS]
+        params = [[base_filename + extension, buffer, CERT_OWNER, CERT_PERMS]
+                  for extension, buffer in extensions.items()]
 
-            """ API request """
-            api_res = Cluster.api_request('system.config.models.write_conf', config=params, internal=True)
-            if not api_res.get('status'):
-                raise VultureSystemConfigError(". API request failure ", traceback=api_res.get('message'))
+        """ API request """
+        api_res = Cluster.api_request('system.config.models.write_confs', config=params, internal=True)
+        if not api_res.get('status'):
+            raise VultureSystemConfigError(". API request failure ", traceback=api_res.get('message'))
+        self._deployed_material = self.get_material()
 
     def delete_conf(self):
         """ Delete all format of the current certificate
@@ -507,13 +586,16 @@ class X509Certificate(models.Model):
         return True
 
     def save(self, **kwargs):
-        """ Override of save method to write cert on disk """
+        """ Override of save method to write cert on disk, if the certificate material changed """
+        material_changed = self.get_material() != getattr(self, '_deployed_material', None)
         """ First of all, save the object to get an id """
-        self.is_ca = self.is_ca_cert()
+        if material_changed:
+            self.is_ca = self.is_ca_cert()
         super().save(**kwargs)
 
         """ Only then, write the file(s) on disk """
-        self.save_conf()
+        if material_changed:
+            self.save_conf()
 
     @staticmethod
     def str_attrs():
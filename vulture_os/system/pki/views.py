@@ -38,7 +38,7 @@ from system.pki.form import TLSProfileForm, X509ExternalCertificateForm, X509Int
 from system.pki.models import CIPHER_SUITES, PROTOCOLS_HANDLER, TLSProfile, X509Certificate
 from system.cluster.models import Cluster
 from toolkit.api.responses import build_response, build_form_errors
-from services.frontend.models import Listener
+from services.frontend.models import Frontend, Listener
 from applications.backend.models import Server
 
 # Required exceptions imports
@@ -95,7 +95,7 @@ def pki_gencrl(request, object_id):
         return HttpResponseForbidden("Injection detected")
 
     try:
-        x509_model.gen_crl()
+        x509_model.gen_crl(force=True)
     except Exception as e:
         logger.error("PKI::genCRL: {}".format(str(e)))
         pass
@@ -275,9 +275,8 @@ def tls_profile_edit(request, object_id=None, api=False):
             tls_profile.save_conf()
             logger.info("TLSProfile '{}' write on disk requested.".format(tls_profile.name))
 
-            for frontend in set(listener.frontend for listener in tls_profile.listener_set.all()):
-                frontend.reload_conf()
-                logger.info("Frontend confs reloaded")
+            Frontend.reload_confs(set(listener.frontend for listener in tls_profile.listener_set.all()))
+            logger.info("Frontend confs reloaded")
 
             for backend in set(server.backend for server in tls_profile.server_set.all()):
                 backend.reload_conf()
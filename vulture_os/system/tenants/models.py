@@ -82,13 +82,7 @@ class Tenants(models.Model):
         app_label = "system"
 
     def reload_frontends_conf(self):
-        updated_nodes = set()
+        from services.frontend.models import Frontend  # avoid circular imports
         # Test self.pk to prevent M2M errors when object isn't saved in DB
         if self.pk:
-            for frontend in self.frontend_set.filter(enabled=True, enable_logging=True):
-                for node in frontend.get_nodes():
-                    updated_nodes.add(node)
-                    node.api_request("services.rsyslogd.rsyslog.build_conf", frontend.id)
-
-        for node in updated_nodes:
-            node.api_request("services.rsyslogd.rsyslog.restart_service")
+            Frontend.reload_rsyslog_confs(self.frontend_set.filter(enabled=True, enable_logging=True))
@@ -60,6 +60,29 @@ class SSLAdapter(HTTPAdapter):
         self.poolmanager = PoolManager(*args, **kwargs)
 
 
+def get_cache_max_age(response, default):
+    """ Return the number of seconds during which a response stays fresh, from its Cache-Control and Age headers
+    :param response: requests.Response
+    :param default: Lifetime to use if the response does not specify one
+    """
+    directives = {}
+    for directive in response.headers.get("Cache-Control", "").lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name] = value.strip('"')
+    if "no-store" in directives or "no-cache" in directives:
+        return 0
+    try:
+        age = int(response.headers.get("Age", 0))
+    except ValueError:
+        age = 0
+    for name in ("s-maxage", "max-age"):
+        try:
+            return max(int(directives[name]) - age, 0)
+        except (KeyError, ValueError):
+            continue
+    return default
+
+
 def build_url_params(url, **kwargs):
     if kwargs:
         return "{}?{}".format(url, urlencode(kwargs))
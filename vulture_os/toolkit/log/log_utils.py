@@ -26,51 +26,142 @@ __doc__ = 'Database handler for logging'
 from toolkit.mongodb.mongo_base import MongoBase
 from toolkit.network.network import get_hostname
 from django.utils import timezone
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from time import monotonic
 import logging
 
 
+# Records waiting to be written, beyond that they are dropped (and counted)
+QUEUE_SIZE = 10000
+# Records are written in batches of at most BATCH_SIZE, at least every FLUSH_INTERVAL seconds
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1
+
+
 class DatabaseHandler(logging.StreamHandler):
     """
-    A handler class which writes formatted logging records to disk files.
+    A handler class which writes ERROR records into the internal logs collection.
+    Records are queued by emit() and written in batches by a background thread,
+    logging never waits for MongoDB.
     """
 
-    def __init__(self, type_logs):
+    def __init__(self, type_logs, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
         """
-        Open the specified file and use it as the stream for logging.
+        Initialize the queue, the writer thread is started at the first record.
         """
-        # keep the absolute path, otherwise derived classes which use this
-        # may come a cropper when the current directory changes
+        # Registered in logging, so that records are flushed by logging.shutdown() and dictConfig()
+        logging.Handler.__init__(self)
         self._name = "Database Handler"
-        self.filters = []
-        self.lock = None
 
         self.database = "logs"
         self.collection = "internal"
 
         self.mongo = MongoBase()
+        self.queue = Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.hostname = None
+        self._writer = None
+        self._writer_lock = Lock()
 
     def emit(self, record):
         """
         Emit a record.
-        Save the log into the repository
+        Queue the log, to be saved into the repository
         """
 
         if record.levelname != "ERROR":
             return
         try:
-
-            return self.mongo.insert(self.database, self.collection, {
+            self.queue.put_nowait({
                 'timestamp': timezone.now(),
                 'log_level': record.levelname,
                 'filename': record.filename,
                 'message': record.msg,
                 'source': record.name,
-                'node': get_hostname()
             })
+        except Full:
+            with self._writer_lock:
+                self.dropped += 1
+            return
+
+        with self._writer_lock:
+            # The writer exits when the queue is empty, and does not survive a fork
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = Thread(target=self._write_loop, name="DatabaseHandler", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            batch = self._get_batch()
+            if not batch:
+                with self._writer_lock:
+                    if self.queue.empty():
+                        self._writer = None
+                        return
+                continue
+            self._write(batch)
+
+    def _get_batch(self):
+        """ Wait up to flush_interval for records, and return at most batch_size of them """
+        batch = []
+        deadline = monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            if self.hostname is None:
+                self.hostname = get_hostname()
+            with self._writer_lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                batch.append({
+                    'timestamp': timezone.now(),
+                    'log_level': "WARNING",
+                    'filename': __file__,
+                    'message': "{} error logs dropped, the queue of the database handler was full".format(dropped),
+                    'source': self.__class__.__name__,
+                })
+            for document in batch:
+                document['node'] = self.hostname
+            # Unordered : a failing record does not prevent the next ones to be written
+            return self.mongo.insert_many(self.database, self.collection, batch, ordered=False)
 
         except Exception:
             pass
 
+    def flush(self):
+        """ Write the queued records now, in the calling thread """
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        self.flush()
+        # Let the writer save the batch it may be holding
+        writer = self._writer
+        if writer is not None:
+            writer.join(timeout=self.flush_interval * 2)
+        logging.Handler.close(self)
+
 
 def get_obj_value_or_default(element, keys=[], default=None):
     '''
@@ -31,7 +31,9 @@ __doc__ = 'Toolkit for MaxMindDB databases management'
 
 # Extern modules imports
 from io import BytesIO
-from maxminddb import open_database, MODE_FD
+from maxminddb import open_database, MODE_FD, MODE_MMAP
+from os import stat
+from threading import Lock
 
 
 def test_mmdb_database(mmdb_content):
@@ -55,11 +57,56 @@ def open_mmdb_database(mmdb_content):
     :return True if the database is correct, False otherwise
     """
     # Check if the response content is MMDB database
-    tmpfile = BytesIO()
-    tmpfile.write(mmdb_content)
-    tmpfile.seek(0)
+    # Initializing the BytesIO with the content shares its buffer instead of copying it
+    tmpfile = BytesIO(mmdb_content)
     setattr(tmpfile, "name", "test")
     try:
         return open_database(tmpfile, mode=MODE_FD)
     except Exception:
         return None
+
+
+def open_mmdb_file(mmdb_path):
+    """ Open a MaxMindDB database written on disk, memory-mapped instead of loaded in memory
+    :return The database reader if the database is correct, None otherwise
+    """
+    try:
+        return open_database(mmdb_path, mode=MODE_MMAP)
+    except Exception:
+        return None
+
+
+class ReaderCache:
+    """ Process-wide cache of database readers, indexed by file path
+         A reader is reopened when the modification time of its file changes
+    """
+
+    def __init__(self, opener):
+        """
+        :param opener: Function opening a file path, returning a reader or None if the file is not valid
+        """
+        self._opener = opener
+        self._readers = {}
+        self._lock = Lock()
+
+    def get(self, file_path):
+        """ Return the reader of file_path, opening it if needed
+        :raises FileNotFoundError if the file does not exist, ValueError if it cannot be opened
+        """
+        mtime = stat(file_path).st_mtime_ns
+        cached = self._readers.get(file_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with self._lock:
+            cached = self._readers.get(file_path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+            reader = self._opener(file_path)
+            if reader is None:
+                raise ValueError("File '{}' is not a valid database".format(file_path))
+            # Previous reader is not closed, it may still be used by another thread: let it be garbage collected
+            self._readers[file_path] = (mtime, reader)
+            return reader
+
+
+mmdb_readers = ReaderCache(open_mmdb_file)
@@ -23,17 +23,39 @@ __email__ = "contact@vultureproject.org"
 __doc__ = 'System Utils Database Toolkit'
 
 
-from pymongo import MongoClient, ReadPreference
+from pymongo import ASCENDING, MongoClient, ReadPreference
 from pymongo.errors import OperationFailure, AutoReconnect
 from toolkit.network.network import get_hostname
 from django.conf import settings
+from os import register_at_fork
 from re import search as re_search
+from threading import Lock
+from time import monotonic
 import subprocess
 import logging
 
 # No database logging to prevent infinite loop
 logger = logging.getLogger('system')
 
+# Nodes of the replicaset URI are reloaded from the database after that many seconds
+REPLICASET_URI_TTL = 30
+
+# MongoClients shared by all MongoBase objects of the process, by (host, replicaset, timeout)
+_clients = {}
+_clients_lock = Lock()
+# (load time, URI) of the replicaset
+_replicaset_uri = (None, None)
+
+
+def _reset_clients():
+    """ Clients of the parent process must not be used after a fork, pymongo is not fork-safe """
+    global _clients, _clients_lock
+    _clients = {}
+    _clients_lock = Lock()
+
+
+register_at_fork(after_in_child=_reset_clients)
+
 
 def parse_uristr(uristr):
     """ Parse uristr and returns list of tuples (ip|host, port) """
@@ -63,11 +85,20 @@ class MongoBase:
     @staticmethod
     def get_replicaset_uri():
         from system.cluster.models import Node
+        global _replicaset_uri
+
+        loaded, uri = _replicaset_uri
+        if uri and monotonic() - loaded < REPLICASET_URI_TTL:
+            return uri
 
         try:
             node_list = "{}".format(str.join(',', [node.name + ":9091" for node in Node.objects.all().only('name')]))
             if node_list:
-                return "mongodb://{}".format(node_list)
+                _replicaset_uri = (monotonic(), "mongodb://{}".format(node_list))
+                if uri and uri != _replicaset_uri[1]:
+                    # The list of nodes changed, the client of the previous list is not used anymore
+                    MongoBase.invalidate_clients(host=uri)
+                return _replicaset_uri[1]
         except Exception as e:
             logger.error("Failed to retrieve replicaset_uri from Mongo : ")
             logger.exception(e)
@@ -94,6 +125,9 @@ class MongoBase:
             return []
 
     def execute_request(self, database, collection, query, start=None, length=None, sorting=None, type_sorting=None, first=None):
+        if not first:
+            return self.execute_paged_request(database, collection, query, start=start, length=length,
+                                              sorting=sorting, type_sorting=type_sorting)
         try:
             if not self.db:
                 self.connect()
@@ -101,13 +135,49 @@ class MongoBase:
             db = self.db[database]
             coll = db[collection]
 
-            if first:
-                res = coll.find_one(query)
-                return res
+            res = coll.find_one(query)
+            return res
 
-            nb_res = coll.find(query).count()
-            res = coll.find(query).sort(sorting, type_sorting).limit(length).skip(start)
-            return nb_res, res
+        except Exception as e:
+            if settings.DEV_MODE:
+                raise
+
+            logger.critical(e, exc_info=1)
+            return 0, []
+
+    def execute_paged_request(self, database, collection, query, start=None, length=None, sorting=None,
+                              type_sorting=None):
+        """ Return the number of documents matching query, and one page of them, in a single round-trip
+        Without filter, the count is estimated from the collection metadata instead of scanning it
+        Without length, the documents are read from a cursor : a $facet result is a single document, limited to 16MB
+        :param start: Number of documents to skip
+        :param length: Size of the page, all the documents if None
+        :param sorting: Field to sort on, with the pymongo direction type_sorting (ASCENDING by default)
+        :return     (number of documents, list of documents of the page)
+        """
+        try:
+            if not self.db:
+                self.connect()
+
+            db = self.db[database]
+            coll = db[collection]
+
+            if not query or not length:
+                cursor = coll.find(query or {})
+                if sorting:
+                    cursor = cursor.sort(sorting, type_sorting or ASCENDING)
+                cursor = cursor.skip(start or 0).limit(length or 0)
+                total = coll.count_documents(query) if query else coll.estimated_document_count()
+                return total, list(cursor)
+
+            pipeline = [{'$match': query}]
+            if sorting:
+                pipeline.append({'$sort': {sorting: type_sorting or ASCENDING}})
+            pipeline.append({'$facet': {'total': [{'$count': "count"}],
+                                        'page': [{'$skip': start or 0}, {'$limit': length}]}})
+
+            res = next(coll.aggregate(pipeline, allowDiskUse=True))
+            return (res['total'][0]['count'] if res['total'] else 0), res['page']
 
         except Exception as e:
             if settings.DEV_MODE:
@@ -133,6 +203,47 @@ class MongoBase:
             logger.critical(e, exc_info=1)
             return False
 
+    def insert_many(self, database, collection, documents, ordered=True):
+        """ Insert several documents in one round-trip
+        :param ordered: If False, the remaining documents are inserted even if one of them fails
+        :return     True if all documents are inserted
+        """
+        try:
+            if not self.db:
+                self.connect()
+
+            db = self.db[database]
+            coll = db[collection]
+
+            coll.insert_many(documents, ordered=ordered)
+            return True
+        except Exception as e:
+            if settings.DEV_MODE:
+                raise
+
+            logger.critical(e, exc_info=1)
+            return False
+
+    def bulk_write(self, database, collection, requests, ordered=True):
+        """ Send several write operations (pymongo InsertOne, UpdateOne, DeleteMany...) in one round-trip
+        :param ordered: If False, the remaining operations are executed even if one of them fails
+        :return     The pymongo BulkWriteResult, or None if the operations failed
+        """
+        try:
+            if not self.db:
+                self.connect()
+
+            db = self.db[database]
+            coll = db[collection]
+
+            return coll.bulk_write(requests, ordered=ordered)
+        except Exception as e:
+            if settings.DEV_MODE:
+                raise
+
+            logger.critical(e, exc_info=1)
+            return None
+
     def update_one(self, database, collection, query, newvalue):
         try:
             if not self.db:
@@ -197,26 +308,47 @@ class MongoBase:
         return connection_ok
 
 
+    @staticmethod
+    def invalidate_clients(host=None):
+        """ Forget the shared clients (of host only, if given), and the cached replicaset URI if all are forgotten
+        Clients still used by MongoBase objects are not closed, they are released with these objects
+        """
+        global _replicaset_uri
+        with _clients_lock:
+            for key in [key for key in _clients if host is None or key[0] == host]:
+                del _clients[key]
+        if host is None:
+            _replicaset_uri = (None, None)
+
     def connect(self, node=None, primary=True, timeout_ms=5000):
+        key = None
         try:
             if node:
                 host = 'mongodb://{}'.format(node)
             else:
                 host = self.get_replicaset_uri()
 
-            args = {'host': host,
-                    'ssl': True,
-                    'ssl_certfile': "/var/db/pki/node.pem",
-                    'ssl_ca_certs': "/var/db/pki/ca.pem",
-                    'read_preference': ReadPreference.PRIMARY_PREFERRED,
-                    "serverSelectionTimeoutMS": timeout_ms}
-            if primary:
-                args['replicaset'] = "Vulture"
-            self.db = MongoClient(**args)
+            key = (host, primary, timeout_ms)
+            with _clients_lock:
+                self.db = _clients.get(key)
+                if self.db is None:
+                    args = {'host': host,
+                            'ssl': True,
+                            'ssl_certfile': "/var/db/pki/node.pem",
+                            'ssl_ca_certs': "/var/db/pki/ca.pem",
+                            'read_preference': ReadPreference.PRIMARY_PREFERRED,
+                            "serverSelectionTimeoutMS": timeout_ms}
+                    if primary:
+                        args['replicaset'] = "Vulture"
+                    self.db = _clients[key] = MongoClient(**args)
             # Execute a request to test connection (pymongo doesn't try connecting until a command is executed on client)
             self.db.admin.command('ping')
         except Exception as e:
             logger.error("connect: Error during mongoDB connection: {}".format(str(e)), exc_info=1)
+            # Do not keep a client which never worked (replicaset not initiated yet, wrong node...)
+            if key:
+                with _clients_lock:
+                    _clients.pop(key, None)
             return False
 
         return True
@@ -251,6 +383,7 @@ class MongoBase:
         }
         try:
             self.db.admin.command("replSetInitiate", config)
+            MongoBase.invalidate_clients()
         except Exception as e:
             logger.error("replSetInitiate: Error during mongoDB replSetInitiate: {}".format(str(e)))
             return False
@@ -278,6 +411,7 @@ class MongoBase:
         logger.info(subprocess.check_output(
             ['/usr/sbin/jexec', 'mongodb', '/usr/sbin/service', 'mongod', 'start']
         ).rstrip().decode('utf-8'))
+        MongoBase.invalidate_clients()
 
     def repl_add(self, node):
         """
@@ -299,6 +433,7 @@ class MongoBase:
             logger.error("MongoBase::repl_add: Error during mongoDB replSetReconfig: {}".format(str(e)))
             return False, str(e)
 
+        MongoBase.invalidate_clients()
         return True, res
 
     def repl_remove(self, node):
@@ -326,6 +461,7 @@ class MongoBase:
 
         try:
             res = self.db.admin.command("replSetReconfig", config)
+            MongoBase.invalidate_clients()
             return True, res
         except Exception as e:
             logger.error("replRemove: Error during mongoDB replSetReconfig: {}".format(str(e)))
@@ -365,6 +501,7 @@ class MongoBase:
         except Exception as e:
             logger.error("replRename: Error during mongoDB replSetReconfig: {}".format(str(e)))
             return False, str(e)
+        MongoBase.invalidate_clients()
 
         """ Then, we need to restart ourselves """
         logger.info("replRename: Restarting Mongodb")
@@ -0,0 +1,203 @@
+#!/home/vlt-os/env/bin/python
+"""This file is part of Vulture OS.
+
+Vulture OS is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Vulture OS is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Vulture OS.  If not, see http://www.gnu.org/licenses/.
+"""
+__author__ = "Vulture OS"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "4.0.0"
+__maintainer__ = "Vulture OS"
+__email__ = "contact@vultureproject.org"
+__doc__ = 'Toolkit to compile IP/CIDR and domain lists into sorted lookup indexes'
+
+# Django system imports
+
+# Django project imports
+
+# Required exceptions imports
+
+# Extern modules imports
+from bisect import bisect_left, bisect_right
+from ipaddress import collapse_addresses, ip_address, ip_network
+import struct
+
+
+INDEX_MAGIC = b"VLTIDX1\n"
+# Index kind, reserved byte, number of entries, number of unique values
+INDEX_HEADER = struct.Struct(">BBQQ")
+KIND_DOMAIN = 0
+KIND_IPV4 = 4
+KIND_IPV6 = 6
+
+# Mongo integers are signed 64 bits, IPv6 unique counts may exceed it
+MAX_COUNT = 2**63 - 1
+
+
+def iter_entries(lines):
+    """ Yield the stripped entries of a raw list, ignoring empty lines and comments
+    :param lines: Iterable of str or bytes lines (an opened file for example)
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf8', errors="ignore")
+        line = line.split("#", 1)[0].split(";", 1)[0].strip()
+        if line:
+            yield line
+
+
+class NetsetIndex:
+    """ Sorted and merged intervals of IP addresses, looked up with a binary search """
+
+    def __init__(self, version, starts, ends, nb_entries):
+        self.version = version
+        self.starts = starts
+        self.ends = ends
+        self.nb_entries = nb_entries
+
+    @classmethod
+    def compile(cls, lines, version):
+        """ Normalise, deduplicate and merge the IPs/CIDRs of a netset
+        :param lines: Iterable of lines of the raw netset
+        :param version: IP version (4 or 6) of the addresses to keep
+        :return     A NetsetIndex
+        """
+        networks = []
+        for entry in iter_entries(lines):
+            try:
+                network = ip_network(entry.split()[0], strict=False)
+            except ValueError:
+                continue
+            if network.version == version:
+                networks.append(network)
+
+        # collapse_addresses sorts, deduplicates and merges overlapping networks into CIDRs
+        merged = list(collapse_addresses(networks))
+        starts, ends = [], []
+        for network in merged:
+            start, end = int(network.network_address), int(network.broadcast_address)
+            # Adjacent networks that cannot be expressed as one CIDR are merged in the same interval
+            if ends and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        return cls(version, starts, ends, len(merged))
+
+    @property
+    def nb_unique(self):
+        """ Number of unique addresses contained in the netset """
+        return min(sum(end - start + 1 for start, end in zip(self.starts, self.ends)), MAX_COUNT)
+
+    def lookup(self, value):
+        """ Check if an IP address is contained in the netset
+        :return     True if the address is contained, False otherwise (or if it is not a valid address)
+        """
+        try:
+            address = ip_address(value)
+        except ValueError:
+            return False
+        if address.version != self.version:
+            return False
+        address = int(address)
+        position = bisect_right(self.starts, address) - 1
+        return position >= 0 and address <= self.ends[position]
+
+    def dump(self, file_path):
+        """ Write the index on disk, as fixed-width big endian interval bounds """
+        width = 4 if self.version == 4 else 16
+        with open(file_path, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(INDEX_HEADER.pack(self.version, 0, self.nb_entries, len(self.starts)))
+            for start, end in zip(self.starts, self.ends):
+                f.write(start.to_bytes(width, "big"))
+                f.write(end.to_bytes(width, "big"))
+
+    @classmethod
+    def from_bytes(cls, version, nb_entries, nb_intervals, data):
+        width = 4 if version == 4 else 16
+        bounds = [int.from_bytes(data[i:i + width], "big") for i in range(0, 2 * nb_intervals * width, width)]
+        return cls(version, bounds[0::2], bounds[1::2], nb_entries)
+
+
+class DomainIndex:
+    """ Sorted list of unique domain names, looked up with a binary search on the name and its parents """
+
+    def __init__(self, domains):
+        self.domains = domains
+
+    @classmethod
+    def compile(cls, lines):
+        """ Normalise and deduplicate the domains of a list
+            Hosts-file formatted lines ("0.0.0.0 example.com") are supported
+        :param lines: Iterable of lines of the raw list
+        :return     A DomainIndex
+        """
+        return cls(sorted({entry.split()[-1].lower().rstrip(".") for entry in iter_entries(lines)} - {""}))
+
+    @property
+    def nb_entries(self):
+        return len(self.domains)
+
+    @property
+    def nb_unique(self):
+        return len(self.domains)
+
+    def _contains(self, domain):
+        position = bisect_left(self.domains, domain)
+        return position < len(self.domains) and self.domains[position] == domain
+
+    def lookup(self, value):
+        """ Check if a domain, or one of its parent domains, is contained in the list
+        :return     True if the domain is contained, False otherwise
+        """
+        labels = value.lower().rstrip(".").split(".")
+        return any(self._contains(".".join(labels[i:])) for i in range(len(labels)))
+
+    def dump(self, file_path):
+        """ Write the index on disk, as sorted newline-separated names """
+        with open(file_path, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(INDEX_HEADER.pack(KIND_DOMAIN, 0, len(self.domains), len(self.domains)))
+            f.write("\n".join(self.domains).encode('utf8'))
+
+
+def compile_index(db_type, lines):
+    """ Compile a raw reputation list into its lookup index
+    :param db_type: Type of the reputation database (ipv4_netset, ipv6_netset or domain)
+    :param lines: Iterable of lines of the raw list
+    :return     A NetsetIndex or a DomainIndex
+    """
+    if db_type == "ipv4_netset":
+        return NetsetIndex.compile(lines, 4)
+    if db_type == "ipv6_netset":
+        return NetsetIndex.compile(lines, 6)
+    if db_type == "domain":
+        return DomainIndex.compile(lines)
+    raise ValueError("Cannot compile an index for database type '{}'".format(db_type))
+
+
+def load_index(file_path):
+    """ Load an index written on disk by dump()
+    :return     A NetsetIndex or a DomainIndex
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if not data.startswith(INDEX_MAGIC):
+        raise ValueError("'{}' is not a valid reputation index".format(file_path))
+    kind, _, nb_entries, nb_values = INDEX_HEADER.unpack_from(data, len(INDEX_MAGIC))
+    data = data[len(INDEX_MAGIC) + INDEX_HEADER.size:]
+    if kind == KIND_DOMAIN:
+        return DomainIndex(data.decode('utf8').split("\n") if data else [])
+    return NetsetIndex.from_bytes(kind, nb_entries, nb_values, data)
@@ -55,7 +55,7 @@ if __name__ == "__main__":
         for cert in certificates:
             print("reloading certificate files for '{}'".format(cert))
             try:
-                cert.save()
+                cert.save_conf()
             except Exception as e:
                 print("error while reloading a certificate: {}".format(e))
 
@@ -33,7 +33,7 @@ from django.template import Template
 
 # Django project imports
 from applications.backend.models import Backend
-from darwin.access_control.models import AccessControl
+from darwin.access_control.models import AccessControl, ACL_FILES_PATH
 from authentication.auth_access_control.models import AuthAccessControl
 from authentication.user_portal.models import UserAuthentication
 from services.frontend.models import Frontend
@@ -249,8 +249,8 @@ class Workflow(models.Model):
         access_controls_deny = []
         access_controls_301 = []
         access_controls_302 = []
-        for acl in self.workflowacl_set.filter(before_policy=True):
-            rules, acls_name = acl.access_control.generate_rules()
+        for acl in self.workflowacl_set.filter(before_policy=True).order_by('pk'):
+            rules, acls_name = acl.access_control.generate_rules(ACL_FILES_PATH)
             access_controls_list.append(rules)
 
             conditions = acl.generate_condition(acls_name)
@@ -283,7 +283,7 @@ class Workflow(models.Model):
 
         client_ids = []
         if self.authentication:
-            client_ids = [repo.get_daughter().client_id for repo in self.authentication.repositories.filter(subtype="openid")]
+            client_ids = [repo.get_daughter().client_id for repo in self.authentication.repositories.filter(subtype="openid").order_by('pk')]
             client_ids.append(self.authentication.oauth_client_id)
 
         return {
@@ -302,7 +302,7 @@ class Workflow(models.Model):
             'cors_max_age': self.cors_max_age,
             'authentication': self.authentication.to_template() if self.authentication else None,
             'check_jwt': self.authentication.repositories.filter(openidrepository__enable_jwt=True).exists() if self.authentication else False,
-            'access_controls_list': set(access_controls_list),
+            'access_controls_list': list(dict.fromkeys(access_controls_list)),
             'access_controls_deny': access_controls_deny,
             'access_controls_302': access_controls_302,
             'access_controls_301': access_controls_301,
@@ -327,7 +327,7 @@ class Workflow(models.Model):
             jinja2_env = Environment(loader=FileSystemLoader(JINJA_PATH))
             template = jinja2_env.get_template(JINJA_TEMPLATE)
             return template.render({'conf': self.to_template(),
-                                    'nodes': Node.objects.exclude(name=get_hostname()),
+                                    'nodes': Node.objects.exclude(name=get_hostname()).order_by('pk'),
                                     'global_config': Cluster.get_global_config().to_dict(fields=['public_token', 'portal_cookie_name'])})
         # In ALL exceptions, associate an error message
         # The exception instantiation MUST be IN except statement, to retrieve traceback in __init__
@@ -345,6 +345,15 @@ class Workflow(models.Model):
         # If there was an exception, raise a more general exception with the message and the traceback
         raise exception
 
+    def get_pattern_files(self):
+        """ Return the pattern files of the access controls of the workflow
+        :return     Dict {filename: list of patterns}
+        """
+        pattern_files = {}
+        for acl in self.workflowacl_set.filter(before_policy=True).order_by('pk'):
+            pattern_files.update(acl.access_control.get_pattern_files(ACL_FILES_PATH))
+        return pattern_files
+
     def get_base_filename(self):
         """ Return the workflow filename, without directory """
         return "workflow_{}.cfg".format(self.id)
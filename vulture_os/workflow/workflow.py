@@ -28,9 +28,15 @@ from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 
 # Local imports
-from system.config.models import write_conf
+from services.exceptions import ServiceError
+from services.haproxy.haproxy import (HaproxyService, format_pattern_file, normalize_conf, read_pattern_file,
+                                      update_acl_file)
+from services.render import render_all
+from system.config.models import delete_conf, write_conf
 from system.exceptions import VultureSystemError
 
+from ast import literal_eval
+from glob import glob
 import logging
 import logging.config
 
@@ -66,6 +72,9 @@ def build_conf(node_logger, workflow_id):
 
     try:
         workflow = Workflow.objects.get(pk=workflow_id)
+        """ Pattern files referenced by the conf have to exist before it is loaded """
+        for filename, patterns in workflow.get_pattern_files().items():
+            write_conf(node_logger, [filename, format_pattern_file(patterns), WORKFLOW_OWNER, WORKFLOW_PERMS])
         """ Generate and save workflow conf on current node only """
         write_conf(node_logger, [workflow.get_filename(), workflow.generate_conf(),
                                  WORKFLOW_OWNER, WORKFLOW_PERMS])
@@ -75,3 +84,73 @@ def build_conf(node_logger, workflow_id):
                                  "build HAProxy conf", traceback=" ")
 
     return result
+
+
+def _delete_unused_pattern_files(node_logger, referenced_files):
+    """ Delete the access control pattern files which are not in referenced_files """
+    from darwin.access_control.models import ACL_FILES_PATH  # avoid circular imports
+
+    unused_files = sorted(set(glob("{}/acl_*.lst".format(ACL_FILES_PATH))) - set(referenced_files))
+    if not unused_files:
+        return
+    try:
+        node_logger.info(delete_conf(node_logger, str(unused_files)))
+    except Exception as e:
+        node_logger.error("Failed to delete unused ACL pattern files {} : {}".format(unused_files, e))
+
+
+def update_acl_conf(node_logger, workflow_ids):
+    """ Write the conf and pattern files of workflows after a change of their access controls
+     If the confs did not change, only the patterns did : they are updated through the runtime API,
+     otherwise (or if the runtime API fails) HAProxy is reloaded once for all workflows
+    :param node_logger: Logger sent to all API requests
+    :param workflow_ids: The ids of the workflows
+    :return:
+    """
+    from workflow.models import Workflow, WORKFLOW_OWNER, WORKFLOW_PERMS  # avoid circular imports
+
+    # The list is casted to string by asynchronous api
+    if isinstance(workflow_ids, str):
+        workflow_ids = literal_eval(workflow_ids)
+
+    reload = False
+    runtime_updates = {}
+    referenced_files = set()
+    workflows = list(Workflow.objects.filter(pk__in=workflow_ids).order_by('pk'))
+    confs = render_all([(workflow, "generate_conf", {}) for workflow in workflows], "haproxy")
+    for workflow, conf in zip(workflows, confs):
+        for filename, patterns in workflow.get_pattern_files().items():
+            referenced_files.add(filename)
+            previous_patterns = read_pattern_file(filename)
+            if previous_patterns is None:
+                # A new pattern file is only read by HAProxy at startup
+                reload = True
+            elif previous_patterns != patterns:
+                runtime_updates[filename] = (previous_patterns, patterns)
+            write_conf(node_logger, [filename, format_pattern_file(patterns), WORKFLOW_OWNER, WORKFLOW_PERMS])
+
+        try:
+            with open(workflow.get_filename(), encoding="utf8") as f:
+                previous_conf = f.read()
+        except OSError:
+            previous_conf = None
+        if previous_conf is None or normalize_conf(previous_conf) != normalize_conf(conf):
+            reload = True
+        write_conf(node_logger, [workflow.get_filename(), conf, WORKFLOW_OWNER, WORKFLOW_PERMS])
+
+    # Pattern files of removed matchers, access controls or workflows are not used by any conf anymore
+    for workflow in Workflow.objects.exclude(pk__in=workflow_ids):
+        referenced_files.update(workflow.get_pattern_files())
+    _delete_unused_pattern_files(node_logger, referenced_files)
+
+    if not reload:
+        try:
+            nb_updates = 0
+            for filename, (previous_patterns, patterns) in runtime_updates.items():
+                nb_updates += update_acl_file(filename, previous_patterns, patterns)
+            node_logger.info("{} patterns updated through HAProxy runtime API.".format(nb_updates))
+            return "Workflows ACLs updated without reload."
+        except ServiceError as e:
+            node_logger.error("Failed to update ACLs through HAProxy runtime API, reloading : {}".format(e.traceback))
+
+    return "Workflows conf updated. Reloading HAProxy.\n" + HaproxyService().reload()